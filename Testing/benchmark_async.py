@@ -0,0 +1,231 @@
+'''
+Async read path benchmark - many kiosk clients at once polling item details, catalog
+search and the item list, against the Flask app (WSGI, werkzeug's threaded server: a
+thread per connection) and asgi.py (aiosqlite under uvicorn), one server process each
+on the same generated database.
+
+    python Testing/benchmark_async.py
+    python Testing/benchmark_async.py --items 50000 --clients 1 16 64 256 --seconds 10
+
+Every client keeps one HTTP/1.1 connection open and loops over GET /api/item/<id>
+(70%), /api/search/items (20%) and a page of /api/items (10%). Reported per server and
+client count: requests/s, p50/p95 latency and errors. Before timing, a sample of URLs
+(items on hold, misses, bad parameters) is fetched from both servers and must come back
+the same - status and body. Exits with status 1 if a response differs or any request
+fails. Needs aiosqlite and uvicorn.
+'''
+import os
+import sys
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+from sqlalchemy import text
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(TESTING_DIR)
+
+SEARCH_WORDS = ['the', 'river', 'garden', 'light', 'night', 'city', 'code', 'fire', 'harbor', 'history']
+
+
+def serve(kind: str, port: int):
+    '''Child process: run one server until killed'''
+    sys.path.insert(0, REPO_ROOT)
+    if kind == 'wsgi':
+        import logging
+        from werkzeug.serving import run_simple
+        import app as bookmarked
+        logging.getLogger('werkzeug').setLevel(logging.ERROR) # no access log
+        run_simple('127.0.0.1', port, bookmarked.app, threaded=True)
+    else:
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.app, host='127.0.0.1', port=port, log_level='warning', access_log=False)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind: str) -> tuple:
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', kind, '--port', str(port)])
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return proc, port
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"{kind} server did not start")
+
+
+async def fetch(reader, writer, path: str) -> tuple:
+    '''One request on a kept-alive connection, returns (status, body, server closes)'''
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    length, close = 0, False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+        elif name.strip().lower() == 'connection' and value.strip().lower() == 'close':
+            close = True
+    return status, await reader.readexactly(length), close
+
+
+async def get_once(port: int, path: str) -> tuple:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        status, body, _ = await fetch(reader, writer, path)
+    finally:
+        writer.close()
+    return status, body
+
+
+def kiosk_path(rng, items: int) -> str:
+    roll = rng.random()
+    if roll < 0.7:
+        return f"/api/item/{rng.randint(1, items)}"
+    if roll < 0.9:
+        return f"/api/search/items?q={rng.choice(SEARCH_WORDS)}&limit=20"
+    return "/api/items?status=available&limit=20"
+
+
+async def load(port: int, clients: int, seconds: float, items: int, seed: int) -> dict:
+    '''clients concurrent connections for seconds, returns throughput and latency'''
+    latencies, errors = [], [0]
+    deadline = time.perf_counter() + seconds
+
+    async def client(n: int):
+        rng = random.Random(seed * 1000 + n)
+        conn = None
+        while time.perf_counter() < deadline:
+            path = kiosk_path(rng, items)
+            try:
+                if conn is None:
+                    conn = await asyncio.open_connection('127.0.0.1', port)
+                started = time.perf_counter()
+                status, _, close = await fetch(*conn, path)
+                latencies.append(time.perf_counter() - started)
+                if status not in (200, 404): # 404 is an id past the end of the catalog
+                    errors[0] += 1
+            except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                errors[0] += 1
+                close = True
+            if close and conn is not None:
+                conn[1].close()
+                conn = None
+        if conn is not None:
+            conn[1].close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0,
+        "errors": errors[0],
+    }
+
+
+def sample_paths(bookmarked, items: int) -> list:
+    '''URLs both servers must answer identically'''
+    session = bookmarked.database.session
+    held = session.execute(text("SELECT ReservedItem FROM Reservation WHERE Active = 1 LIMIT 5")).scalars().all()
+    paths = [f"/api/item/{item_id}" for item_id in held + [1, items // 2, items, items + 1]]
+    paths += [f"/api/search/items?q={word}&limit=10" for word in SEARCH_WORDS[:4]]
+    paths += ["/api/search/items?q=12", "/api/search/items?q=", "/api/search/items?q=x&field=nope",
+              "/api/search/items?q=the&field=author&type_id=1&type_id=2",
+              "/api/items?limit=5", "/api/items?q=river&limit=5", "/api/items?status=bogus", "/api/items?cursor=x",
+              "/api/items?type_id=2", "/api/items"]
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--serve', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='bookmarked-async-')
+    os.environ['BOOKMARKED_DB_PATH'] = os.path.join(workdir, 'async.db')
+    sys.path.insert(0, REPO_ROOT)
+    sys.path.insert(0, TESTING_DIR)
+    import app as bookmarked
+    from generate_data import generate
+
+    with bookmarked.app.app_context():
+        generate(bookmarked, items=args.items, patrons=args.items // 5, seed=args.seed)
+        paths = sample_paths(bookmarked, args.items)
+        bookmarked.database.session.remove()
+        bookmarked.database.engine.dispose()
+    print(f"db: {os.environ['BOOKMARKED_DB_PATH']}  items: {args.items}  {args.seconds:g}s per run")
+
+    servers = {}
+    failed = False
+    try:
+        for kind in ('wsgi', 'asgi'): # one at a time, generate() already ran init_db
+            servers[kind] = start_server(kind)
+
+        for path in paths:
+            answers = {kind: asyncio.run(get_once(port, path)) for kind, (_, port) in servers.items()}
+            if answers['wsgi'] != answers['asgi']:
+                failed = True
+                print(f"FAIL {path}: wsgi {answers['wsgi'][0]} {answers['wsgi'][1][:120]!r}")
+                print(f"     {' ' * len(path)}  asgi {answers['asgi'][0]} {answers['asgi'][1][:120]!r}")
+        print(f"{len(paths)} sample responses compared")
+
+        for kind, (_, port) in servers.items(): # warm caches and pools
+            asyncio.run(load(port, 4, 1, args.items, args.seed))
+
+        print(f"\n{'clients':>7} {'server':<6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+        for clients in args.clients:
+            rates = {}
+            for kind, (_, port) in servers.items():
+                r = asyncio.run(load(port, clients, args.seconds, args.items, args.seed))
+                rates[kind] = r['rps']
+                failed |= r['errors'] > 0
+                print(f"{clients:>7} {kind:<6} {r['rps']:>9.0f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['errors']:>7}")
+            print(f"{'':>7} asgi/wsgi throughput {rates['asgi'] / max(rates['wsgi'], 1e-9):.2f}x")
+    finally:
+        for proc, _ in servers.values():
+            proc.terminate()
+            proc.wait()
+
+    print()
+    if failed:
+        sys.exit(1)
+    print("Both servers answered the same, with no failed requests")
+
+
+if __name__ == '__main__':
+    main()
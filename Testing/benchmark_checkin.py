@@ -0,0 +1,110 @@
+'''
+Check-in benchmark - throughput of a returns bin processed with sequential POST /checkin
+calls versus POST /api/checkin/bulk.
+
+    python Testing/benchmark_checkin.py
+    python Testing/benchmark_checkin.py --items 2000 --batch 500
+    BOOKMARKED_SQLITE_PROFILE=legacy python Testing/benchmark_checkin.py   # fsync per commit
+
+Runs against a scratch database (BOOKMARKED_DB_PATH). Every item is put on loan, a
+third of them overdue so fines are applied. The first half is checked in one request
+at a time, the second half in batches. Afterwards the database must show every loan
+returned and the patrons' PatronStanding loan counts back in line, and both halves must have
+charged the same fines. Exits with status 1 if not, or if the bulk path is less than
+--min-speedup times faster.
+'''
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from sqlalchemy import text
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(TESTING_DIR)
+
+
+def put_on_loan(bookmarked, num_patrons: int, half: int):
+    '''One open loan per item, due 20 days ago to 10 days ahead - item i and i + half share a due date'''
+    session = bookmarked.database.session
+    session.execute(text("""
+        INSERT INTO Checkout (PatronID, ItemID, CheckoutDate, DueDate)
+        SELECT 1 + ItemID % :patrons, ItemID, date('now', '-30 days'), date('now', ((ItemID - 1) % :half % 30 - 20) || ' days')
+        FROM LibraryItem
+    """), {"patrons": num_patrons, "half": half})
+    bookmarked.rebuild_active_loans()
+    session.execute(text("UPDATE LibraryItem SET Status = 'checked out'"))
+    session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=1000, help='items in the returns bin (half per method)')
+    parser.add_argument('--batch', type=int, default=250, help='items per bulk request')
+    parser.add_argument('--history', type=int, default=3, help='closed loans per item')
+    parser.add_argument('--min-speedup', type=float, default=10)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bookmarked-checkin-')
+    os.environ['BOOKMARKED_DB_PATH'] = os.path.join(workdir, 'checkin.db')
+    sys.path.insert(0, REPO_ROOT)
+    sys.path.insert(0, TESTING_DIR)
+    import app as bookmarked
+    from benchmark_checkout import seed
+
+    num_patrons = max(1, args.items // 10)
+    with bookmarked.app.app_context():
+        seed(bookmarked, args.items, num_patrons, args.history)
+        put_on_loan(bookmarked, num_patrons, args.items // 2)
+
+    client = bookmarked.app.test_client()
+    half = args.items // 2
+    sequential_ids = list(range(1, half + 1))
+    bulk_ids = list(range(half + 1, 2 * half + 1))
+
+    start = time.perf_counter()
+    sequential_fines = 0.0
+    for item_id in sequential_ids:
+        data = client.post('/checkin', json={"item_id": str(item_id), "branch_id": "1"}).get_json()
+        if not data.get('ok'):
+            sys.exit(f"checkin of {item_id} failed: {data}")
+        sequential_fines += data.get('fine_applied', 0)
+    sequential = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bulk_fines = 0.0
+    for i in range(0, len(bulk_ids), args.batch):
+        data = client.post('/api/checkin/bulk', json={"branch_id": 1, "item_ids": bulk_ids[i:i + args.batch]}).get_json()
+        if not data.get('ok') or data['failed']:
+            sys.exit(f"bulk checkin failed: {data.get('error') or [r for r in data['results'] if not r['ok']][:5]}")
+        bulk_fines += data['fines_applied']
+    bulk = time.perf_counter() - start
+
+    print(f"db: {os.environ['BOOKMARKED_DB_PATH']}  profile: {bookmarked.app.config['SQLITE_PROFILE']}  "
+          f"items: {2 * half}  batch: {args.batch}")
+    print(f"{'method':<22} {'items':>6} {'seconds':>8} {'items/s':>9} {'fines':>9}")
+    print(f"{'POST /checkin':<22} {half:>6} {sequential:>8.2f} {half / sequential:>9.0f} {sequential_fines:>9.2f}")
+    print(f"{'POST /api/checkin/bulk':<22} {half:>6} {bulk:>8.2f} {half / bulk:>9.0f} {bulk_fines:>9.2f}")
+    speedup = sequential / bulk
+    print(f"speedup: {speedup:.1f}x")
+
+    problems = []
+    with bookmarked.app.app_context():
+        session = bookmarked.database.session
+        open_loans = session.execute(text("SELECT count(*) FROM LibraryItem WHERE ActiveTransactionID IS NOT NULL")).scalar()
+        counters = session.execute(text("SELECT coalesce(sum(OpenLoans), 0) FROM PatronStanding")).scalar()
+        if open_loans != args.items - 2 * half:
+            problems.append(f"{open_loans} loans still open")
+        if counters != open_loans:
+            problems.append(f"patrons' OpenLoans add up to {counters}, open loans are {open_loans}")
+    if abs(sequential_fines - bulk_fines) > 0.01:
+        problems.append(f"fines differ: {sequential_fines:.2f} vs {bulk_fines:.2f}")
+    if speedup < args.min_speedup:
+        problems.append(f"bulk is only {speedup:.1f}x faster (want {args.min_speedup:g}x)")
+    if problems:
+        sys.exit('FAIL ' + '; '.join(problems))
+
+
+if __name__ == '__main__':
+    main()
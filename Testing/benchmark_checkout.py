@@ -0,0 +1,115 @@
+'''
+Checkout benchmark - SQL query count and latency of POST /checkout by basket size.
+
+    python Testing/benchmark_checkout.py
+    python Testing/benchmark_checkout.py --sizes 1 5 10 20 --repeats 30 --history 5
+
+Runs against a scratch database in a temp folder (BOOKMARKED_DB_PATH), never the
+instance database. Every checkout uses a fresh patron and fresh items so each run
+takes the same path.
+'''
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+from datetime import date, timedelta
+
+from sqlalchemy import event, insert
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(bookmarked, num_items: int, num_patrons: int, history: int):
+    '''Bulk loads items, patrons and closed loan history so the open-loan check has rows to skip'''
+    bookmarked.init_db()
+    database = bookmarked.database
+    today = date.today()
+
+    database.session.execute(insert(bookmarked.ItemType), [
+        {"TypeID": 1, "TypeName": "book", "RentalLength": 21, "PerDayFine": 1},
+        {"TypeID": 2, "TypeName": "movie", "RentalLength": 7, "PerDayFine": 1},
+    ])
+    database.session.execute(insert(bookmarked.LibraryBranch), [{"BranchID": 1, "BranchName": "Main Branch"}])
+    database.session.execute(insert(bookmarked.LibraryItem), [
+        {"ItemID": i, "ItemType": 1 + i % 2, "Cost": 10, "ItemTitle": f"Bench Item {i}",
+         "Status": "available", "ShelfCode": f"A{i % 100:02}", "Author": "Bench Author"}
+        for i in range(1, num_items + 1)
+    ])
+    database.session.execute(insert(bookmarked.Patron), [
+        {"PatronID": p, "PatronFN": "Bench", "PatronLN": f"Patron{p}",
+         "AccountExpDate": today + timedelta(days=365), "FeesOwed": 0, "ItemsCheckedOut": 0}
+        for p in range(1, num_patrons + 1)
+    ])
+
+    txn = 0
+    checkouts, returns = [], []
+    for i in range(1, num_items + 1):
+        for h in range(history):
+            txn += 1
+            out = today - timedelta(days=30 * (h + 1))
+            checkouts.append({"TransactionID": txn, "PatronID": 1 + txn % num_patrons, "ItemID": i,
+                              "CheckoutDate": out, "DueDate": out + timedelta(days=21)})
+            returns.append({"TransactionID": txn, "DateReturned": out + timedelta(days=10), "BranchReturnedTo": 1})
+    if checkouts:
+        database.session.execute(insert(bookmarked.Checkout), checkouts)
+        database.session.execute(insert(bookmarked.Return), returns)
+    database.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 5, 10, 20])
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--history', type=int, default=5, help='closed loans per item')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bookmarked-bench-')
+    os.environ['BOOKMARKED_DB_PATH'] = os.path.join(workdir, 'bench.db')
+    sys.path.insert(0, REPO_ROOT)
+    import app as bookmarked
+
+    num_items = sum(args.sizes) * args.repeats
+    num_patrons = len(args.sizes) * args.repeats
+
+    with bookmarked.app.app_context():
+        seed(bookmarked, num_items, num_patrons, args.history)
+        engine = bookmarked.database.engine
+
+    query_count = [0]
+
+    def count_query(*_):
+        query_count[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', count_query)
+    client = bookmarked.app.test_client()
+
+    print(f"db: {os.environ['BOOKMARKED_DB_PATH']}  items: {num_items}  history rows: {num_items * args.history}")
+    print(f"{'basket':>6} {'queries':>8} {'p50 ms':>8} {'p95 ms':>8}")
+
+    next_item = 1
+    next_patron = 1
+    for size in args.sizes:
+        timings, queries = [], []
+        for _ in range(args.repeats):
+            basket = list(range(next_item, next_item + size))
+            next_item += size
+
+            query_count[0] = 0
+            start = time.perf_counter()
+            resp = client.post('/checkout', json={"patron_id": next_patron, "item_ids": basket})
+            timings.append((time.perf_counter() - start) * 1000)
+            queries.append(query_count[0])
+            next_patron += 1
+
+            if not resp.get_json().get('ok'):
+                sys.exit(f"checkout failed: {resp.get_json()}")
+
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"{size:>6} {statistics.median(queries):>8.0f} {statistics.median(timings):>8.2f} {p95:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+'''
+Export benchmark - streams /api/export/<table> at several table sizes and checks that
+memory stays flat: peak Python allocations during the export should not grow with
+the row count.
+
+    python Testing/benchmark_export.py
+    python Testing/benchmark_export.py --rows 1000 100000 2000000 --tables loans items
+
+Each size runs in its own process on a scratch database seeded by benchmark_fines.seed
+(one item, one patron and one loan per row, half of the loans returned). The body is
+read chunk by chunk like a client download; every export is checked for its row count,
+and the gzip variant is decompressed as it streams. Exits with status 1 if a count is
+off or the peak at the largest size is more than --max-growth times the peak at the
+smallest. Timings include tracemalloc overhead (exports run ~3x faster without it).
+'''
+import os
+import sys
+import json
+import time
+import zlib
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+from sqlalchemy import text
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(TESTING_DIR)
+
+EXPECTED_ROWS = {
+    'loans': "SELECT count(*) FROM Checkout",
+    'items': "SELECT count(*) FROM LibraryItem",
+    'patrons': "SELECT count(*) FROM Patron",
+}
+
+
+def stream(client, url: str, compressed: bool) -> tuple:
+    '''Downloads one export chunk by chunk, returns (bytes on the wire, lines)'''
+    resp = client.get(url, buffered=False)
+    assert resp.status_code == 200, resp.status_code
+    decompressor = zlib.decompressobj(31) if compressed else None
+    size, lines = 0, 0
+    for chunk in resp.response:
+        size += len(chunk)
+        lines += (decompressor.decompress(chunk) if compressed else chunk).count(b'\n')
+    resp.close()
+    return size, lines
+
+
+def run_size(rows: int, tables: list) -> list:
+    '''Child process: seed a database with this many rows and export every table from it'''
+    os.environ['BOOKMARKED_DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix=f'bookmarked-export-{rows}-'), 'export.db')
+    sys.path.insert(0, REPO_ROOT)
+    sys.path.insert(0, TESTING_DIR)
+    import app as bookmarked
+    from benchmark_fines import seed
+
+    with bookmarked.app.app_context():
+        seed(bookmarked, rows, rows)
+        session = bookmarked.database.session
+        session.execute(text("""
+            INSERT INTO "Return" (TransactionID, DateReturned, BranchReturnedTo)
+            SELECT TransactionID, date(CheckoutDate, '+3 days'), NULL FROM Checkout WHERE TransactionID % 2 = 0
+        """))
+        session.commit()
+        expected = {table: session.execute(text(EXPECTED_ROWS[table])).scalar() for table in tables}
+
+    client = bookmarked.app.test_client()
+    results = []
+    for table in tables:
+        for fmt, compressed in (('csv', False), ('ndjson', False), ('csv', True)):
+            url = f"/api/export/{table}?format={fmt}" + ('&gzip=1' if compressed else '')
+            tracemalloc.start()
+            started = time.perf_counter()
+            size, lines = stream(client, url, compressed)
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append({
+                "rows": rows, "table": table, "format": fmt + ('.gz' if compressed else ''),
+                "lines": lines, "expected": expected[table] + (1 if fmt == 'csv' else 0), # csv header
+                "seconds": round(elapsed, 3), "mb": round(size / 2 ** 20, 2), "peak_kib": peak // 1024,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--tables', nargs='+', default=['loans', 'items', 'patrons'], choices=sorted(EXPECTED_ROWS))
+    parser.add_argument('--max-growth', type=float, default=2.0,
+                        help='allowed peak memory ratio between the largest and smallest size')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_size(args.child, args.tables)))
+        return
+
+    results = []
+    for rows in args.rows:
+        out = subprocess.run([sys.executable, __file__, '--child', str(rows), '--tables', *args.tables],
+                             check=True, capture_output=True, text=True).stdout
+        results += json.loads(out.strip().splitlines()[-1])
+
+    print(f"{'rows':>9} {'table':<8} {'format':<8} {'lines':>9} {'seconds':>8} {'rows/s':>9} {'MB':>8} {'peak KiB':>9}")
+    failed = False
+    for r in results:
+        ok = r['lines'] == r['expected']
+        failed |= not ok
+        print(f"{r['rows']:>9} {r['table']:<8} {r['format']:<8} {r['lines']:>9} {r['seconds']:>8.2f} "
+              f"{r['lines'] / max(r['seconds'], 1e-9):>9.0f} {r['mb']:>8.2f} {r['peak_kib']:>9}"
+              + ('' if ok else f"  FAIL expected {r['expected']} lines"))
+
+    smallest, largest = min(args.rows), max(args.rows)
+    for table in args.tables:
+        for fmt in ('csv', 'ndjson', 'csv.gz'):
+            peaks = {r['rows']: r['peak_kib'] for r in results if r['table'] == table and r['format'] == fmt}
+            growth = peaks[largest] / max(peaks[smallest], 1)
+            if growth > args.max_growth:
+                failed = True
+                print(f"FAIL {table} {fmt}: peak {peaks[smallest]} KiB at {smallest} rows -> "
+                      f"{peaks[largest]} KiB at {largest} rows")
+
+    print()
+    if failed:
+        sys.exit(1)
+    print(f"Every export streamed with flat memory ({smallest} -> {largest} rows)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+'''
+Fine accrual benchmark - times accrue_fines() (flask accrue-fines) over a large number
+of open loans and checks its totals against calculate_fine() on a sample.
+
+    python Testing/benchmark_fines.py
+    python Testing/benchmark_fines.py --loans 2000000 --patrons 200000
+
+Runs against a scratch database (BOOKMARKED_DB_PATH). Every item is out on loan,
+with due dates spread over the last 120 days and the next 30, so roughly 80% of
+loans are overdue and some hit the item-cost cap.
+'''
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import date
+
+from sqlalchemy import text
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(bookmarked, loans: int, patrons: int):
+    '''Bulk loads items, patrons and one open loan per item with set-based INSERTs'''
+    bookmarked.init_db()
+    session = bookmarked.database.session
+    session.execute(text("DROP TRIGGER IF EXISTS LibraryItemSearch_insert")) # catalog search is not measured here
+    session.execute(text("INSERT INTO ItemType (TypeID, TypeName, RentalLength, PerDayFine) "
+                         "VALUES (1, 'book', 21, 1), (2, 'movie', 7, 1), (3, 'BluRay', 7, 1.5)"))
+    session.execute(text("""
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :patrons)
+        INSERT INTO Patron (PatronID, PatronFN, PatronLN, AccountExpDate, FeesOwed, ItemsCheckedOut)
+        SELECT i, 'Bench', 'Patron' || i, date('now', '+1 year'), 0, 0 FROM n
+    """), {"patrons": patrons})
+    session.execute(text("""
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :loans)
+        INSERT INTO LibraryItem (ItemID, ItemType, Cost, ItemTitle, Status, ShelfCode)
+        SELECT i, 1 + i % 3, 5 + i % 50, 'Bench Item ' || i, 'checked out', 'A01' FROM n
+    """), {"loans": loans})
+    session.execute(text("""
+        INSERT INTO Checkout (TransactionID, PatronID, ItemID, CheckoutDate, DueDate)
+        SELECT ItemID, 1 + (ItemID * 7919) % :patrons, ItemID,
+               date('now', '-' || (ItemID % 150) || ' days'),
+               date('now', (30 - ItemID % 150) || ' days')
+        FROM LibraryItem
+    """), {"patrons": patrons})
+    session.execute(text("UPDATE LibraryItem SET ActiveTransactionID = ItemID"))
+    session.execute(text("ANALYZE"))
+    session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--loans', type=int, default=1000000, help='open loans')
+    parser.add_argument('--patrons', type=int, default=100000)
+    parser.add_argument('--sample', type=int, default=200, help='patrons to check against calculate_fine')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bookmarked-fines-')
+    os.environ['BOOKMARKED_DB_PATH'] = os.path.join(workdir, 'fines.db')
+    sys.path.insert(0, REPO_ROOT)
+    import app as bookmarked
+
+    with bookmarked.app.app_context():
+        started = time.perf_counter()
+        seed(bookmarked, args.loans, args.patrons)
+        print(f"db: {os.environ['BOOKMARKED_DB_PATH']}  open loans: {args.loans}  "
+              f"patrons: {args.patrons}  (seeded in {time.perf_counter() - started:.1f}s)")
+
+        started = time.perf_counter()
+        summary = bookmarked.accrue_fines()
+        print(f"accrue_fines: {time.perf_counter() - started:.2f}s  ->  {summary}")
+
+        # the batch numbers must match the per-loan rule checkin uses
+        session = bookmarked.database.session
+        today = date.today()
+        mismatches = 0
+        for fine in random.Random(1).sample(session.query(bookmarked.ProjectedFine).all(),
+                                            min(args.sample, summary['patrons'])):
+            expected = 0.0
+            loans = session.query(bookmarked.Checkout, bookmarked.LibraryItem).join(
+                bookmarked.LibraryItem, bookmarked.LibraryItem.ActiveTransactionID == bookmarked.Checkout.TransactionID
+            ).filter(bookmarked.Checkout.PatronID == fine.PatronID)
+            for checkout, item in loans:
+                expected += bookmarked.calculate_fine(checkout, item, today)
+            if abs(float(fine.AccruedFines) - expected) > 0.01:
+                mismatches += 1
+                print(f"  patron {fine.PatronID}: batch {fine.AccruedFines} vs calculate_fine {expected:.2f}")
+
+    if mismatches:
+        sys.exit(f"{mismatches} patron(s) disagree with calculate_fine")
+    print(f"sample of {min(args.sample, summary['patrons'])} patrons matches calculate_fine")
+
+
+if __name__ == '__main__':
+    main()
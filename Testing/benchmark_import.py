@@ -0,0 +1,145 @@
+'''
+Bulk import benchmark - writes synthetic item and patron CSV files with a sprinkling of
+bad rows, loads them with import_csv() (flask import-csv) and reports rows per second.
+
+    python Testing/benchmark_import.py
+    python Testing/benchmark_import.py --items 1000000 --patrons 200000 --min-rate 100000
+    python Testing/benchmark_import.py --defer-indexes
+
+Runs against a scratch database (BOOKMARKED_DB_PATH) with the sprint item types and
+branches. About 1% of the rows break a rule (unknown ItemType, a Status outside the
+valid_status CHECK, a missing name, a bad date, a duplicate id); exits with status 1
+if exactly those rows are not the ones rejected, or if a file loads slower than
+--min-rate rows/s.
+'''
+import os
+import io
+import csv
+import sys
+import random
+import argparse
+import tempfile
+
+from sqlalchemy import text
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(TESTING_DIR)
+
+sys.path.insert(0, TESTING_DIR)
+from generate_data import ITEM_TYPES, FIRST_NAMES, LAST_NAMES, TITLE_WORDS
+
+BAD_ITEM_ROWS = [
+    lambda row: row.update(ItemType='99'),
+    lambda row: row.update(Status='lost'),
+    lambda row: row.update(ItemTitle=''),
+    lambda row: row.update(AquisitionDate='03/04/2021'),
+    lambda row: row.update(Cost='-4'),
+    lambda row: row.update(ItemID='1'), # duplicate of the first row
+]
+BAD_PATRON_ROWS = [
+    lambda row: row.update(PatronLN=''),
+    lambda row: row.update(AccountExpDate='2026-13-01'),
+    lambda row: row.update(FeesOwed='lots'),
+    lambda row: row.update(PatronID='1'),
+]
+
+
+def write_csv(path: str, columns: list, rows: int, make_row, bad_rows: list, rng) -> int:
+    '''Writes rows to path, breaking ~1% of them (never the first), returns how many are bad'''
+    bad = 0
+    with open(path, 'w', newline='') as out:
+        writer = csv.DictWriter(out, columns)
+        writer.writeheader()
+        for n in range(1, rows + 1):
+            row = make_row(n, rng)
+            if n > 1 and rng.random() < 0.01:
+                rng.choice(bad_rows)(row)
+                bad += 1
+            writer.writerow(row)
+    return bad
+
+
+def item_row(n: int, rng) -> dict:
+    return {
+        "ItemID": n, "ItemType": rng.randint(1, len(ITEM_TYPES)),
+        "ItemTitle": f"The {rng.choice(TITLE_WORDS)} of {rng.choice(TITLE_WORDS)}",
+        "Author": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "Status": 'available' if rng.random() < 0.98 else 'checked in',
+        "ShelfCode": f"{chr(65 + rng.randint(0, 25))}{rng.randint(1, 99):02}",
+        "Cost": f"{rng.uniform(5, 60):.2f}", "AquisitionDate": f"20{rng.randint(10, 25)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+    }
+
+
+def patron_row(n: int, rng) -> dict:
+    return {
+        "PatronID": n, "PatronFN": rng.choice(FIRST_NAMES), "PatronLN": rng.choice(LAST_NAMES),
+        "AccountExpDate": f"202{rng.randint(5, 9)}-1{rng.randint(0, 2)}-0{rng.randint(1, 9)}",
+        "FeesOwed": '0' if rng.random() < 0.9 else f"{rng.uniform(0, 20):.2f}",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=500000)
+    parser.add_argument('--patrons', type=int, default=100000)
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--min-rate', type=float, default=0, help='fail below this many rows/s')
+    parser.add_argument('--defer-indexes', action='store_true', help='rebuild secondary indexes after the load')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bookmarked-import-')
+    os.environ['BOOKMARKED_DB_PATH'] = os.path.join(workdir, 'import.db')
+    sys.path.insert(0, REPO_ROOT)
+    import app as bookmarked
+
+    rng = random.Random(1)
+    files = {
+        'items': (os.path.join(workdir, 'items.csv'), list(item_row(1, rng)), args.items, item_row, BAD_ITEM_ROWS),
+        'patrons': (os.path.join(workdir, 'patrons.csv'), list(patron_row(1, rng)), args.patrons, patron_row,
+                    BAD_PATRON_ROWS),
+    }
+    expected_bad = {table: write_csv(path, columns, rows, make_row, bad_rows, rng)
+                    for table, (path, columns, rows, make_row, bad_rows) in files.items()}
+
+    failed = False
+    with bookmarked.app.app_context():
+        bookmarked.init_db()
+        session = bookmarked.database.session
+        session.execute(bookmarked.insert(bookmarked.ItemType), [dict(t) for t in ITEM_TYPES])
+        session.execute(text("INSERT INTO LibraryBranch (BranchID, BranchName) VALUES (1, 'Main Branch')"))
+        session.commit()
+
+        print(f"db: {os.environ['BOOKMARKED_DB_PATH']}")
+        for table, (path, _, rows, _, _) in files.items():
+            rejects = io.StringIO()
+            with open(path, newline='') as lines:
+                summary = bookmarked.import_csv(table, lines, args.chunk_size, csv.writer(rejects),
+                                                 defer_indexes=args.defer_indexes)
+            model = bookmarked.IMPORT_TABLES[table][0]
+            in_table = session.query(model).count()
+            rate = summary['read'] / summary['seconds']
+            print(f"  {table:<8} {summary['read']:>8} rows  {summary['imported']:>8} imported  "
+                  f"{summary['rejected']:>6} rejected  {summary['seconds']:>6.2f}s  {rate:>9,.0f} rows/s")
+            if summary['rejected'] != expected_bad[table] or in_table != rows - expected_bad[table]:
+                failed = True
+                print(f"FAIL {table}: expected {expected_bad[table]} rejects and {rows - expected_bad[table]} rows, "
+                      f"got {summary['rejected']} rejects and {in_table} rows")
+                print(rejects.getvalue()[:1000])
+            if rate < args.min_rate:
+                failed = True
+                print(f"FAIL {table}: {rate:,.0f} rows/s is below --min-rate {args.min_rate:,.0f}")
+
+        queued = session.execute(text("SELECT count(*) FROM ReshelveQueue")).scalar()
+        checked_in = session.execute(text("SELECT count(*) FROM LibraryItem WHERE Status = 'checked in'")).scalar()
+        if queued != checked_in:
+            failed = True
+            print(f"FAIL reshelve queue has {queued} rows for {checked_in} 'checked in' items")
+
+    print()
+    if failed:
+        sys.exit(1)
+    print("Every bad row rejected, every good row imported")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+'''
+Endpoint benchmark suite - runs every route in app.py against generated databases
+of several sizes and records latency, SQL query count and memory per route.
+
+    python Testing/benchmark_routes.py
+    python Testing/benchmark_routes.py --sizes 1000 10000 50000 --repeats 30 --json results/2025-11.json
+    python Testing/benchmark_routes.py --baseline results/2025-10.json     # flag regressions
+
+Each size runs in its own process on a fresh database from generate_data.generate()
+(patrons = items / 5, 3 years of history). Write routes draw fresh targets for every
+call (an available copy to check out, a loaned copy to check in, ...), so repeats
+take the same path. Before timing, extra copies are put on loan and on hold
+(top_up_targets) so every call has a target at any size and --repeats. A route that
+still runs out is reported as "skipped: no targets" and the script exits with status 1.
+
+Recorded per route: p50/p95 latency (ms), median queries per request, and peak
+Python memory allocated during one request (tracemalloc, KiB). Peak RSS of the
+process is recorded per size.
+
+With --baseline, a route regresses when its query count goes up, or its p50 is more
+than --threshold slower (and at least 1 ms); the script then exits with status 1.
+'''
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import statistics
+import tracemalloc
+from datetime import date, timedelta
+
+from sqlalchemy import event, text
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(TESTING_DIR)
+
+# id pools drawn from the generated database before the run
+POOLS = {
+    'item': "SELECT ItemID FROM LibraryItem",
+    'patron': "SELECT PatronID FROM Patron",
+    # no open loans either, so a checkin earlier in the run can't leave them owing a fine
+    'patron_ok': """SELECT PatronID FROM PatronStanding
+                    WHERE AccountExpDate >= date('now') AND FeesOwed = 0 AND OpenLoans = 0""",
+    'borrower': """SELECT DISTINCT c.PatronID FROM LibraryItem i
+                   JOIN Checkout c ON c.TransactionID = i.ActiveTransactionID""",
+    'available': """SELECT ItemID FROM LibraryItem i WHERE Status = 'available'
+                    AND NOT EXISTS (SELECT 1 FROM Reservation r WHERE r.ReservedItem = i.ItemID AND r.Active = 1)""",
+    'out': """SELECT ItemID FROM LibraryItem i WHERE Status = 'checked out' AND ActiveTransactionID IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM Reservation r WHERE r.ReservedItem = i.ItemID AND r.Active = 1)""",
+    'cart': "SELECT ItemID FROM LibraryItem WHERE Status = 'checked in'",
+    'hold': "SELECT ReservationID FROM Reservation WHERE Active = 1",
+}
+
+BULK_SIZE = 10 # items per bulk checkin/reshelve call
+
+# (name, method, request builder) - builders get (pools, rng) and return (url, json body)
+# writes pop their target so every call does real work; checkin feeds the reshelve cart
+ROUTES = [
+    ('GET /', 'GET', lambda p, r: ('/', None)),
+    ('GET /checkout', 'GET', lambda p, r: ('/checkout', None)),
+    ('GET /checkin', 'GET', lambda p, r: ('/checkin', None)),
+    ('GET /reshelve', 'GET', lambda p, r: ('/reshelve', None)),
+    ('GET /reserve', 'GET', lambda p, r: ('/reserve', None)),
+    ('GET /view-patrons', 'GET', lambda p, r: ('/view-patrons', None)),
+    ('GET /view-items', 'GET', lambda p, r: ('/view-items', None)),
+    ('GET /search', 'GET', lambda p, r: ('/search', None)),
+    ('GET /patrons', 'GET', lambda p, r: ('/patrons', None)),
+    ('GET /api/patrons', 'GET', lambda p, r: ('/api/patrons?limit=50', None)),
+    ('GET /api/patrons?q=', 'GET', lambda p, r: ('/api/patrons?q=Mi&limit=50', None)),
+    ('GET /api/itemtypes', 'GET', lambda p, r: ('/api/itemtypes', None)),
+    ('GET /api/branches', 'GET', lambda p, r: ('/api/branches', None)),
+    ('GET /api/items', 'GET', lambda p, r: ('/api/items', None)),
+    ('GET /api/items?limit', 'GET', lambda p, r: ('/api/items?limit=50', None)),
+    ('GET /api/items?q=', 'GET', lambda p, r: ('/api/items?q=River&limit=50', None)),
+    ('GET /api/search/items', 'GET', lambda p, r: ('/api/search/items?q=night%20garden', None)),
+    ('GET /api/item/<id>', 'GET', lambda p, r: (f"/api/item/{r.choice(p['item'])}", None)),
+    ('POST /api/items/lookup', 'POST', lambda p, r: ('/api/items/lookup', {"item_ids": r.sample(p['item'], 20)})),
+    ('GET /api/patrons-with-checkouts', 'GET', lambda p, r: ('/api/patrons-with-checkouts', None)),
+    ('GET /api/checkedout', 'GET', lambda p, r: ('/api/checkedout', None)),
+    ('GET /api/items-for-patron', 'GET', lambda p, r: (f"/api/items-for-patron?patron_id={r.choice(p['borrower'])}", None)),
+    ('GET /api/view_patron/<id>', 'GET', lambda p, r: (f"/api/view_patron/{r.choice(p['borrower'])}", None)),
+    ('GET /api/patron/<id>', 'GET', lambda p, r: (f"/api/patron/{r.choice(p['patron'])}", None)),
+    ('GET /api/check_membership', 'GET', lambda p, r: (f"/api/check_membership?patron_id={r.choice(p['patron'])}", None)),
+    ('GET /api/check_fines', 'GET', lambda p, r: (f"/api/check_fines?patron_id={r.choice(p['patron'])}", None)),
+    ('GET /api/patron/<id>/reservations', 'GET', lambda p, r: (f"/api/patron/{r.choice(p['patron'])}/reservations", None)),
+    ('GET /api/reservation/<id>', 'GET', lambda p, r: (f"/api/reservation/{r.choice(p['hold'])}", None)),
+    ('GET /api/items-to-reshelve', 'GET', lambda p, r: ('/api/items-to-reshelve', None)),
+    ('GET /api/items-to-reshelve?order=shelf', 'GET', lambda p, r: ('/api/items-to-reshelve?order=shelf&limit=50', None)),
+    ('GET /api/patron/<id>/history', 'GET', lambda p, r: (f"/api/patron/{r.choice(p['borrower'])}/history?limit=20",
+                                                          None)),
+    ('GET /api/item/<id>/history', 'GET', lambda p, r: (f"/api/item/{r.choice(p['item'])}/history?limit=20", None)),
+    ('GET /api/export/patrons', 'GET', lambda p, r: ('/api/export/patrons?format=csv', None)),
+    ('GET /api/export/items', 'GET', lambda p, r: ('/api/export/items?format=ndjson', None)),
+    ('GET /api/export/loans', 'GET', lambda p, r: ('/api/export/loans?format=csv&gzip=1', None)),
+    ('GET /metrics', 'GET', lambda p, r: ('/metrics', None)),
+    ('GET /dbinfo', 'GET', lambda p, r: ('/dbinfo', None)),
+    ('POST /api/extend_membership', 'POST', lambda p, r: ('/api/extend_membership',
+                                                          {"patron_id": r.choice(p['patron']), "days": "30"})),
+    ('POST /api/pay_fines', 'POST', lambda p, r: ('/api/pay_fines', {"patron_id": r.choice(p['patron'])})),
+    ('POST /api/reserve', 'POST', lambda p, r: ('/api/reserve', {"patron_id": r.choice(p['patron_ok']),
+                                                                 "item_id": p['out'].pop()})),
+    ('POST /api/cancel_reservation', 'POST', lambda p, r: ('/api/cancel_reservation',
+                                                           {"reservation_id": str(p['hold'].pop())})),
+    ('POST /checkin', 'POST', lambda p, r: ('/checkin', {"item_id": str(p['cart_next'](p['out'].pop(0))),
+                                                         "branch_id": "1"})),
+    ('POST /api/checkin/bulk', 'POST', lambda p, r: ('/api/checkin/bulk', {
+        "branch_id": 1, "item_ids": [p['cart_next'](p['out'].pop(0)) for _ in range(BULK_SIZE)]})),
+    ('POST /api/reshelve', 'POST', lambda p, r: ('/api/reshelve', {"item_id": p['cart'].pop()})),
+    ('POST /api/reshelve/bulk', 'POST', lambda p, r: ('/api/reshelve/bulk', {
+        "item_ids": [p['cart'].pop() for _ in range(BULK_SIZE)]})),
+    ('POST /checkout', 'POST', lambda p, r: ('/checkout', {"patron_id": p['patron_ok'].pop(),
+                                                           "item_ids": [p['available'].pop() for _ in range(3)]})),
+]
+
+
+def top_up_targets(bookmarked, calls: int):
+    '''
+    Puts available copies on loan (and holds on some of them) until the write routes have
+    a target for each of their calls: reserve, checkin and bulk checkin take loaned copies,
+    cancel takes holds. The loans go to patrons outside the patron_ok pool.
+    '''
+    session = bookmarked.database.session
+    out = len(session.execute(text(POOLS['out'])).all())
+    holds = len(session.execute(text(POOLS['hold'])).all())
+    missing_holds = max(0, calls - holds)
+    missing = max(0, calls * (2 + BULK_SIZE) - out) + missing_holds
+    if not missing:
+        return
+    new_items = [row[0] for row in session.execute(text(POOLS['available'] + " ORDER BY ItemID DESC LIMIT :count"),
+                                                   {"count": missing})]
+    lenders = session.execute(text("""SELECT PatronID FROM PatronStanding
+                                     WHERE NOT (AccountExpDate >= date('now') AND FeesOwed = 0)""")).scalars().all()
+    lenders = lenders or session.execute(text("SELECT PatronID FROM Patron")).scalars().all()
+    session.execute(bookmarked.insert(bookmarked.Checkout), [
+        {"PatronID": lenders[n % len(lenders)], "ItemID": item_id,
+         "CheckoutDate": date.today() - timedelta(days=3), "DueDate": date.today() + timedelta(days=11)}
+        for n, item_id in enumerate(new_items)
+    ])
+    session.execute(text("UPDATE LibraryItem SET Status = 'checked out' WHERE ItemID IN (SELECT value FROM json_each(:ids))"),
+                    {"ids": json.dumps(new_items)})
+    if missing_holds:
+        session.execute(bookmarked.insert(bookmarked.Reservation), [
+            {"ReservingPatron": lenders[n % len(lenders)], "ReservedItem": item_id, "DateReserved": date.today(),
+             "Active": True, "ExpiresAt": None}
+            for n, item_id in enumerate(new_items[:missing_holds])
+        ])
+    bookmarked.rebuild_active_loans()
+    session.commit()
+
+
+def percentile(values, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def run_size(items: int, repeats: int, seed: int) -> dict:
+    '''Child process: generate a database of this size and time every route on it'''
+    workdir = tempfile.mkdtemp(prefix=f'bookmarked-routes-{items}-')
+    os.environ['BOOKMARKED_DB_PATH'] = os.path.join(workdir, 'routes.db')
+    sys.path.insert(0, REPO_ROOT)
+    sys.path.insert(0, TESTING_DIR)
+    import app as bookmarked
+    from generate_data import generate
+
+    rng = random.Random(seed)
+    with bookmarked.app.app_context():
+        counts = generate(bookmarked, items=items, patrons=max(50, items // 5), seed=seed)
+        top_up_targets(bookmarked, repeats + 3) # 2 warm-up calls, the timed ones and the memory one
+        pools = {name: [row[0] for row in bookmarked.database.session.execute(text(sql))]
+                 for name, sql in POOLS.items()}
+        engines = list(bookmarked.database.engines.values()) # the writer and the read pool
+    for ids in pools.values():
+        rng.shuffle(ids)
+
+    def cart_next(item_id):
+        pools['cart'].append(item_id) # checked in now, so it can be reshelved later
+        return item_id
+    pools['cart_next'] = cart_next
+
+    query_count = [0]
+
+    def count_query(*_):
+        query_count[0] += 1
+
+    for bound_engine in engines:
+        event.listen(bound_engine, 'before_cursor_execute', count_query)
+    client = bookmarked.app.test_client()
+
+    results, skipped = {}, []
+    for name, method, build in ROUTES:
+        timings, queries, failures = [], [], 0
+        for call in range(repeats + 2): # first two calls warm caches and are not timed
+            try:
+                url, body = build(pools, rng)
+            except IndexError:
+                break # ran out of targets - reported as skipped below
+            query_count[0] = 0
+            start = time.perf_counter()
+            resp = client.open(url, method=method, json=body)
+            resp.get_data() # streamed bodies (exports) run their queries as they are read
+            elapsed = (time.perf_counter() - start) * 1000
+            data = resp.get_json(silent=True)
+            if resp.status_code >= 400 or (isinstance(data, dict) and data.get('ok') is False):
+                failures += 1
+            if call >= 2:
+                timings.append(elapsed)
+                queries.append(query_count[0])
+        if len(timings) < repeats:
+            skipped.append(name)
+            continue
+
+        peak_kib = None
+        try:
+            url, body = build(pools, rng)
+            tracemalloc.start()
+            client.open(url, method=method, json=body).get_data()
+            peak_kib = tracemalloc.get_traced_memory()[1] / 1024
+        except IndexError:
+            skipped.append(name)
+        finally:
+            tracemalloc.stop()
+
+        results[name] = {
+            "p50_ms": round(statistics.median(timings), 3),
+            "p95_ms": round(percentile(timings, 0.95), 3),
+            "queries": statistics.median(queries),
+            "peak_kib": round(peak_kib, 1) if peak_kib is not None else None,
+            "calls": len(timings),
+            "failures": failures,
+        }
+
+    return {"rows": counts, "routes": results, "skipped": skipped,
+            "max_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for size, run in current["sizes"].items():
+        old_routes = baseline.get("sizes", {}).get(size, {}).get("routes", {})
+        for name, now in run["routes"].items():
+            old = old_routes.get(name)
+            if not old:
+                continue
+            if now["queries"] > old["queries"]:
+                regressions.append(f"{size:>7} items  {name}: queries {old['queries']:g} -> {now['queries']:g}")
+            if now["p50_ms"] > old["p50_ms"] * (1 + threshold) and now["p50_ms"] - old["p50_ms"] >= 1:
+                regressions.append(f"{size:>7} items  {name}: p50 {old['p50_ms']:.2f} -> {now['p50_ms']:.2f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000], help='catalog sizes (items)')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed p50 slowdown (0.25 = 25%%)')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--child-out', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(args.child_out, 'w') as out:
+            json.dump(run_size(args.child, args.repeats, args.seed), out)
+        return
+
+    report = {"created": time.strftime('%Y-%m-%dT%H:%M:%S'), "python": platform.python_version(),
+              "repeats": args.repeats, "sizes": {}}
+    for size in args.sizes:
+        out = os.path.join(tempfile.mkdtemp(prefix='bookmarked-routes-'), 'result.json')
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--child', str(size), '--child-out', out,
+                        '--repeats', str(args.repeats), '--seed', str(args.seed)], check=True)
+        with open(out) as f:
+            run = json.load(f)
+        report["sizes"][str(size)] = run
+
+        rows = run["rows"]
+        print(f"\n{size} items, {rows['Patron']} patrons, {rows['Checkout']} loans  (max RSS {run['max_rss_mib']} MiB)")
+        print(f"{'route':<40} {'p50 ms':>8} {'p95 ms':>8} {'queries':>8} {'peak KiB':>9} {'fail':>5}")
+        for name, r in run["routes"].items():
+            peak = f"{r['peak_kib']:.0f}" if r['peak_kib'] is not None else '-'
+            print(f"{name:<40} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['queries']:>8g} {peak:>9} {r['failures']:>5}")
+        for name in run["skipped"]:
+            print(f"{name:<40} skipped: no targets")
+
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nresults written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        print()
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.baseline}:")
+            for line in regressions:
+                print('  ' + line)
+            sys.exit(1)
+        print(f"no regressions against {args.baseline}")
+
+    skipped = [f"{size:>7} items  {name}" for size, run in report["sizes"].items() for name in run["skipped"]]
+    if skipped:
+        print(f"\n{len(skipped)} route(s) ran out of targets:")
+        for line in skipped:
+            print('  ' + line)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+'''
+Query plan regression check - runs every route in app.py against a seeded scratch
+database, captures each SQL statement the route issues and runs EXPLAIN QUERY PLAN
+on it. Exits with status 1 if a hot path does a full SCAN of a large table.
+
+    python Testing/check_query_plans.py
+    python Testing/check_query_plans.py --verbose      # print every plan
+
+A SCAN of a large table is accepted when:
+  - it walks a partial index (those only hold the rows the query is about), or
+  - it is an ordered walk that stops after one page: the statement has a LIMIT, no
+    temp b-tree sort, no LIKE/GLOB filter, and the index (or the rowid, for a plain
+    SCAN) leads with the first ORDER BY column, or
+  - the route is listed in ALLOWED_SCANS with the reason (legacy full dumps, ...).
+
+Add new routes to ROUTES so they are covered.
+'''
+import os
+import re
+import sys
+import argparse
+import tempfile
+
+from sqlalchemy import event, text
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(TESTING_DIR)
+
+LARGE_TABLES = {'LibraryItem', 'Patron', 'Checkout', 'Return', 'Reservation', 'CheckoutArchive', 'ReturnArchive'}
+
+# (method, url, json body) - {name} placeholders are filled from earlier responses
+ROUTES = [
+    ('GET', '/patrons', None),
+    ('GET', '/api/patrons?limit=20', None),
+    ('GET', '/api/patrons?q=Patron1&limit=20', None),
+    ('GET', '/api/patrons?q=12', None),
+    ('GET', '/api/itemtypes', None),
+    ('GET', '/api/branches', None),
+    ('GET', '/api/items', None),
+    ('GET', '/api/items?type_id=1', None),
+    ('GET', '/api/items?limit=20', None),
+    ('GET', '/api/items?type_id=1&limit=20', None),
+    ('GET', '/api/items?status=available&limit=20', None),
+    ('GET', '/api/items?q=Item%2012&limit=20', None),
+    ('GET', '/api/search/items?q=bench%2012', None),
+    ('GET', '/api/search/items?q=42&field=any', None),
+    ('POST', '/checkout', {"patron_id": 1, "item_ids": [1, 2, 3]}),
+    ('GET', '/api/patrons-with-checkouts', None),
+    ('GET', '/api/checkedout', None),
+    ('GET', '/api/items-for-patron?patron_id=1', None),
+    ('GET', '/api/view_patron/1', None),
+    ('GET', '/api/check_membership?patron_id=1', None),
+    ('POST', '/api/extend_membership', {"patron_id": 1, "days": "30"}),
+    ('GET', '/api/check_fines?patron_id=1', None),
+    ('GET', '/api/patron/1', None),
+    ('POST', '/api/pay_fines', {"patron_id": 1}),
+    ('POST', '/api/reserve', {"patron_id": 2, "item_id": 1}),
+    ('GET', '/api/item/1', None),
+    ('POST', '/api/items/lookup', {"item_ids": [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]}),
+    ('GET', '/api/reservation/{reservation_id}', None),
+    ('GET', '/api/patron/2/reservations', None),
+    ('GET', '/api/patron/2/history?limit=20', None),
+    ('GET', '/api/item/1/history?limit=20', None),
+    ('POST', '/checkin', {"item_id": "1", "branch_id": "1"}),
+    ('POST', '/api/checkin/bulk', {"branch_id": 1, "item_ids": [2, 3, 4]}),
+    ('GET', '/api/items-to-reshelve', None),
+    ('GET', '/api/items-to-reshelve?order=shelf&limit=20', None),
+    ('GET', '/api/items-to-reshelve?shelf_from=A20&shelf_to=A40&limit=20', None),
+    ('POST', '/api/reshelve', {"item_id": 1}),
+    ('POST', '/api/reshelve/bulk', {"item_ids": [2, 3, 4, 5]}),
+    ('POST', '/api/reshelve/bulk', {"shelf_from": "A20", "shelf_to": "A40"}),
+    ('POST', '/api/cancel_reservation', {"reservation_id": "{reservation_id}"}),
+    ('GET', '/api/export/patrons?format=csv', None),
+    ('GET', '/api/export/items?format=ndjson', None),
+    ('GET', '/api/export/loans?format=csv&gzip=1', None),
+    ('GET', '/dbinfo', None),
+    ('GET', '/metrics', None),
+]
+
+# Routes that deliberately read more than one page of a large table, and why
+ALLOWED_SCANS = {
+    ('GET', '/patrons'): 'unpaged legacy list',
+    ('GET', '/api/items'): 'unpaged legacy list',
+    ('GET', '/api/items?type_id=1'): 'unpaged legacy list',
+    ('GET', '/api/export/patrons?format=csv'): 'full export',
+    ('GET', '/api/export/items?format=ndjson'): 'full export',
+    ('GET', '/api/export/loans?format=csv&gzip=1'): 'full export',
+    ('GET', '/api/items?q=Item%2012&limit=20'): 'substring match on the title - walks ix_LibraryItem_title '
+                                                 'in order until a page of matches (use /api/search/items)',
+}
+
+SQL_KEYWORDS = {'WHERE', 'ON', 'JOIN', 'LEFT', 'INNER', 'OUTER', 'CROSS', 'SET', 'ORDER', 'GROUP',
+                'LIMIT', 'VALUES', 'USING', 'AS', 'SELECT', 'UNION', 'HAVING', 'RETURNING', 'DEFAULT'}
+TABLE_REF = re.compile(r'(?:FROM|JOIN|UPDATE|INTO)\s+(?:\w+\.)?"?(\w+)"?(?:\s+(?:AS\s+)?"?(\w+)"?)?', re.IGNORECASE)
+SCAN_LINE = re.compile(r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?')
+ORDER_BY = re.compile(r'\bORDER BY\b', re.IGNORECASE)
+UNSARGABLE = re.compile(r'\b(?:LIKE|GLOB)\b', re.IGNORECASE)
+
+
+def table_aliases(statement: str) -> dict:
+    '''Maps every table name and alias in a statement to its table'''
+    names = {}
+    for table, alias in TABLE_REF.findall(statement):
+        names[table] = table
+        if alias and alias.upper() not in SQL_KEYWORDS:
+            names[alias] = table
+    return names
+
+
+def first_term(sql: str) -> str:
+    '''sql up to its first comma (or closing parenthesis) outside parentheses'''
+    depth = 0
+    for n, char in enumerate(sql):
+        if char in '),' and depth == 0:
+            return sql[:n]
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+    return sql
+
+
+def sort_key(term: str) -> str:
+    '''A sort term without quotes, table qualifiers, ASC/DESC, spacing or case'''
+    term = re.sub(r'\b\w+\.', '', term.replace('"', ''))
+    term = re.sub(r'\s+(?:ASC|DESC)\s*$', '', term.strip(), flags=re.IGNORECASE)
+    return re.sub(r'\s+', '', term).lower()
+
+
+def order_by_key(statement: str):
+    '''First term of the outermost (last) ORDER BY, or None'''
+    matches = list(ORDER_BY.finditer(statement))
+    if not matches:
+        return None
+    rest = re.split(r'\b(?:LIMIT|OFFSET)\b', statement[matches[-1].end():], flags=re.IGNORECASE)[0]
+    return sort_key(first_term(rest))
+
+
+def leading_key(cursor, table: str, index: str):
+    '''First key of an index (column or expression), or the rowid column for a plain table SCAN'''
+    if index:
+        sql = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = ?", (index,)).fetchone()
+        if not sql or not sql[0]:
+            return None # automatic index
+        sql = sql[0]
+        return sort_key(first_term(sql[sql.index('(', sql.upper().index(' ON ')) + 1:]))
+    pk = [row[1] for row in cursor.execute(f'PRAGMA table_info("{table}")') if row[5] == 1]
+    return pk[0].lower() if len(pk) == 1 else None
+
+
+def seed_circulation(bookmarked):
+    '''
+    Puts ~3% of items out on loan and ~1% on the reshelve cart, so ANALYZE sees the
+    same skew as a live library (the planner needs it to pick the partial indexes).
+    Items 1-10 are left alone for ROUTES.
+    '''
+    session = bookmarked.database.session
+    session.execute(text("""
+        INSERT INTO Checkout (PatronID, ItemID, CheckoutDate, DueDate)
+        SELECT 1 + ItemID % (SELECT count(*) FROM Patron), ItemID, date('now', '-7 days'), date('now', '+14 days')
+        FROM LibraryItem WHERE ItemID > 10 AND ItemID % 33 = 0
+    """))
+    session.execute(text("UPDATE LibraryItem SET Status = 'checked out' WHERE ItemID > 10 AND ItemID % 33 = 0"))
+    session.execute(text("UPDATE LibraryItem SET Status = 'checked in' WHERE ItemID > 10 AND ItemID % 97 = 0 AND ItemID % 33 != 0"))
+    bookmarked.rebuild_active_loans()
+    bookmarked.rebuild_reshelve_queue()
+
+
+def fill(value, state: dict):
+    if isinstance(value, str):
+        return value.format(**state)
+    if isinstance(value, dict):
+        return {k: fill(v, state) for k, v in value.items()}
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--history', type=int, default=4, help='closed loans per item')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bookmarked-plans-')
+    os.environ['BOOKMARKED_DB_PATH'] = os.path.join(workdir, 'plans.db')
+    sys.path.insert(0, REPO_ROOT)
+    sys.path.insert(0, TESTING_DIR)
+    import app as bookmarked
+    from benchmark_checkout import seed
+
+    with bookmarked.app.app_context():
+        seed(bookmarked, args.items, args.items // 5, args.history)
+        seed_circulation(bookmarked)
+        bookmarked.database.session.execute(text("ANALYZE"))
+        bookmarked.database.session.commit()
+        engine = bookmarked.database.engine
+        engines = list(bookmarked.database.engines.values()) # the writer and the read pool
+        partial_indexes = {
+            name for name, sql in bookmarked.database.session.execute(
+                text("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"))
+            if ' WHERE ' in sql.upper()
+        }
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if executemany and parameters and isinstance(parameters[0], (tuple, list, dict)):
+            parameters = parameters[0] # one row is enough to plan the statement
+        captured.append((statement, parameters))
+
+    for bound_engine in engines:
+        event.listen(bound_engine, 'before_cursor_execute', capture)
+    client = bookmarked.app.test_client()
+
+    state = {}
+    failures = []
+    for method, url, body in ROUTES:
+        url = fill(url, state)
+        del captured[:]
+        resp = client.open(url, method=method, json=fill(body, state))
+        resp.get_data() # streamed bodies run their queries as they are read
+        resp.close()
+        data = resp.get_json(silent=True)
+        if isinstance(data, dict) and 'reservation_id' in data:
+            state['reservation_id'] = data['reservation_id']
+        if resp.status_code >= 500:
+            failures.append(f"{method} {url}: HTTP {resp.status_code}")
+
+        statements = list(captured)
+        allowed = (method, url) in ALLOWED_SCANS
+        with engine.connect() as conn:
+            cursor = conn.connection.dbapi_connection.cursor()
+            for statement, parameters in statements:
+                if not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')):
+                    continue
+                if isinstance(parameters, list):
+                    parameters = tuple(parameters)
+                plan = [row[3] for row in cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters or ())]
+                names = table_aliases(statement)
+                order_by = order_by_key(statement)
+                limited = re.search(r'\bLIMIT\b', statement, re.IGNORECASE) and order_by and \
+                    not UNSARGABLE.search(statement) and not any('USE TEMP B-TREE' in line for line in plan)
+
+                bad = []
+                for line in plan:
+                    match = SCAN_LINE.match(line)
+                    table = names.get(match.group(1), match.group(1)) if match else None
+                    if table not in LARGE_TABLES:
+                        continue
+                    if match.group(2) in partial_indexes or allowed:
+                        continue
+                    if limited and leading_key(cursor, table, match.group(2)) == order_by:
+                        continue
+                    bad.append(line)
+
+                if args.verbose or bad:
+                    print(f"{'FAIL' if bad else 'ok  '} {method} {url}"
+                          + (f"  (allowed: {ALLOWED_SCANS[(method, url)]})" if allowed else ''))
+                    print('      ' + ' '.join(statement.split())[:200])
+                    for line in plan:
+                        print('        ' + line)
+                if bad:
+                    failures.append(f"{method} {url}: {'; '.join(bad)}")
+
+    print()
+    if failures:
+        print(f"{len(failures)} problem(s):")
+        for failure in failures:
+            print('  ' + failure)
+        sys.exit(1)
+    print(f"All {len(ROUTES)} routes use indexed plans on large tables "
+          f"({len(ALLOWED_SCANS)} allowed to scan, see ALLOWED_SCANS)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+'''
+Synthetic data generator - builds a production-sized BookMarked database with
+branches, item types, a catalog, patrons and years of Checkout/Return/Reservation
+history, using bulk inserts.
+
+    python Testing/generate_data.py /tmp/big.db
+    python Testing/generate_data.py /tmp/big.db --items 100000 --patrons 20000 --years 5 --branches 6
+    python Testing/generate_data.py /tmp/big.db --item-types 12
+
+The history is shaped like a real library rather than uniform noise:
+  - item popularity is heavy-tailed (a few titles circulate constantly, most rarely)
+  - loans of one copy never overlap; ~15% come back late
+  - the newest loan of a copy may still be open (some overdue) -> 'checked out'
+  - copies returned in the last couple of days sit on the cart -> 'checked in'
+  - some patrons have expired cards or owe fees; holds exist on loaned and returned copies
+  - the first 5 item types are the sprint ones (books take most loans); --item-types beyond
+    that adds generated types with their own rental length and a smaller share of the catalog
+The same --seed gives the same database.
+
+Other scripts call generate() directly on an app imported against a scratch
+BOOKMARKED_DB_PATH. It refuses to write into an existing file.
+'''
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import date, timedelta
+
+from sqlalchemy import insert, text
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(TESTING_DIR)
+
+# same types and rules as the sprint databases in instance/
+ITEM_TYPES = [
+    {"TypeID": 1, "TypeName": "book", "RentalLength": 21, "PerDayFine": 1},
+    {"TypeID": 2, "TypeName": "movie", "RentalLength": 7, "PerDayFine": 1},
+    {"TypeID": 3, "TypeName": "newMovie", "RentalLength": 3, "PerDayFine": 1},
+    {"TypeID": 4, "TypeName": "BluRay", "RentalLength": 7, "PerDayFine": 1.5},
+    {"TypeID": 5, "TypeName": "Video Game", "RentalLength": 14, "PerDayFine": 1},
+]
+TYPE_WEIGHTS = [70, 12, 4, 8, 6]
+EXTRA_RENTAL_LENGTHS = [14, 7, 28, 3, 21] # cycled through by generated item types
+BRANCH_NAMES = ["Main Branch", "East Branch", "West Branch", "North Branch", "South Branch",
+                "Downtown Branch", "Lakeside Branch", "Hillcrest Branch"]
+
+FIRST_NAMES = ["Alice", "Brian", "Cynthia", "David", "Evelyn", "Farah", "George", "Hana", "Ivan", "Julia",
+               "Kwame", "Laura", "Mateo", "Nadia", "Omar", "Priya", "Quinn", "Rosa", "Samuel", "Tomas",
+               "Uma", "Victor", "Wen", "Ximena", "Yusuf", "Zoe", "Ana", "Ben", "Chloe", "Dmitri"]
+LAST_NAMES = ["Walker", "Lopez", "Miller", "Chen", "Okafor", "Nguyen", "Smith", "Garcia", "Kowalski", "Haddad",
+              "Johnson", "Rossi", "Tanaka", "Müller", "Brown", "Singh", "Dubois", "Kim", "Ortiz", "Novak",
+              "Andersen", "Patel", "Moreau", "Silva", "O'Brien", "Yilmaz", "Fischer", "Costa", "Ivanova", "Ward"]
+TITLE_WORDS = ["Money", "River", "Night", "Garden", "Code", "Empire", "Silent", "Winter", "Psychology", "Startup",
+               "Ocean", "Shadow", "Light", "History", "Machine", "Kingdom", "Secret", "Mountain", "City", "Dream",
+               "Fire", "Journey", "Mind", "Stars", "Memory", "Island", "Storm", "Paper", "Glass", "Harbor"]
+TITLE_FORMS = ["The {a} of {b}", "{a} and {b}", "The {a} {b}", "{a}", "A {a} for {b}", "Beyond the {a}",
+               "{a}: A History", "The Last {a}"]
+
+CHUNK = 20000
+
+
+def make_item_types(count: int = len(ITEM_TYPES)) -> tuple:
+    '''(types, weights) for count item types - the sprint types first, then generated ones'''
+    types = [dict(t) for t in ITEM_TYPES[:count]]
+    weights = TYPE_WEIGHTS[:count]
+    for type_id in range(len(types) + 1, count + 1):
+        types.append({"TypeID": type_id, "TypeName": f"Type {type_id}",
+                      "RentalLength": EXTRA_RENTAL_LENGTHS[type_id % len(EXTRA_RENTAL_LENGTHS)],
+                      "PerDayFine": 0.5 if type_id % 2 else 1})
+        weights.append(max(1, 30 // (type_id - len(ITEM_TYPES)))) # a long tail of rarer formats
+    return types, weights
+
+
+def bulk_insert(session, model, rows):
+    for start in range(0, len(rows), CHUNK):
+        session.execute(insert(model), rows[start:start + CHUNK])
+
+
+def generate(bookmarked, items: int = 20000, patrons: int = 4000, branches: int = 4, years: int = 3,
+             seed: int = 1, verbose: bool = False, item_types: int = len(ITEM_TYPES)) -> dict:
+    '''Creates the schema and fills the (empty) database behind bookmarked.app, returns row counts'''
+    bookmarked.init_db()
+    rng = random.Random(seed)
+    session = bookmarked.database.session
+    today = date.today()
+    start = today - timedelta(days=365 * years)
+    started = time.perf_counter()
+
+    def log(message):
+        if verbose:
+            print(f"  {time.perf_counter() - started:6.1f}s  {message}")
+
+    # reference data
+    branch_rows = [{"BranchID": b, "BranchName": BRANCH_NAMES[b - 1] if b <= len(BRANCH_NAMES) else f"Branch {b}"}
+                   for b in range(1, branches + 1)]
+    bulk_insert(session, bookmarked.LibraryBranch, branch_rows)
+    type_rows, type_weights = make_item_types(item_types)
+    bulk_insert(session, bookmarked.ItemType, type_rows)
+    rental = {t["TypeID"]: t["RentalLength"] for t in type_rows}
+
+    # patrons - a fifth are heavy readers who take most of the loans
+    patron_rows = []
+    for p in range(1, patrons + 1):
+        owes = 0 if rng.random() < 0.85 else round(rng.uniform(0.25, 30), 2)
+        patron_rows.append({
+            "PatronID": p, "PatronFN": rng.choice(FIRST_NAMES), "PatronLN": rng.choice(LAST_NAMES),
+            "AccountExpDate": today + timedelta(days=rng.randint(-180, 720)),
+            "FeesOwed": owes, "ItemsCheckedOut": 0,
+        })
+    heavy = list(range(1, max(2, patrons // 5) + 1))
+
+    def pick_patron(open_loans):
+        for _ in range(10):
+            patron = rng.choice(heavy) if rng.random() < 0.6 else rng.randint(1, patrons)
+            if open_loans.get(patron, 0) < bookmarked.MAX_ITEMS_PER_PATRON:
+                return patron
+        return rng.randint(1, patrons)
+
+    # catalog and circulation history, one copy at a time so its loans never overlap
+    item_rows, checkouts, returns, reservations = [], [], [], []
+    open_loans = {}
+    txn = 0
+    for i in range(1, items + 1):
+        type_id = rng.choices(range(1, len(type_rows) + 1), type_weights)[0]
+        form = rng.choice(TITLE_FORMS)
+        title = form.format(a=rng.choice(TITLE_WORDS), b=rng.choice(TITLE_WORDS))
+        acquired = start - timedelta(days=rng.randint(0, 3650)) if rng.random() < 0.7 \
+            else start + timedelta(days=rng.randint(0, 365 * years))
+        status = "available"
+
+        loans_per_year = min(24.0, 0.5 * rng.paretovariate(1.2))
+        t = max(acquired, start) + timedelta(days=rng.expovariate(loans_per_year / 365))
+        while t <= today:
+            txn += 1
+            patron = pick_patron(open_loans)
+            due = t + timedelta(days=rental[type_id])
+            checkouts.append({"TransactionID": txn, "PatronID": patron, "ItemID": i, "CheckoutDate": t, "DueDate": due})
+            if rng.random() < 0.05:
+                reservations.append({"ReservingPatron": patron, "ReservedItem": i,
+                                     "DateReserved": t - timedelta(days=rng.randint(1, 10)), "Active": False})
+            if rng.random() < 0.15:
+                back = due + timedelta(days=rng.randint(1, 30))
+            else:
+                back = t + timedelta(days=rng.randint(1, rental[type_id]))
+            if back > today:
+                status = "checked out"
+                open_loans[patron] = open_loans.get(patron, 0) + 1
+                break
+            returns.append({"TransactionID": txn, "DateReturned": back, "BranchReturnedTo": rng.randint(1, branches)})
+            if (today - back).days < 2:
+                status = "checked in"
+            t = back + timedelta(days=1 + rng.expovariate(loans_per_year / 365))
+
+        # holds: on a fifth of the loaned copies, and a few returned copies waiting for pickup
+        if status == "checked out" and rng.random() < 0.2:
+            reservations.append({"ReservingPatron": rng.randint(1, patrons), "ReservedItem": i,
+                                 "DateReserved": today - timedelta(days=rng.randint(0, 14)), "Active": True})
+        elif status == "available" and returns and returns[-1]["TransactionID"] == txn and rng.random() < 0.01:
+            status = "reserved"
+            returned = returns[-1]["DateReturned"]
+            reservations.append({"ReservingPatron": rng.randint(1, patrons), "ReservedItem": i,
+                                 "DateReserved": returned - timedelta(days=rng.randint(1, 14)), "Active": True,
+                                 "ExpiresAt": max(returned, today - timedelta(days=2))
+                                 + timedelta(days=bookmarked.RESERVATION_PICKUP_DAYS)})
+
+        item_rows.append({"ItemID": i, "ItemType": type_id, "AquisitionDate": acquired,
+                          "Cost": round(rng.uniform(5, 60), 2), "ItemTitle": title[:50], "Status": status,
+                          "ShelfCode": f"{chr(65 + rng.randint(0, 25))}{rng.randint(1, 99):02}",
+                          "Author": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"})
+    log(f"built {items} items, {len(checkouts)} loans, {len(reservations)} reservations in memory")
+
+    bulk_insert(session, bookmarked.LibraryItem, item_rows)
+    bulk_insert(session, bookmarked.Patron, patron_rows)
+    bulk_insert(session, bookmarked.Checkout, checkouts)
+    bulk_insert(session, bookmarked.Return, returns)
+    for row in reservations:
+        row.setdefault("ExpiresAt", None)
+    bulk_insert(session, bookmarked.Reservation, reservations)
+    log("inserted rows")
+
+    bookmarked.rebuild_active_loans()
+    bookmarked.rebuild_reshelve_queue()
+    session.execute(text("ANALYZE"))
+    session.commit()
+    log("rebuilt loan pointers and reshelve queue, ran ANALYZE")
+
+    return {"LibraryBranch": branches, "ItemType": len(type_rows), "LibraryItem": items, "Patron": patrons,
+            "Checkout": len(checkouts), "Return": len(returns), "Reservation": len(reservations),
+            "open loans": len(checkouts) - len(returns)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='database file to create (must not exist)')
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--patrons', type=int, default=4000)
+    parser.add_argument('--branches', type=int, default=4)
+    parser.add_argument('--item-types', type=int, default=len(ITEM_TYPES))
+    parser.add_argument('--years', type=int, default=3, help='years of circulation history')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.path)
+    if os.path.exists(path):
+        sys.exit(f"{path} already exists - pick a new file")
+    os.environ['BOOKMARKED_DB_PATH'] = path
+    sys.path.insert(0, REPO_ROOT)
+    import app as bookmarked
+
+    started = time.perf_counter()
+    with bookmarked.app.app_context():
+        counts = generate(bookmarked, args.items, args.patrons, args.branches, args.years, args.seed, verbose=True,
+                          item_types=args.item_types)
+    print(f"{path} built in {time.perf_counter() - started:.1f}s")
+    for table, count in counts.items():
+        print(f"  {table:<14} {count:>9}")
+
+
+if __name__ == '__main__':
+    main()
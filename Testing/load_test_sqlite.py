@@ -0,0 +1,182 @@
+'''
+Mixed read/write load test - compares SQLite engine profiles (see SQLITE_PROFILES in app.py),
+with and without the read-only pool for GET requests (READ_POOL).
+
+    python Testing/load_test_sqlite.py
+    python Testing/load_test_sqlite.py --profiles legacy production --workers 4 --readers 16 --writers 4 --seconds 20
+    python Testing/load_test_sqlite.py --profiles production --read-pool off on
+
+For each profile it seeds a scratch database, starts --workers server processes
+(like gunicorn workers, each its own connection pool) and drives them with reader
+threads (item lookups, catalog pages, patron pages) and writer threads (checkout ->
+checkin -> reshelve cycles on their own items). Reports requests/s, p50/p99 latency
+and errors per request kind. --read-pool profile leaves READ_POOL at the profile's default.
+'''
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+import urllib.error
+import urllib.request
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(TESTING_DIR)
+
+SERVER = '''
+import sys
+sys.path.insert(0, {repo!r})
+from app import app
+app.run(host="127.0.0.1", port={port}, threaded=True, use_reloader=False)
+'''
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def build_database(path: str, num_items: int, num_patrons: int):
+    '''Seeds the scratch database in a child process so this one never imports app'''
+    code = (
+        "import sys; sys.path[:0] = [{repo!r}, {testing!r}]\n"
+        "import app as bookmarked\n"
+        "from benchmark_checkout import seed\n"
+        "with bookmarked.app.app_context():\n"
+        "    seed(bookmarked, {items}, {patrons}, 3)\n"
+    ).format(repo=REPO_ROOT, testing=TESTING_DIR, items=num_items, patrons=num_patrons)
+    env = dict(os.environ, BOOKMARKED_DB_PATH=path, BOOKMARKED_SQLITE_PROFILE='legacy')
+    subprocess.run([sys.executable, '-c', code], env=env, check=True)
+
+
+def request(base: str, method: str, path: str, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base + path, data=data, method=method,
+                                 headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return resp.status, json.loads(resp.read() or b'null')
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def run_profile(profile: str, read_pool: str, args) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f'bookmarked-load-{profile}-')
+    db = os.path.join(workdir, 'load.db')
+    build_database(db, args.items, args.writers + 10)
+
+    env = dict(os.environ, BOOKMARKED_DB_PATH=db, BOOKMARKED_SQLITE_PROFILE=profile)
+    env.pop('BOOKMARKED_READ_POOL', None)
+    if read_pool != 'profile':
+        env['BOOKMARKED_READ_POOL'] = '1' if read_pool == 'on' else '0'
+    ports = [free_port() for _ in range(args.workers)]
+    servers = [
+        subprocess.Popen([sys.executable, '-c', SERVER.format(repo=REPO_ROOT, port=port)],
+                         env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for port in ports
+    ]
+    bases = [f'http://127.0.0.1:{port}' for port in ports]
+
+    try:
+        for base in bases: # wait for every worker to accept connections
+            for _ in range(100):
+                try:
+                    request(base, 'GET', '/dbinfo')
+                    break
+                except OSError:
+                    time.sleep(0.1)
+
+        results = {}
+        lock = threading.Lock()
+        stop = time.monotonic() + args.seconds
+
+        def record(kind: str, elapsed: float, ok: bool):
+            with lock:
+                latencies, errors = results.setdefault(kind, ([], [0]))
+                latencies.append(elapsed * 1000)
+                if not ok:
+                    errors[0] += 1
+
+        def timed(kind, base, method, path, body=None):
+            start = time.perf_counter()
+            try:
+                status, data = request(base, method, path, body)
+                ok = status < 400 and (not isinstance(data, dict) or data.get('ok', True))
+            except OSError:
+                ok = False
+            record(kind, time.perf_counter() - start, ok)
+
+        def reader(n: int):
+            rng = random.Random(n)
+            while time.monotonic() < stop:
+                base = rng.choice(bases)
+                roll = rng.random()
+                if roll < 0.6:
+                    timed('GET /api/item', base, 'GET', f'/api/item/{rng.randint(1, args.items)}')
+                elif roll < 0.85:
+                    timed('GET /api/items', base, 'GET', f'/api/items?limit=50&q=Item%20{rng.randint(1, 99)}')
+                else:
+                    timed('GET /api/patrons', base, 'GET', '/api/patrons?limit=50')
+
+        def writer(n: int):
+            rng = random.Random(1000 + n)
+            patron_id = n + 1
+            # each writer cycles through its own slice of the catalog
+            my_items = list(range(args.items - (n + 1) * 50 + 1, args.items - n * 50 + 1))
+            while time.monotonic() < stop:
+                base = rng.choice(bases)
+                item_id = rng.choice(my_items)
+                timed('POST /checkout', base, 'POST', '/checkout', {"patron_id": patron_id, "item_ids": [item_id]})
+                timed('POST /checkin', base, 'POST', '/checkin', {"item_id": str(item_id), "branch_id": "1"})
+                timed('POST /api/reshelve', base, 'POST', '/api/reshelve', {"item_id": item_id})
+
+        threads = [threading.Thread(target=reader, args=(n,)) for n in range(args.readers)]
+        threads += [threading.Thread(target=writer, args=(n,)) for n in range(args.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+
+def percentile(values, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', nargs='+', default=['legacy', 'production'])
+    parser.add_argument('--read-pool', nargs='+', choices=['profile', 'on', 'off'], default=['profile'])
+    parser.add_argument('--items', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=16)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=int, default=15)
+    args = parser.parse_args()
+
+    print(f"{'profile':<11} {'read pool':<9} {'request':<18} {'count':>7} {'req/s':>7} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'errors':>7}")
+    for profile in args.profiles:
+        for read_pool in args.read_pool:
+            results = run_profile(profile, read_pool, args)
+            for kind in sorted(results):
+                latencies, errors = results[kind]
+                print(f"{profile:<11} {read_pool:<9} {kind:<18} {len(latencies):>7} "
+                      f"{len(latencies) / args.seconds:>7.0f} {statistics.median(latencies):>8.1f} "
+                      f"{percentile(latencies, 0.99):>8.1f} {errors[0]:>7}")
+
+
+if __name__ == '__main__':
+    main()
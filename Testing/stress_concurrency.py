@@ -0,0 +1,170 @@
+'''
+Concurrency stress test - many processes check out, check in and reshelve (one at a
+time and in bulk), reserve and cancel the same handful of items at once, then the
+database is checked for states that only a lost race can produce.
+
+    python Testing/stress_concurrency.py
+    python Testing/stress_concurrency.py --processes 16 --items 8 --ops 300
+
+Every process imports app on its own (like a gunicorn worker with its own connection
+pool) against one scratch database and waits on a barrier so they all start together.
+Exits with status 1 if any invariant is broken:
+  - an item with two open loans (double checkout)
+  - an item with two active holds (double reservation)
+  - LibraryItem.ActiveTransactionID not pointing at the item's open loan
+  - PatronStanding's loan or hold count not matching the patron's open loans or active holds
+  - ReshelveQueue not holding exactly the 'checked in' items
+'''
+import os
+import sys
+import random
+import argparse
+import tempfile
+import multiprocessing
+from collections import Counter
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(TESTING_DIR)
+
+INVARIANTS = {
+    'items with more than one open loan': """
+        SELECT c.ItemID, count(*) FROM Checkout c
+        LEFT JOIN "Return" r ON r.TransactionID = c.TransactionID
+        WHERE r.TransactionID IS NULL
+        GROUP BY c.ItemID HAVING count(*) > 1
+    """,
+    'items with more than one active hold': """
+        SELECT ReservedItem, count(*) FROM Reservation
+        WHERE Active = 1
+        GROUP BY ReservedItem HAVING count(*) > 1
+    """,
+    'items whose ActiveTransactionID is not their open loan': """
+        SELECT i.ItemID, i.ActiveTransactionID, c.TransactionID FROM LibraryItem i
+        LEFT JOIN (
+            SELECT c.ItemID, c.TransactionID FROM Checkout c
+            LEFT JOIN "Return" r ON r.TransactionID = c.TransactionID
+            WHERE r.TransactionID IS NULL
+        ) c ON c.ItemID = i.ItemID
+        WHERE i.ActiveTransactionID IS NOT c.TransactionID
+    """,
+    'patrons whose PatronStanding.OpenLoans is off': """
+        SELECT s.PatronID, s.OpenLoans, count(c.TransactionID) FROM PatronStanding s
+        LEFT JOIN LibraryItem i ON i.ActiveTransactionID IS NOT NULL
+        LEFT JOIN Checkout c ON c.TransactionID = i.ActiveTransactionID AND c.PatronID = s.PatronID
+        GROUP BY s.PatronID HAVING s.OpenLoans != count(c.TransactionID)
+    """,
+    'patrons whose PatronStanding.ActiveHolds is off': """
+        SELECT s.PatronID, s.ActiveHolds, count(r.ReservationID) FROM PatronStanding s
+        LEFT JOIN Reservation r ON r.ReservingPatron = s.PatronID AND r.Active = 1
+        GROUP BY s.PatronID HAVING s.ActiveHolds != count(r.ReservationID)
+    """,
+    'items whose reshelve queue entry disagrees with Status': """
+        SELECT i.ItemID, i.Status, q.ItemID FROM LibraryItem i
+        LEFT JOIN ReshelveQueue q ON q.ItemID = i.ItemID
+        WHERE (i.Status = 'checked in') != (q.ItemID IS NOT NULL)
+    """,
+}
+
+
+def worker(n: int, args, barrier, results):
+    '''One desk: random circulation calls against the shared item pool'''
+    sys.path.insert(0, REPO_ROOT)
+    import app as bookmarked
+
+    client = bookmarked.app.test_client()
+    rng = random.Random(n)
+    patron_id = n + 1
+    my_holds = []
+    outcomes = Counter()
+
+    barrier.wait()
+    for _ in range(args.ops):
+        item_id = rng.randint(1, args.items)
+        roll = rng.random()
+        if roll < 0.35:
+            kind, resp = 'checkout', client.post('/checkout', json={"patron_id": patron_id, "item_ids": [item_id]})
+        elif roll < 0.55:
+            kind, resp = 'checkin', client.post('/checkin', json={"item_id": str(item_id), "branch_id": "1"})
+        elif roll < 0.6:
+            kind, resp = 'bulk checkin', client.post('/api/checkin/bulk', json={
+                "branch_id": 1, "item_ids": [rng.randint(1, args.items) for _ in range(3)]})
+        elif roll < 0.7:
+            kind, resp = 'reshelve', client.post('/api/reshelve', json={"item_id": item_id})
+        elif roll < 0.75:
+            kind, resp = 'bulk reshelve', client.post('/api/reshelve/bulk', json={
+                "item_ids": [rng.randint(1, args.items) for _ in range(3)]})
+        elif roll < 0.9 or not my_holds:
+            kind, resp = 'reserve', client.post('/api/reserve', json={"patron_id": patron_id, "item_id": item_id})
+            data = resp.get_json(silent=True) or {}
+            if data.get('reservation_id'):
+                my_holds.append(data['reservation_id'])
+        else:
+            kind, resp = 'cancel', client.post('/api/cancel_reservation',
+                                               json={"reservation_id": str(my_holds.pop(rng.randrange(len(my_holds))))})
+        data = resp.get_json(silent=True) or {}
+        if resp.status_code >= 500:
+            outcomes[f'{kind} error {resp.status_code}'] += 1
+        elif resp.status_code == 409:
+            outcomes[f'{kind} conflict'] += 1
+        elif data.get('ok'):
+            outcomes[f'{kind} ok'] += 1
+        else:
+            outcomes[f'{kind} refused'] += 1
+    results.put(outcomes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=12)
+    parser.add_argument('--items', type=int, default=6, help='size of the contested item pool')
+    parser.add_argument('--ops', type=int, default=200, help='requests per process')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bookmarked-stress-')
+    os.environ['BOOKMARKED_DB_PATH'] = os.path.join(workdir, 'stress.db')
+    sys.path.insert(0, REPO_ROOT)
+    sys.path.insert(0, TESTING_DIR)
+    import app as bookmarked
+    from benchmark_checkout import seed
+    from sqlalchemy import text
+
+    with bookmarked.app.app_context():
+        seed(bookmarked, args.items, args.processes, 0)
+
+    ctx = multiprocessing.get_context('spawn') # fresh interpreter per desk, no shared engine
+    barrier = ctx.Barrier(args.processes)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(n, args, barrier, results)) for n in range(args.processes)]
+    for proc in procs:
+        proc.start()
+    totals = Counter()
+    for _ in procs:
+        totals.update(results.get())
+    for proc in procs:
+        proc.join()
+
+    print(f"db: {os.environ['BOOKMARKED_DB_PATH']}  processes: {args.processes}  items: {args.items}  "
+          f"ops: {args.processes * args.ops}")
+    for kind in sorted(totals):
+        print(f"  {kind:<22} {totals[kind]:>6}")
+
+    failed = False
+    with bookmarked.app.app_context():
+        for name, sql in INVARIANTS.items():
+            rows = bookmarked.database.session.execute(text(sql)).all()
+            if rows:
+                failed = True
+                print(f"FAIL {name}: {rows[:10]}")
+    errors = sum(count for kind, count in totals.items() if ' error ' in kind)
+    if errors:
+        failed = True
+        print(f"FAIL {errors} request(s) ended in a server error")
+
+    print()
+    if failed:
+        sys.exit(1)
+    print("No double checkouts or double reservations; counters, loan pointers and reshelve queue agree")
+
+
+if __name__ == '__main__':
+    main()
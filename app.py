@@ -1,22 +1,265 @@
 import os
-from flask import Flask, request, jsonify, render_template
+import re
+import time
+import json
+import io
+import csv
+import zlib
+import base64
+import random
+import threading
+import click
+from collections import Counter
+from typing import NamedTuple, Optional
+from functools import wraps
+from urllib.parse import quote
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime,date,timedelta
-from sqlalchemy import func, CheckConstraint, or_
+from flask_sqlalchemy.session import Session
+from datetime import datetime,date,timedelta,timezone
+from sqlalchemy import event, func, CheckConstraint, or_, and_, text, bindparam, tuple_, literal_column, insert, update, select
+from sqlalchemy.exc import OperationalError, IntegrityError
+from sqlalchemy.orm import object_session
 
 app = Flask(__name__)
 
 # Create db route
 db_dir = app.instance_path
 os.makedirs(db_dir, exist_ok=True)
-db_path = os.path.join(db_dir, 'sprint3db.db') 
+db_path = os.environ.get('BOOKMARKED_DB_PATH') or os.path.join(db_dir, 'sprint3db.db') # env override is for benchmarks/scratch copies
 
 # Configure database
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
+# Archived loan history (see archive_loans) goes to this file, attached as "archive", when set -
+# otherwise to archive tables in the main database
+app.config['ARCHIVE_DB_PATH'] = os.environ.get('BOOKMARKED_ARCHIVE_PATH') or None
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# SQLite engine profiles - pick one with BOOKMARKED_SQLITE_PROFILE (default: production)
+# production: WAL so readers never wait on a checkout commit, NORMAL sync (safe in WAL,
+#             one fsync per checkpoint instead of per commit), 5s busy wait, 256MB mmap,
+#             64MB page cache, temp tables in memory. WAL needs the db on a local disk.
+# legacy:     SQLite defaults (rollback journal) - what the app ran with before
+SQLITE_PROFILES = {
+    'production': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'mmap_size': 268435456,
+            'cache_size': -65536,
+            'temp_store': 'MEMORY',
+        },
+        'pool_size': 10,
+        'max_overflow': 20,
+        'busy_retries': 5,
+        'read_pool': True,
+    },
+    'legacy': {
+        'pragmas': {},
+        'pool_size': 5,
+        'max_overflow': 10,
+        'busy_retries': 0,
+        'read_pool': False,
+    },
+}
+app.config['SQLITE_PROFILE'] = os.environ.get('BOOKMARKED_SQLITE_PROFILE', 'production')
+sqlite_profile = SQLITE_PROFILES[app.config['SQLITE_PROFILE']]
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': sqlite_profile['pool_size'],
+    'max_overflow': sqlite_profile['max_overflow'],
+}
+
+# Read pool - GET/HEAD requests to views that don't write (see retry_on_busy) run on a second
+# engine, the "reader" bind, whose connections open the file with mode=ro and PRAGMA
+# query_only. Long lists and exports then never hold one of the writer's connections, and
+# in WAL each read still sees the last commit. On by default with the production profile;
+# BOOKMARKED_READ_POOL=0/1 overrides. Scale reads across cores with more worker processes.
+app.config['READ_POOL'] = os.environ.get('BOOKMARKED_READ_POOL', '1' if sqlite_profile['read_pool'] else '0') != '0'
+READ_ONLY_URI = f"sqlite:///file:{quote(db_path)}?mode=ro&uri=true"
+if app.config['READ_POOL']:
+    app.config['SQLALCHEMY_BINDS'] = {'reader': {'url': READ_ONLY_URI, **app.config['SQLALCHEMY_ENGINE_OPTIONS']}}
+
+def reads_from_reader() -> bool:
+    '''TRUE inside a GET/HEAD request whose view doesn't write'''
+    if not app.config['READ_POOL'] or not has_request_context() or request.method not in ('GET', 'HEAD'):
+        return False
+    view = app.view_functions.get(request.endpoint)
+    return view is not None and not getattr(view, 'writes', False)
+
+class RoutingSession(Session):
+    '''database.session - statements of read-only requests go to the reader bind, the rest to the writer'''
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and reads_from_reader():
+            return self._db.engines['reader']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
 # Create the SQLAlchemy instance linked to the app
-database = SQLAlchemy(app)
+database = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record, read_only: bool = False):
+    '''Runs the profile's PRAGMAs on every new pooled connection'''
+    cursor = dbapi_connection.cursor()
+    if app.config['ARCHIVE_DB_PATH']:
+        # attached first, so journal_mode below applies to the archive file too;
+        # the read pool opens it read-only like the main file (its connections take URI names)
+        archive = app.config['ARCHIVE_DB_PATH']
+        if read_only:
+            archive = f"file:{quote(archive)}?mode=ro"
+        cursor.execute("ATTACH DATABASE ? AS archive", (archive,))
+    for pragma, value in sqlite_profile['pragmas'].items():
+        if read_only and pragma == 'journal_mode':
+            continue # the writer sets it, a read-only connection can't
+        cursor.execute(f"PRAGMA {pragma} = {value}")
+    if read_only:
+        cursor.execute("PRAGMA query_only = 1")
+    cursor.close()
+
+def apply_read_only_pragmas(dbapi_connection, connection_record):
+    apply_sqlite_pragmas(dbapi_connection, connection_record, read_only=True)
+
+def read_engine():
+    '''The reader bind's engine when the read pool is on, else the writer's'''
+    return database.engines['reader'] if app.config['READ_POOL'] else database.engine
+
+with app.app_context():
+    event.listen(database.engine, 'connect', apply_sqlite_pragmas)
+    if app.config['READ_POOL']:
+        event.listen(database.engines['reader'], 'connect', apply_read_only_pragmas)
+
+
+def is_sqlite_busy(error: Exception) -> bool:
+    '''TRUE for "database is locked"/"database is busy" errors, which are worth retrying'''
+    message = str(getattr(error, 'orig', error)).lower()
+    return isinstance(error, OperationalError) and ('locked' in message or 'busy' in message)
+
+def retry_on_busy(view):
+    '''
+    Re-runs a writing route when SQLite reports the database busy, with exponential
+    backoff plus jitter. busy_timeout covers most waits; this catches the cases it can't,
+    like a read transaction that has to upgrade to a write after another worker committed.
+    '''
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        attempts = sqlite_profile['busy_retries']
+        for attempt in range(attempts + 1):
+            try:
+                return view(*args, **kwargs)
+            except OperationalError as e:
+                database.session.rollback()
+                if not is_sqlite_busy(e) or attempt == attempts:
+                    raise
+                app.logger.warning(f"SQLite busy on {request.path}, retry {attempt + 1}/{attempts}")
+                time.sleep(0.02 * (2 ** attempt) * (0.5 + random.random()))
+    wrapper.writes = True # keeps GET routes that write off the read pool
+    return wrapper
+
+#### --- Request Metrics --- ####
+# Per-route query count, SQL time and wall time, served in Prometheus text format on /metrics.
+# Numbers are per process - with several gunicorn workers, scrape each one (or sum them).
+app.config['METRICS_ENABLED'] = os.environ.get('BOOKMARKED_METRICS', '1') != '0'
+# log a request that runs one statement shape more than this many times (0 = off)
+app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('BOOKMARKED_N_PLUS_ONE_THRESHOLD', 0))
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+class Histogram:
+    '''Cumulative Prometheus histogram, one series per (method, route)'''
+    def __init__(self, name: str, help_text: str, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels: tuple, value: float):
+        counts, total = self.series.get(labels, ([0] * len(self.buckets), [0, 0.0]))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        total[0] += 1
+        total[1] += value
+        self.series[labels] = (counts, total)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for (method, route), (counts, total) in sorted(self.series.items()):
+            labels = f'method="{method}",route="{route}"'
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {total[0]}')
+            lines.append(f'{self.name}_count{{{labels}}} {total[0]}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total[1]:.6f}')
+        return lines
+
+REQUEST_DURATION = Histogram('bookmarked_request_duration_seconds', 'Wall time per request', DURATION_BUCKETS)
+REQUEST_SQL_DURATION = Histogram('bookmarked_request_sql_duration_seconds', 'Time spent in SQL per request', DURATION_BUCKETS)
+REQUEST_SQL_QUERIES = Histogram('bookmarked_request_sql_queries', 'SQL statements per request', QUERY_BUCKETS)
+n_plus_one_total = Counter() # (method, route) -> requests flagged
+metrics_lock = threading.Lock()
+
+IN_LIST = re.compile(r'\(\?(?:,\s*\?)+\)')
+
+def statement_shape(statement: str) -> str:
+    '''Statement text with expanded IN (?, ?, ...) lists folded, so one query shape is one key'''
+    return IN_LIST.sub('(?...)', ' '.join(statement.split()))
+
+def before_sql(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_queries' in g:
+        conn.info['sql_started'] = time.perf_counter()
+
+def after_sql(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('sql_started', None)
+    if started is None or not has_request_context() or 'sql_queries' not in g:
+        return
+    g.sql_queries += 1
+    g.sql_time += time.perf_counter() - started
+    if app.config['N_PLUS_ONE_THRESHOLD']:
+        g.sql_shapes[statement_shape(statement)] += 1
+
+with app.app_context():
+    for bound_engine in database.engines.values(): # the writer and, when on, the read pool
+        event.listen(bound_engine, 'before_cursor_execute', before_sql)
+        event.listen(bound_engine, 'after_cursor_execute', after_sql)
+
+@app.before_request
+def start_request_metrics():
+    if not app.config['METRICS_ENABLED']:
+        return
+    g.request_started = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_time = 0.0
+    g.sql_shapes = Counter()
+
+@app.teardown_request
+def record_request_metrics(error=None):
+    '''Runs after the response is sent (after the last row for streamed responses)'''
+    if 'request_started' not in g:
+        return
+    labels = (request.method, request.url_rule.rule if request.url_rule else 'unmatched')
+    elapsed = time.perf_counter() - g.request_started
+    with metrics_lock:
+        REQUEST_DURATION.observe(labels, elapsed)
+        REQUEST_SQL_DURATION.observe(labels, g.sql_time)
+        REQUEST_SQL_QUERIES.observe(labels, g.sql_queries)
+
+    threshold = app.config['N_PLUS_ONE_THRESHOLD']
+    repeated = [(count, shape) for shape, count in g.sql_shapes.items() if threshold and count > threshold]
+    if repeated:
+        with metrics_lock:
+            n_plus_one_total[labels] += 1
+        for count, shape in sorted(repeated, reverse=True):
+            app.logger.warning(f"Possible N+1 on {labels[0]} {labels[1]}: {count}x {shape[:300]}")
+
+def render_metrics() -> str:
+    with metrics_lock:
+        lines = REQUEST_DURATION.render() + REQUEST_SQL_DURATION.render() + REQUEST_SQL_QUERIES.render()
+        lines += ["# HELP bookmarked_n_plus_one_total Requests that repeated one SQL statement shape "
+                  "more than N_PLUS_ONE_THRESHOLD times",
+                  "# TYPE bookmarked_n_plus_one_total counter"]
+        for (method, route), count in sorted(n_plus_one_total.items()):
+            lines.append(f'bookmarked_n_plus_one_total{{method="{method}",route="{route}"}} {count}')
+    return '\n'.join(lines) + '\n'
 
 #### --- Database Models --- ####
 #Created by Jake Rouse
@@ -39,6 +282,7 @@ class ItemType(database.Model):
 #Valid values for Status include:
 #available, checked in, checked out, reserved, renewed once, renewed twice
 #Note: spelling and capitaliztion must be as specified.
+ITEM_STATUSES = ('available', 'checked in', 'checked out', 'reserved', 'renewed once', 'renewed twice')
 
 class LibraryItem(database.Model):
     __tablename__ = 'LibraryItem'
@@ -50,6 +294,10 @@ class LibraryItem(database.Model):
     ItemTitle = database.Column(database.String(50))
     Status = database.Column(database.String(20))
     ShelfCode = database.Column(database.String(5))
+    Author = database.Column(database.Text, default='no data')
+    #Open loan for this item (NULL when it is not checked out). Set by checkout, cleared by checkin,
+    #so finding an item's loan is a key lookup instead of Checkout LEFT JOIN Return ... IS NULL
+    ActiveTransactionID = database.Column(database.Integer, database.ForeignKey('Checkout.TransactionID', use_alter=True))
 
     __table_args__ = (CheckConstraint("Status IN ('available', 'checked in', 'checked out', 'reserved', 'renewed once', 'renewed twice')", name = "valid_status"),)
 
@@ -61,7 +309,7 @@ class Patron(database.Model):
     PatronLN = database.Column(database.String(50))
     AccountExpDate = database.Column(database.Date)
     FeesOwed = database.Column(database.Numeric(10, 2))
-    ItemsCheckedOut = database.Column(database.Integer)
+    ItemsCheckedOut = database.Column(database.Integer) #no longer written - see PatronStanding.OpenLoans
 
 #Checkout date needs to be in the format of "2025-11-04"
 
@@ -89,6 +337,40 @@ class Reservation(database.Model):
     ReservedItem = database.Column(database.Integer, database.ForeignKey('LibraryItem.ItemID'))
     DateReserved = database.Column(database.Date)
     Active = database.Column(database.Boolean)
+    ExpiresAt = database.Column(database.Date) #last pickup day - set when the reserved item is checked in
+
+#What each patron would owe if every overdue loan came back on ComputedOn - filled by
+#accrue_fines() (flask accrue-fines), not by checkin. FeesOwed only holds settled fines.
+class ProjectedFine(database.Model):
+    __tablename__ = 'ProjectedFine'
+
+    PatronID = database.Column(database.Integer, database.ForeignKey('Patron.PatronID'), primary_key=True)
+    OverdueLoans = database.Column(database.Integer)
+    AccruedFines = database.Column(database.Numeric(10, 2))
+    ComputedOn = database.Column(database.Date)
+
+#Items waiting on the reshelve cart - exactly the items whose Status is 'checked in'.
+#Written next to every Status change into or out of 'checked in' (enqueue_reshelve /
+#dequeue_reshelve), so listing the cart never touches Checkout or Return history.
+class ReshelveQueue(database.Model):
+    __tablename__ = 'ReshelveQueue'
+
+    ItemID = database.Column(database.Integer, database.ForeignKey('LibraryItem.ItemID'), primary_key=True)
+    QueuedOn = database.Column(database.Date)
+    BranchID = database.Column(database.Integer, database.ForeignKey('LibraryBranch.BranchID')) #where it was returned, NULL if it came off the holds shelf
+
+#What checkout needs to know about a patron, in one row: open loans, active holds, fees and
+#expiry. Kept exact by PATRON_STANDING_TRIGGERS on Patron, Checkout, Return and Reservation -
+#no route writes it - and rebuilt from history by rebuild_patron_standing().
+#It is its own table so circulation doesn't bump Patron's TableVersion (the /patrons ETag).
+class PatronStanding(database.Model):
+    __tablename__ = 'PatronStanding'
+
+    PatronID = database.Column(database.Integer, database.ForeignKey('Patron.PatronID'), primary_key=True)
+    OpenLoans = database.Column(database.Integer, nullable=False, default=0)
+    ActiveHolds = database.Column(database.Integer, nullable=False, default=0)
+    FeesOwed = database.Column(database.Numeric(10, 2), nullable=False, default=0)
+    AccountExpDate = database.Column(database.Date) #expired is AccountExpDate < today, so it's worked out on read
 
 
 # should we have account expiration date or calculate expiration on account creation dates?? - we can check the account expiration date in the patron table. That's how I populated the db. Your function below looks good. Also berker this is fire nice fing job. ~ Luke
@@ -98,20 +380,872 @@ class Reservation(database.Model):
 #     days_since_account_created = (date.today() - patron.AccountCreatedDate).days
 #     return days_since_account_created >= 365
 
+#### --- Schema Upgrades --- ####
+# create_all() only creates tables that are missing, so anything added to an
+# existing database (columns, search index, triggers) is applied here.
+# Every step checks before it changes anything, so this is safe to run on every start.
+
+def column_exists(table: str, column: str) -> bool:
+    rows = database.session.execute(text(f'PRAGMA table_info("{table}")')).all()
+    return any(row[1] == column for row in rows)
+
+def index_names() -> set:
+    rows = database.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))
+    return {row[0] for row in rows}
+
+def table_exists(name: str) -> bool:
+    return database.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": name}
+    ).first() is not None
+
+
+#Full-text index over titles and authors. It is an external content table, so the
+#text is not stored twice - the triggers keep it in step with LibraryItem.
+CATALOG_SEARCH_TABLE = 'LibraryItemSearch'
+
+CATALOG_SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS LibraryItemSearch_insert AFTER INSERT ON LibraryItem BEGIN
+        INSERT INTO LibraryItemSearch(rowid, ItemTitle, Author)
+        VALUES (new.ItemID, new.ItemTitle, new.Author);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS LibraryItemSearch_delete AFTER DELETE ON LibraryItem BEGIN
+        INSERT INTO LibraryItemSearch(LibraryItemSearch, rowid, ItemTitle, Author)
+        VALUES ('delete', old.ItemID, old.ItemTitle, old.Author);
+    END
+    """,
+    # only fires when the searchable text changes, not on every Status update
+    """
+    CREATE TRIGGER IF NOT EXISTS LibraryItemSearch_update AFTER UPDATE OF ItemTitle, Author ON LibraryItem BEGIN
+        INSERT INTO LibraryItemSearch(LibraryItemSearch, rowid, ItemTitle, Author)
+        VALUES ('delete', old.ItemID, old.ItemTitle, old.Author);
+        INSERT INTO LibraryItemSearch(rowid, ItemTitle, Author)
+        VALUES (new.ItemID, new.ItemTitle, new.Author);
+    END
+    """,
+]
+
+def catalog_search_enabled() -> bool:
+    '''TRUE when the FTS5 index exists - set by upgrade_schema, else looked up once per process'''
+    if 'CATALOG_FTS' not in app.config:
+        app.config['CATALOG_FTS'] = table_exists(CATALOG_SEARCH_TABLE)
+    return app.config['CATALOG_FTS']
+
+def build_catalog_search_index() -> bool:
+    '''
+    Creates the FTS5 catalog index and its triggers if they are missing.
+    Returns FALSE if this SQLite build has no FTS5 (search then falls back to LIKE)
+    '''
+    created = not table_exists(CATALOG_SEARCH_TABLE)
+    try:
+        database.session.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {CATALOG_SEARCH_TABLE} USING fts5("
+            "ItemTitle, Author, content='LibraryItem', content_rowid='ItemID', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        ))
+    except OperationalError as e:
+        database.session.rollback()
+        app.logger.warning(f"FTS5 unavailable, catalog search will use LIKE: {e}")
+        return False
+
+    for ddl in CATALOG_SEARCH_TRIGGERS:
+        database.session.execute(text(ddl))
+
+    if created: # index rows that were in the table before the index existed
+        rebuild_catalog_search_index()
+    return True
+
+def rebuild_catalog_search_index():
+    database.session.execute(text(
+        f"INSERT INTO {CATALOG_SEARCH_TABLE}({CATALOG_SEARCH_TABLE}) VALUES ('rebuild')"
+    ))
+
+
+#Secondary indexes. SQLite has no CREATE INDEX in the models above, so they live here.
+SCHEMA_INDEXES = [
+    # patron name search + paging, see patron_name_key()
+    "CREATE INDEX IF NOT EXISTS ix_Patron_name ON Patron("
+    "ifnull(PatronLN, '') COLLATE NOCASE, ifnull(PatronFN, '') COLLATE NOCASE, PatronID)",
+    # every item that is out right now, see LibraryItem.ActiveTransactionID - a loan is open on one item only
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_LibraryItem_active_loan ON LibraryItem(ActiveTransactionID) "
+    "WHERE ActiveTransactionID IS NOT NULL",
+    # at most one active hold per item, enforced even when two desks reserve at once
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_Reservation_active_item ON Reservation(ReservedItem) "
+    "WHERE Active = 1",
+    # expire_old_reservations() - only holds that are waiting on the pickup shelf
+    "CREATE INDEX IF NOT EXISTS ix_Reservation_expiry ON Reservation(ExpiresAt) "
+    "WHERE Active = 1 AND ExpiresAt IS NOT NULL",
+    # loan history per item (latest loan, returns since a hold) and per patron
+    "CREATE INDEX IF NOT EXISTS ix_Checkout_item ON Checkout(ItemID, TransactionID)",
+    "CREATE INDEX IF NOT EXISTS ix_Checkout_patron ON Checkout(PatronID, TransactionID)",
+    # active hold on an item / a patron's holds
+    "CREATE INDEX IF NOT EXISTS ix_Reservation_item ON Reservation(ReservedItem, Active)",
+    "CREATE INDEX IF NOT EXISTS ix_Reservation_patron ON Reservation(ReservingPatron, Active)",
+    # /api/items ordering, plain and filtered by type or status
+    "CREATE INDEX IF NOT EXISTS ix_LibraryItem_title ON LibraryItem(ItemTitle, ItemID)",
+    "CREATE INDEX IF NOT EXISTS ix_LibraryItem_type ON LibraryItem(ItemType, ItemTitle, ItemID)",
+    "CREATE INDEX IF NOT EXISTS ix_LibraryItem_status ON LibraryItem(Status, ItemTitle, ItemID)",
+]
+
+#Change counters for conditional GETs (see conditional_get). Every insert/update/delete
+#on a versioned table bumps its row, so the ETag changes exactly when the data can have.
+#Counters start at a random value so a rebuilt database never reuses an old ETag.
+VERSIONED_TABLES = ('ItemType', 'LibraryBranch', 'Patron')
+
+def build_table_versions():
+    database.session.execute(text(
+        "CREATE TABLE IF NOT EXISTS TableVersion ("
+        "TableName TEXT PRIMARY KEY, Version INTEGER NOT NULL, ModifiedAt INTEGER NOT NULL)"
+    ))
+    for table in VERSIONED_TABLES:
+        database.session.execute(text(
+            "INSERT OR IGNORE INTO TableVersion (TableName, Version, ModifiedAt) "
+            "VALUES (:table, abs(random() % 1000000000), CAST(strftime('%s', 'now') AS INTEGER))"
+        ), {"table": table})
+        for change in ('INSERT', 'UPDATE', 'DELETE'):
+            database.session.execute(text(f"""
+                CREATE TRIGGER IF NOT EXISTS TableVersion_{table}_{change.lower()} AFTER {change} ON "{table}" BEGIN
+                    UPDATE TableVersion SET Version = Version + 1, ModifiedAt = CAST(strftime('%s', 'now') AS INTEGER)
+                    WHERE TableName = '{table}';
+                END
+            """))
+
+def rebuild_active_loans():
+    '''Recomputes LibraryItem.ActiveTransactionID from Checkout/Return history'''
+    database.session.execute(text("""
+        UPDATE LibraryItem SET ActiveTransactionID = (
+            SELECT max(c.TransactionID)
+            FROM Checkout c
+            LEFT JOIN "Return" r ON r.TransactionID = c.TransactionID
+            WHERE c.ItemID = LibraryItem.ItemID AND r.TransactionID IS NULL
+        )
+    """))
+
+
+def rebuild_reshelve_queue():
+    '''Refills ReshelveQueue with every 'checked in' item, dated from its latest Return'''
+    database.session.execute(text("DELETE FROM ReshelveQueue"))
+    database.session.execute(text("""
+        INSERT INTO ReshelveQueue (ItemID, QueuedOn, BranchID)
+        SELECT i.ItemID, r.DateReturned, r.BranchReturnedTo
+        FROM LibraryItem i
+        LEFT JOIN "Return" r ON r.TransactionID = (
+            SELECT max(c.TransactionID) FROM Checkout c WHERE c.ItemID = i.ItemID
+        )
+        WHERE i.Status = 'checked in'
+    """))
+
+
+#Triggers behind PatronStanding. A loan is open while it has no Return row, so loans are
+#counted on Checkout insert/delete and un-counted on Return insert (and back on delete,
+#e.g. archive_loans deletes the Return before its Checkout). Holds count while Active.
+PATRON_STANDING_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS PatronStanding_patron_insert AFTER INSERT ON Patron BEGIN
+        INSERT OR REPLACE INTO PatronStanding (PatronID, OpenLoans, ActiveHolds, FeesOwed, AccountExpDate)
+        VALUES (new.PatronID, 0, 0, coalesce(new.FeesOwed, 0), new.AccountExpDate);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PatronStanding_patron_update AFTER UPDATE OF FeesOwed, AccountExpDate ON Patron BEGIN
+        UPDATE PatronStanding SET FeesOwed = coalesce(new.FeesOwed, 0), AccountExpDate = new.AccountExpDate
+        WHERE PatronID = new.PatronID;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PatronStanding_patron_delete AFTER DELETE ON Patron BEGIN
+        DELETE FROM PatronStanding WHERE PatronID = old.PatronID;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PatronStanding_checkout_insert AFTER INSERT ON Checkout
+    WHEN NOT EXISTS (SELECT 1 FROM "Return" WHERE TransactionID = new.TransactionID) BEGIN
+        UPDATE PatronStanding SET OpenLoans = OpenLoans + 1 WHERE PatronID = new.PatronID;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PatronStanding_checkout_delete AFTER DELETE ON Checkout
+    WHEN NOT EXISTS (SELECT 1 FROM "Return" WHERE TransactionID = old.TransactionID) BEGIN
+        UPDATE PatronStanding SET OpenLoans = OpenLoans - 1 WHERE PatronID = old.PatronID;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PatronStanding_checkout_update AFTER UPDATE OF PatronID ON Checkout
+    WHEN old.PatronID IS NOT new.PatronID
+     AND NOT EXISTS (SELECT 1 FROM "Return" WHERE TransactionID = new.TransactionID) BEGIN
+        UPDATE PatronStanding SET OpenLoans = OpenLoans - 1 WHERE PatronID = old.PatronID;
+        UPDATE PatronStanding SET OpenLoans = OpenLoans + 1 WHERE PatronID = new.PatronID;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PatronStanding_return_insert AFTER INSERT ON "Return" BEGIN
+        UPDATE PatronStanding SET OpenLoans = OpenLoans - 1
+        WHERE PatronID = (SELECT PatronID FROM Checkout WHERE TransactionID = new.TransactionID);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PatronStanding_return_delete AFTER DELETE ON "Return" BEGIN
+        UPDATE PatronStanding SET OpenLoans = OpenLoans + 1
+        WHERE PatronID = (SELECT PatronID FROM Checkout WHERE TransactionID = old.TransactionID);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PatronStanding_reservation_insert AFTER INSERT ON Reservation
+    WHEN new.Active BEGIN
+        UPDATE PatronStanding SET ActiveHolds = ActiveHolds + 1 WHERE PatronID = new.ReservingPatron;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PatronStanding_reservation_update AFTER UPDATE OF Active, ReservingPatron ON Reservation
+    WHEN old.Active IS NOT new.Active OR old.ReservingPatron IS NOT new.ReservingPatron BEGIN
+        UPDATE PatronStanding SET ActiveHolds = ActiveHolds - 1 WHERE old.Active AND PatronID = old.ReservingPatron;
+        UPDATE PatronStanding SET ActiveHolds = ActiveHolds + 1 WHERE new.Active AND PatronID = new.ReservingPatron;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS PatronStanding_reservation_delete AFTER DELETE ON Reservation
+    WHEN old.Active BEGIN
+        UPDATE PatronStanding SET ActiveHolds = ActiveHolds - 1 WHERE PatronID = old.ReservingPatron;
+    END
+    """,
+]
+
+#Every patron's standing worked out from scratch - one grouped pass over open loans and one
+#over active holds, joined to Patron
+PATRON_STANDING_SQL = """
+    SELECT p.PatronID, coalesce(l.OpenLoans, 0) AS OpenLoans, coalesce(h.ActiveHolds, 0) AS ActiveHolds,
+           coalesce(p.FeesOwed, 0) AS FeesOwed, p.AccountExpDate
+    FROM Patron p
+    LEFT JOIN (
+        SELECT c.PatronID, count(*) AS OpenLoans FROM Checkout c
+        WHERE NOT EXISTS (SELECT 1 FROM "Return" r WHERE r.TransactionID = c.TransactionID)
+        GROUP BY c.PatronID
+    ) l ON l.PatronID = p.PatronID
+    LEFT JOIN (
+        SELECT ReservingPatron, count(*) AS ActiveHolds FROM Reservation
+        WHERE Active = 1
+        GROUP BY ReservingPatron
+    ) h ON h.ReservingPatron = p.PatronID
+"""
+
+def rebuild_patron_standing() -> int:
+    '''
+    Recomputes every PatronStanding row from Patron, Checkout/Return and Reservation.
+    Returns how many patrons' rows were wrong or missing (or left over) beforehand.
+    '''
+    database.session.execute(text("DROP TABLE IF EXISTS temp.PatronStandingRebuild"))
+    database.session.execute(text(f"CREATE TEMP TABLE PatronStandingRebuild AS {PATRON_STANDING_SQL}"))
+    drifted = database.session.execute(text("""
+        SELECT (SELECT count(*) FROM temp.PatronStandingRebuild n
+                LEFT JOIN PatronStanding s ON s.PatronID = n.PatronID
+                WHERE s.PatronID IS NULL OR s.OpenLoans != n.OpenLoans OR s.ActiveHolds != n.ActiveHolds
+                   OR s.FeesOwed != n.FeesOwed OR s.AccountExpDate IS NOT n.AccountExpDate)
+             + (SELECT count(*) FROM PatronStanding
+                WHERE PatronID NOT IN (SELECT PatronID FROM temp.PatronStandingRebuild))
+    """)).scalar()
+    database.session.execute(text("DELETE FROM PatronStanding"))
+    database.session.execute(text("""
+        INSERT INTO PatronStanding (PatronID, OpenLoans, ActiveHolds, FeesOwed, AccountExpDate)
+        SELECT PatronID, OpenLoans, ActiveHolds, FeesOwed, AccountExpDate FROM temp.PatronStandingRebuild
+    """))
+    database.session.execute(text("DROP TABLE temp.PatronStandingRebuild"))
+    return drifted
+
+def build_patron_standing():
+    '''Creates the PatronStanding triggers, and fills the table if it was just created'''
+    for ddl in PATRON_STANDING_TRIGGERS:
+        database.session.execute(text(ddl))
+    if database.session.execute(text("SELECT 1 FROM PatronStanding LIMIT 1")).first() is None and \
+            database.session.execute(text("SELECT 1 FROM Patron LIMIT 1")).first():
+        rebuild_patron_standing()
+
+
+def upgrade_schema():
+    '''Brings an existing database up to date with the models'''
+    if not column_exists('LibraryItem', 'Author'):
+        database.session.execute(text("ALTER TABLE LibraryItem ADD COLUMN Author TEXT DEFAULT 'no data'"))
+
+    if not column_exists('LibraryItem', 'ActiveTransactionID'):
+        database.session.execute(text(
+            "ALTER TABLE LibraryItem ADD COLUMN ActiveTransactionID INTEGER REFERENCES Checkout(TransactionID)"
+        ))
+        rebuild_active_loans()
+
+    if not column_exists('Reservation', 'ExpiresAt'):
+        database.session.execute(text("ALTER TABLE Reservation ADD COLUMN ExpiresAt DATE"))
+        # holds whose item already came back: pickup window started at the first return after reserving
+        database.session.execute(text(f"""
+            UPDATE Reservation SET ExpiresAt = (
+                SELECT date(min(r.DateReturned), '+{RESERVATION_PICKUP_DAYS} days')
+                FROM "Return" r
+                JOIN Checkout c ON c.TransactionID = r.TransactionID
+                WHERE c.ItemID = Reservation.ReservedItem
+                  AND r.DateReturned >= Reservation.DateReserved
+            )
+            WHERE Active = 1
+        """))
+
+    indexes_before = index_names()
+    database.session.execute(text("DROP INDEX IF EXISTS ix_LibraryItem_active_loan")) # replaced by the unique version
+    for old_index in ('ix_LibraryItem_reshelve', 'ix_LibraryItem_reshelve_shelf'): # replaced by ReshelveQueue
+        database.session.execute(text(f"DROP INDEX IF EXISTS {old_index}"))
+    if 'ux_Reservation_active_item' not in indexes_before:
+        # older data can have two active holds on one item - keep the first, as reserve_item would have
+        database.session.execute(text("""
+            UPDATE Reservation SET Active = 0
+            WHERE Active = 1 AND ReservationID NOT IN (
+                SELECT min(ReservationID) FROM Reservation WHERE Active = 1 GROUP BY ReservedItem
+            )
+        """))
+    for ddl in SCHEMA_INDEXES:
+        database.session.execute(text(ddl))
+    if index_names() != indexes_before:
+        # give the query planner row counts for the new indexes, otherwise it guesses
+        database.session.execute(text("ANALYZE"))
+
+    app.config['CATALOG_FTS'] = build_catalog_search_index()
+    build_table_versions()
+    build_archive_tables()
+    build_patron_standing()
+
+    # ReshelveQueue was just created on an older database with items already on the cart
+    if database.session.execute(text("SELECT 1 FROM ReshelveQueue LIMIT 1")).first() is None and \
+            database.session.execute(text("SELECT 1 FROM LibraryItem WHERE Status = 'checked in' LIMIT 1")).first():
+        rebuild_reshelve_queue()
+
+    database.session.commit()
+
+
+#### --- Loan history archive --- ####
+# Closed loans older than ARCHIVE_RETENTION_DAYS move from Checkout/Return into
+# CheckoutArchive/ReturnArchive, so the hot tables only hold recent circulation.
+# Never archived: open loans, the latest loan of each item (reshelve queue rebuild) and
+# loans of items with an active hold (pickup window lookups). loan_history() reads both.
+app.config.setdefault('ARCHIVE_RETENTION_DAYS', 730)
+ARCHIVE_SCHEMA = 'archive' if app.config['ARCHIVE_DB_PATH'] else 'main'
+
+def build_archive_tables():
+    schema = ARCHIVE_SCHEMA
+    database.session.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.CheckoutArchive (
+            TransactionID INTEGER PRIMARY KEY, PatronID INTEGER, ItemID INTEGER, CheckoutDate DATE, DueDate DATE)
+    """))
+    database.session.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.ReturnArchive (
+            TransactionID INTEGER PRIMARY KEY, DateReturned DATE, BranchReturnedTo INTEGER)
+    """))
+    database.session.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {schema}.ix_CheckoutArchive_patron ON CheckoutArchive(PatronID, TransactionID)"))
+    database.session.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {schema}.ix_CheckoutArchive_item ON CheckoutArchive(ItemID, TransactionID)"))
+
+ARCHIVE_CANDIDATES_SQL = """
+    SELECT r.TransactionID
+    FROM "Return" r
+    JOIN Checkout c ON c.TransactionID = r.TransactionID
+    WHERE r.TransactionID > :after AND r.DateReturned < :cutoff
+      AND c.TransactionID < (SELECT max(TransactionID) FROM Checkout WHERE ItemID = c.ItemID)
+      AND NOT EXISTS (SELECT 1 FROM Reservation h WHERE h.ReservedItem = c.ItemID AND h.Active = 1)
+    ORDER BY r.TransactionID
+    LIMIT :batch_size
+"""
+
+def archive_loans(older_than: Optional[date] = None, batch_size: int = 2000, pause: float = 0.0) -> dict:
+    '''
+    Moves closed loans returned before older_than into the archive, batch_size loans per
+    transaction. Each batch is copied (and committed) before it is deleted from the hot
+    tables, so an interrupted run leaves duplicates - which the next run and loan_history()
+    tolerate - never lost rows, even with the archive in a separate file. pause sleeps
+    between batches to let desk writes in.
+    '''
+    older_than = older_than or date.today() - timedelta(days=app.config['ARCHIVE_RETENTION_DAYS'])
+    schema = ARCHIVE_SCHEMA
+    id_list = bindparam('ids', expanding=True)
+    archived, batches, after = 0, 0, 0
+    while True:
+        ids = database.session.execute(
+            text(ARCHIVE_CANDIDATES_SQL),
+            {"after": after, "cutoff": older_than.isoformat(), "batch_size": batch_size}
+        ).scalars().all()
+        database.session.commit() # end the read so the copy below starts a fresh, short write
+        if not ids:
+            break
+        after = ids[-1]
+
+        database.session.execute(text(f"""
+            INSERT OR IGNORE INTO {schema}.CheckoutArchive (TransactionID, PatronID, ItemID, CheckoutDate, DueDate)
+            SELECT TransactionID, PatronID, ItemID, CheckoutDate, DueDate FROM Checkout WHERE TransactionID IN :ids
+        """).bindparams(id_list), {"ids": ids})
+        database.session.execute(text(f"""
+            INSERT OR IGNORE INTO {schema}.ReturnArchive (TransactionID, DateReturned, BranchReturnedTo)
+            SELECT TransactionID, DateReturned, BranchReturnedTo FROM "Return" WHERE TransactionID IN :ids
+        """).bindparams(id_list), {"ids": ids})
+        database.session.commit()
+
+        database.session.execute(text('DELETE FROM "Return" WHERE TransactionID IN :ids').bindparams(id_list), {"ids": ids})
+        database.session.execute(text("DELETE FROM Checkout WHERE TransactionID IN :ids").bindparams(id_list), {"ids": ids})
+        database.session.commit()
+
+        archived += len(ids)
+        batches += 1
+        if pause:
+            time.sleep(pause)
+    return {"archived": archived, "batches": batches, "older_than": older_than.isoformat()}
+
+#Every loan of a patron or an item, newest first, from the hot tables and the archive.
+#Both halves walk a (PatronID|ItemID, TransactionID) index, so a page stops after `limit` rows.
+LOAN_HISTORY_SQL = """
+    SELECT h.*, i.ItemTitle FROM (
+        SELECT c.TransactionID, c.PatronID, c.ItemID, c.CheckoutDate, c.DueDate,
+               r.DateReturned, r.BranchReturnedTo, 0 AS Archived
+        FROM Checkout c
+        LEFT JOIN "Return" r ON r.TransactionID = c.TransactionID
+        WHERE c.{column} = :key AND c.TransactionID < :before
+        UNION ALL
+        SELECT a.TransactionID, a.PatronID, a.ItemID, a.CheckoutDate, a.DueDate,
+               ra.DateReturned, ra.BranchReturnedTo, 1 AS Archived
+        FROM {schema}.CheckoutArchive a
+        LEFT JOIN {schema}.ReturnArchive ra ON ra.TransactionID = a.TransactionID
+        WHERE a.{column} = :key AND a.TransactionID < :before
+          AND NOT EXISTS (SELECT 1 FROM Checkout hot WHERE hot.TransactionID = a.TransactionID) -- mid-move copy
+        ORDER BY 1 DESC
+        LIMIT :limit
+    ) h
+    LEFT JOIN LibraryItem i ON i.ItemID = h.ItemID
+    ORDER BY h.TransactionID DESC
+"""
+
+def loan_history(patron_id: Optional[int] = None, item_id: Optional[int] = None,
+                 before: Optional[int] = None, limit: Optional[int] = None) -> list:
+    '''One page of loans for a patron or an item, newest first, as plain dicts'''
+    limit = limit or DEFAULT_PAGE_SIZE
+    column, key = ('PatronID', patron_id) if patron_id is not None else ('ItemID', item_id)
+    rows = database.session.execute(
+        text(LOAN_HISTORY_SQL.format(column=column, schema=ARCHIVE_SCHEMA)),
+        {"key": key, "before": before if before is not None else 2 ** 63 - 1, "limit": limit}
+    ).mappings()
+    return [dict(row, Archived=bool(row["Archived"])) for row in rows]
+
+
+#### --- Streaming export --- ####
+# Whole tables out as CSV or NDJSON (GET /api/export/<table>, flask export). Rows are read
+# through a streaming cursor EXPORT_BATCH_ROWS at a time and written out batch by batch, so
+# memory stays flat however big the table is. The export is one SELECT, i.e. one consistent
+# snapshot; under WAL it only keeps checkpoints from finishing while it runs.
+EXPORT_BATCH_ROWS = 1000
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+export_json = json.JSONEncoder(default=str) # one encoder for every row, json.dumps(default=...) builds one per call
+EXPORT_QUERIES = {
+    'patrons': """
+        SELECT p.PatronID, p.PatronFN, p.PatronLN, p.AccountExpDate, p.FeesOwed, s.OpenLoans AS ItemsCheckedOut
+        FROM Patron p
+        LEFT JOIN PatronStanding s ON s.PatronID = p.PatronID
+        ORDER BY p.PatronID
+    """,
+    'items': """
+        SELECT ItemID, ItemType, ItemTitle, Author, Status, ShelfCode, Cost, AquisitionDate, ActiveTransactionID
+        FROM LibraryItem ORDER BY ItemID
+    """,
+    # hot and archived loans, merged in TransactionID order (both halves are read in rowid order)
+    'loans': f"""
+        SELECT c.TransactionID, c.PatronID, c.ItemID, c.CheckoutDate, c.DueDate,
+               r.DateReturned, r.BranchReturnedTo, 0 AS Archived
+        FROM Checkout c
+        LEFT JOIN "Return" r ON r.TransactionID = c.TransactionID
+        UNION ALL
+        SELECT a.TransactionID, a.PatronID, a.ItemID, a.CheckoutDate, a.DueDate,
+               ra.DateReturned, ra.BranchReturnedTo, 1 AS Archived
+        FROM {ARCHIVE_SCHEMA}.CheckoutArchive a
+        LEFT JOIN {ARCHIVE_SCHEMA}.ReturnArchive ra ON ra.TransactionID = a.TransactionID
+        WHERE NOT EXISTS (SELECT 1 FROM Checkout hot WHERE hot.TransactionID = a.TransactionID)
+        ORDER BY 1
+    """,
+}
+
+def export_chunks(engine, table: str, fmt: str):
+    '''Yields the export as text, one chunk per EXPORT_BATCH_ROWS rows (CSV starts with a header)'''
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=EXPORT_BATCH_ROWS).execute(
+            text(EXPORT_QUERIES[table]))
+        columns = list(result.keys())
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        if fmt == 'csv':
+            writer.writerow(columns)
+        for rows in result.partitions(EXPORT_BATCH_ROWS):
+            if fmt == 'csv':
+                writer.writerows(rows)
+            else:
+                buffer.writelines(export_json.encode(dict(zip(columns, row))) + '\n' for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue() # header of an empty table
+
+def gzip_chunks(chunks):
+    '''Compresses a stream of text chunks into one gzip file, chunk by chunk'''
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits 31 = gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+#### --- Bulk import --- ####
+# flask import-csv items|patrons FILE loads a CSV (same columns as the export) in chunks of
+# IMPORT_CHUNK_ROWS rows, one executemany and one transaction per chunk. Every row is checked
+# against the model rules first - bad rows go to the rejects file with the reason, the rest
+# load. Derived columns (ActiveTransactionID, ItemsCheckedOut) are not imported: new rows have
+# no loans yet, so items can only arrive 'available' or 'checked in' (IMPORT_ITEM_STATUSES) -
+# a loan or hold status with no Checkout/Reservation behind it is stuck. Rows are bound as plain tuples through exec_driver_sql, since per-row
+# parameter processing in insert() costs more than SQLite's insert itself.
+IMPORT_CHUNK_ROWS = 50000
+IMPORT_ITEM_STATUSES = ('available', 'checked in')
+
+# Column converters: take the raw CSV text, return the value to store or raise ValueError
+def csv_text(column: str, max_length: int, required: bool = False, default: Optional[str] = None):
+    def convert(value: str):
+        value = value.strip()
+        if not value:
+            if required:
+                raise ValueError(f"{column} is required")
+            return default
+        if len(value) > max_length:
+            raise ValueError(f"{column} is longer than {max_length} characters")
+        return value
+    return convert
+
+def csv_int(column: str, required: bool = False, choices=None):
+    def convert(value: str):
+        value = value.strip()
+        if not value:
+            if required:
+                raise ValueError(f"{column} is required")
+            return None
+        if not (value.isascii() and value.isdigit()) or int(value) < 1:
+            raise ValueError(f"{column} '{value}' is not a positive whole number")
+        number = int(value)
+        if choices is not None and number not in choices:
+            raise ValueError(f"{column} {value} does not exist")
+        return number
+    return convert
+
+def csv_money(column: str, default: Optional[float] = None):
+    def convert(value: str):
+        value = value.strip().lstrip('$')
+        if not value:
+            return default
+        try:
+            amount = round(float(value), 2)
+        except ValueError:
+            raise ValueError(f"{column} '{value}' is not an amount")
+        if not 0 <= amount < 10 ** 8: # Numeric(10, 2), and catches nan/inf
+            raise ValueError(f"{column} '{value}' is out of range")
+        return amount
+    return convert
+
+def csv_date(column: str):
+    def convert(value: str):
+        value = value.strip()
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(value).isoformat() # stored as YYYY-MM-DD, like the Date columns
+        except ValueError:
+            raise ValueError(f"{column} '{value}' is not a YYYY-MM-DD date")
+    return convert
+
+def csv_choice(column: str, choices, default: str, note: str = ''):
+    def convert(value: str):
+        value = value.strip() or default
+        if value not in choices:
+            raise ValueError(f"{column} '{value}' is not one of {', '.join(choices)}{note}")
+        return value
+    return convert
+
+def csv_fixed(fixed_value):
+    '''Derived column - whatever the file says, a new row starts with fixed_value'''
+    return lambda value: fixed_value
+
+def item_converters() -> dict:
+    return {
+        "ItemID": csv_int('ItemID'),
+        "ItemType": csv_int('ItemType', required=True, choices=set(reference_table('item_types'))),
+        "ItemTitle": csv_text('ItemTitle', 50, required=True),
+        "Author": csv_text('Author', 200, default='no data'),
+        "Status": csv_choice('Status', IMPORT_ITEM_STATUSES, 'available',
+                             ' (loans and holds are not imported)'), # a subset of the valid_status CHECK
+        "ShelfCode": csv_text('ShelfCode', 5),
+        "Cost": csv_money('Cost'),
+        "AquisitionDate": csv_date('AquisitionDate'),
+        "ActiveTransactionID": csv_fixed(None),
+    }
+
+def patron_converters() -> dict:
+    return {
+        "PatronID": csv_int('PatronID'),
+        "PatronFN": csv_text('PatronFN', 50, required=True),
+        "PatronLN": csv_text('PatronLN', 50, required=True),
+        "AccountExpDate": csv_date('AccountExpDate'),
+        "FeesOwed": csv_money('FeesOwed', default=0),
+        "ItemsCheckedOut": csv_fixed(0),
+    }
+
+# table -> (model, key column, converters, columns the file must have)
+IMPORT_TABLES = {
+    'items': (LibraryItem, 'ItemID', item_converters, ('ItemType', 'ItemTitle')),
+    'patrons': (Patron, 'PatronID', patron_converters, ('PatronFN', 'PatronLN')),
+}
+
+def import_csv(table: str, lines, chunk_size: int = IMPORT_CHUNK_ROWS, rejects=None,
+               dry_run: bool = False, defer_indexes: bool = False) -> dict:
+    '''
+    Validates and inserts CSV rows (any iterable of lines) into items or patrons. rejects, if
+    given, is a csv.writer that gets each bad row with its line number and reason.
+    defer_indexes drops the table's secondary indexes for the load and rebuilds them once
+    at the end - much faster for big loads, but other connections run without those
+    indexes meanwhile (and a crash leaves them to the next upgrade_schema).
+    Returns {"read", "imported", "rejected", "seconds"}.
+    '''
+    model, key, make_converters, required = IMPORT_TABLES[table]
+    table_name = model.__tablename__
+    started = time.perf_counter()
+    reader = csv.reader(lines)
+    header = [column.strip() for column in next(reader, [])]
+    converters = make_converters()
+    unknown = [column for column in header if column not in converters]
+    missing = [column for column in required if column not in header]
+    if unknown or missing:
+        problems = ([f"unknown column(s) {', '.join(unknown)}"] if unknown else []) + \
+                   ([f"missing column(s) {', '.join(missing)}"] if missing else [])
+        raise ValueError(f"{table} file has {' and '.join(problems)}")
+    if rejects is not None:
+        rejects.writerow(['line', 'error'] + header)
+
+    columns = list(converters)
+    positions = [header.index(column) if column in header else None for column in columns]
+    fields = list(zip(positions, converters.values()))
+    key_at = columns.index(key)
+    insert_sql = (f'INSERT INTO "{table_name}" ({", ".join(columns)}) '
+                  f'VALUES ({", ".join("?" * len(columns))})')
+    reindex = table == 'items' and catalog_search_enabled()
+    deferred = [ddl for ddl in SCHEMA_INDEXES if f" ON {table_name}(" in ddl and 'UNIQUE' not in ddl] \
+        if defer_indexes and not dry_run else []
+
+    counts = {"read": 0, "imported": 0, "rejected": 0}
+    seen_ids = set() # ids of rows accepted so far - catches repeats across chunks in a dry run too
+
+    def reject(line_no: int, values: list, error: str):
+        counts["rejected"] += 1
+        if rejects is not None:
+            rejects.writerow([line_no, error] + values)
+
+    def flush(chunk: list):
+        if not dry_run:
+            # write lock first, so no other connection can take an id between the check and the insert
+            database.session.execute(text("BEGIN IMMEDIATE"))
+        # ids already taken - in the table or by an earlier row of this file
+        ids = [row[key_at] for _, _, row in chunk if row[key_at] is not None]
+        taken = set(database.session.execute(
+            text(f'SELECT {key} FROM "{table_name}" WHERE {key} IN (SELECT value FROM json_each(:ids))'),
+            {"ids": json.dumps(ids)}
+        ).scalars()) if ids else set()
+        rows = []
+        for line_no, values, row in chunk:
+            if row[key_at] is not None:
+                if row[key_at] in taken or row[key_at] in seen_ids:
+                    reject(line_no, values, f"{key} {row[key_at]} already exists")
+                    continue
+                seen_ids.add(row[key_at])
+            rows.append(row)
+        counts["imported"] += len(rows)
+        if dry_run or not rows:
+            database.session.rollback() # releases the write lock
+            return
+
+        if reindex:
+            # the per-row search trigger costs more than the insert itself - drop it for this
+            # transaction (other connections never see it missing) and index the chunk in one go.
+            # The write lock is already held, so max(ItemID) below can't go stale.
+            database.session.execute(text(f"DROP TRIGGER IF EXISTS {CATALOG_SEARCH_TABLE}_insert"))
+            next_id = max([database.session.execute(text("SELECT coalesce(max(ItemID), 0) FROM LibraryItem")).scalar()]
+                          + [row[key_at] for row in rows if row[key_at] is not None]) + 1
+            for n, row in enumerate(rows):
+                if row[key_at] is None:
+                    rows[n] = row[:key_at] + (next_id,) + row[key_at + 1:]
+                    next_id += 1
+
+        database.session.connection().exec_driver_sql(insert_sql, rows) # NULL ids get the next rowid
+
+        if reindex:
+            database.session.execute(text(f"""
+                INSERT INTO {CATALOG_SEARCH_TABLE}(rowid, ItemTitle, Author)
+                SELECT ItemID, ItemTitle, Author FROM LibraryItem WHERE ItemID IN (SELECT value FROM json_each(:ids))
+            """), {"ids": json.dumps([row[key_at] for row in rows])})
+            database.session.execute(text(CATALOG_SEARCH_TRIGGERS[0]))
+        database.session.commit()
+
+    for ddl in deferred:
+        database.session.execute(text("DROP INDEX IF EXISTS " + ddl.split(' IF NOT EXISTS ')[1].split()[0]))
+    database.session.commit()
+
+    chunk = []
+    for line_no, values in enumerate(reader, start=2):
+        if not any(values):
+            continue # blank line
+        counts["read"] += 1
+        if len(values) != len(header):
+            reject(line_no, values, f"expected {len(header)} fields, found {len(values)}")
+            continue
+        try:
+            row = tuple([convert(values[at] if at is not None else '') for at, convert in fields])
+        except ValueError as e:
+            reject(line_no, values, str(e))
+            continue
+        chunk.append((line_no, values, row))
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    for ddl in deferred:
+        database.session.execute(text(ddl))
+    if deferred:
+        database.session.execute(text(f"ANALYZE {table_name}"))
+    if table == 'items' and not dry_run:
+        # imported copies marked 'checked in' belong on the reshelve cart
+        database.session.execute(text("""
+            INSERT OR IGNORE INTO ReshelveQueue (ItemID, QueuedOn)
+            SELECT ItemID, date('now') FROM LibraryItem WHERE Status = 'checked in'
+        """))
+    database.session.commit()
+
+    counts["seconds"] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+#### --- Reference data cache --- ####
+# ItemType and LibraryBranch are a handful of rows that almost never change, so checkout,
+# checkin and item lookups read them from memory. The cache reloads both tables when
+# an ORM write touches them, when an id is missing (a row added by another worker),
+# and after REFERENCE_CACHE_TTL seconds as a safety net.
+app.config['REFERENCE_CACHE_TTL'] = 300
+
+class ItemTypeInfo(NamedTuple):
+    TypeID: int
+    TypeName: str
+    RentalLength: int
+    PerDayFine: float
+
+class BranchInfo(NamedTuple):
+    BranchID: int
+    BranchName: str
+
+#versions: the TableVersion of each table when it was loaded, so conditional_get can tell
+#a change made by another process (or raw SQL) and reload before answering under a new ETag
+reference_cache = {'item_types': {}, 'branches': {}, 'versions': {}, 'loaded_at': None}
+reference_cache_lock = threading.Lock()
+
+#TableVersion goes first - a change landing between the reads leaves an older version, never a newer one
+REFERENCE_QUERIES = (
+    text("SELECT TableName, Version FROM TableVersion WHERE TableName IN ('ItemType', 'LibraryBranch')"),
+    select(ItemType.TypeID, ItemType.TypeName, ItemType.RentalLength, ItemType.PerDayFine),
+    select(LibraryBranch.BranchID, LibraryBranch.BranchName),
+)
+
+def store_reference_data(version_rows, item_type_rows, branch_rows):
+    '''Replaces reference_cache with the rows of REFERENCE_QUERIES'''
+    item_types = {
+        t.TypeID: ItemTypeInfo(t.TypeID, t.TypeName, int(t.RentalLength or 0), float(t.PerDayFine or 0))
+        for t in item_type_rows
+    }
+    branches = {b.BranchID: BranchInfo(b.BranchID, b.BranchName) for b in branch_rows}
+    versions = {v.TableName: v.Version for v in version_rows}
+    with reference_cache_lock:
+        reference_cache.update(item_types=item_types, branches=branches, versions=versions, loaded_at=time.monotonic())
+
+def load_reference_data():
+    '''Reads ItemType and LibraryBranch (and their TableVersion) into reference_cache (3 queries)'''
+    store_reference_data(*(database.session.execute(query).all() for query in REFERENCE_QUERIES))
+
+def invalidate_reference_cache(*_):
+    '''Forces a reload on next use - call after writing ItemType/LibraryBranch outside the ORM'''
+    with reference_cache_lock:
+        reference_cache['loaded_at'] = None
+
+def reference_cache_stale(name: str, key: Optional[int] = None) -> bool:
+    loaded_at = reference_cache['loaded_at']
+    return loaded_at is None or time.monotonic() - loaded_at > app.config['REFERENCE_CACHE_TTL'] \
+        or (key is not None and key not in reference_cache[name])
+
+def reference_table(name: str, key: Optional[int] = None) -> dict:
+    '''The cached {id: info} dict for item_types/branches, reloaded if stale or missing key'''
+    if reference_cache_stale(name, key):
+        load_reference_data()
+    return reference_cache[name]
+
+def get_item_type(type_id: int) -> Optional[ItemTypeInfo]:
+    return reference_table('item_types', type_id).get(type_id)
+
+def get_branch(branch_id: int) -> Optional[BranchInfo]:
+    return reference_table('branches', branch_id).get(branch_id)
+
+def note_reference_change(mapper, connection, target):
+    '''Flush of an ItemType/LibraryBranch - the cache is dropped once the transaction commits'''
+    session = object_session(target)
+    if session is not None:
+        session.info['reference_changed'] = True
+
+def invalidate_reference_cache_on_commit(session):
+    # clearing at flush would let a request reload the old rows before the commit lands
+    if session.info.pop('reference_changed', False):
+        invalidate_reference_cache()
+
+def forget_reference_change(session):
+    session.info.pop('reference_changed', None)
+
+for model in (ItemType, LibraryBranch):
+    for change in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, change, note_reference_change)
+event.listen(RoutingSession, 'after_commit', invalidate_reference_cache_on_commit)
+event.listen(RoutingSession, 'after_rollback', forget_reference_change)
+
+
 #### --- Core Logic --- ####
-def membership_expired(patron: Patron) -> bool:
+def membership_expired(patron) -> bool:
     '''
-    This function checks if a patron's account is expired
+    This function checks if a patron's account is expired (takes a Patron or its PatronStanding)
     Returns TRUE if expired
     Returns FALSE if not expired
     '''
     return bool(patron and patron.AccountExpDate and patron.AccountExpDate < date.today())
 
 
+def open_loans_for(patron_id: int) -> int:
+    '''The patron's open loan count from PatronStanding'''
+    return database.session.execute(
+        select(PatronStanding.OpenLoans).where(PatronStanding.PatronID == patron_id)
+    ).scalar() or 0
+
+
 #BERKER: calculates the rental period for a library item
 def rental_days_for(item: LibraryItem) -> int:
-    item_type = ItemType.query.get(item.ItemType) if item else None
-    return int(item_type.RentalLength) if (item_type and item_type.RentalLength) else 0
+    item_type = get_item_type(item.ItemType) if item else None
+    return item_type.RentalLength if item_type else 0
+
+#Rental length for several item types - {TypeID: days}
+def rental_days_by_type(type_ids) -> dict:
+    rental_days = {}
+    for type_id in set(type_ids):
+        item_type = get_item_type(type_id)
+        if item_type:
+            rental_days[type_id] = item_type.RentalLength
+    return rental_days
 
 #Jake Rouse: Cacluates the due date for a checkout transaction
 
@@ -122,21 +1256,51 @@ def calc_return_date(Checkoutdate: str, rentalLength: str) -> str:
 def calculate_fine(checkout: Checkout, item: LibraryItem, return_date: date) -> float:
     if not checkout.DueDate or return_date <= checkout.DueDate:
         return 0.0
-    item_type = ItemType.query.get(item.ItemType)
+    item_type = get_item_type(item.ItemType)
     if not item_type or not item_type.PerDayFine:
         return 0.0
     days_overdue = (return_date - checkout.DueDate).days
-    per_day_fine = float(item_type.PerDayFine)
+    per_day_fine = item_type.PerDayFine
     calculated_fine = days_overdue * per_day_fine
     item_cost = float(item.Cost) if item.Cost else 0.0
     final_fine = min(calculated_fine, item_cost)
     return round(final_fine, 2)
 
 
+#Fines accrued so far on every open loan, per patron, in one statement. Same rule as
+#calculate_fine: days overdue x PerDayFine, capped at the item's cost. Walks only the
+#open loans (ux_LibraryItem_active_loan), however long the loan history is.
+def accrue_fines(as_of: Optional[date] = None) -> dict:
+    '''Replaces ProjectedFine with the fines owed as of the given day, returns a summary'''
+    as_of = as_of or date.today()
+    database.session.execute(text("DELETE FROM ProjectedFine"))
+    database.session.execute(text("""
+        INSERT INTO ProjectedFine (PatronID, OverdueLoans, AccruedFines, ComputedOn)
+        SELECT c.PatronID,
+               count(*),
+               round(sum(min(
+                   (julianday(:as_of) - julianday(c.DueDate)) * coalesce(t.PerDayFine, 0),
+                   coalesce(i.Cost, 0)
+               )), 2),
+               :as_of
+        FROM LibraryItem i
+        CROSS JOIN Checkout c ON c.TransactionID = i.ActiveTransactionID -- CROSS: keep SQLite on the open-loan index
+        LEFT JOIN ItemType t ON t.TypeID = i.ItemType                     -- instead of walking all loan history
+        WHERE i.ActiveTransactionID IS NOT NULL AND c.DueDate < :as_of
+        GROUP BY c.PatronID
+    """), {"as_of": as_of.isoformat()})
+    patrons, loans, total = database.session.execute(text(
+        "SELECT count(*), coalesce(sum(OverdueLoans), 0), coalesce(sum(AccruedFines), 0) FROM ProjectedFine"
+    )).one()
+    database.session.commit()
+    return {"as_of": as_of.isoformat(), "patrons": patrons, "overdue_loans": loans, "accrued_fines": round(total, 2)}
+
 
 ##helpers for reservation (counting down 5 days for pick up)
+RESERVATION_PICKUP_DAYS = 5
 
 #BERKER: Check if reservation expired by comparing current date to DateReturned + 5 days
+#ExpiresAt holds DateReturned + 5 days, it is stamped by checkin_item so no lookup is needed here
 
 def is_reservation_expired(reservation: Reservation, item: LibraryItem) -> bool:
     if not reservation or not reservation.Active:
@@ -145,108 +1309,389 @@ def is_reservation_expired(reservation: Reservation, item: LibraryItem) -> bool:
     if not item:
         return False
     
-    relevant_return = (
-        Return.query
-        .join(Checkout, Checkout.TransactionID == Return.TransactionID)
-        .filter(
-            Checkout.ItemID == item.ItemID,
-            Return.DateReturned >= reservation.DateReserved
-        )
-        .order_by(Return.DateReturned.asc())
-        .first()
-    )
-    
-    if not relevant_return:
+    if not reservation.ExpiresAt:
         return False  # not returned yet so can't be expired
     
-    # calculate expiration from return date
-    expiration_date = relevant_return.DateReturned + timedelta(days=5)
-    
-    return date.today() > expiration_date
+    return date.today() > reservation.ExpiresAt
+
+
+#Keep ReshelveQueue in step with Status - call in the same transaction as the update
+def enqueue_reshelve(item_ids, branch_id: Optional[int] = None, queued_on: Optional[date] = None):
+    if not item_ids:
+        return
+    queued_on = queued_on or date.today()
+    database.session.execute(
+        insert(ReshelveQueue).prefix_with('OR REPLACE'),
+        [{"ItemID": item_id, "QueuedOn": queued_on, "BranchID": branch_id} for item_id in item_ids]
+    )
+
+def dequeue_reshelve(item_ids):
+    if not item_ids:
+        return
+    database.session.execute(
+        ReshelveQueue.__table__.delete().where(ReshelveQueue.ItemID.in_(list(item_ids)))
+    )
 
 
 #BERKER: auto expiring reservations that passed their 5 day pickup window
-def expire_old_reservations():
-    expired_count = 0
-    
-    active_reservations = Reservation.query.filter(
-        Reservation.Active == True
-    ).all()
-    
-    for reservation in active_reservations:
-        item = LibraryItem.query.get(reservation.ReservedItem)
-        
-        if not item:
-            continue
-        
-        if is_reservation_expired(reservation, item):
-            reservation.Active = False
-            
-            if item.Status == 'reserved':
-                item.Status = 'checked in'
-            
-            expired_count += 1
-    
-    if expired_count > 0:
-        database.session.commit()
-    
+#Runs as two indexed UPDATEs, and at most once per RESERVATION_EXPIRY_INTERVAL seconds per worker
+#since deadlines are whole days - callers on every request are cheap.
+app.config.setdefault('RESERVATION_EXPIRY_INTERVAL', 300)
+_last_reservation_expiry = {"at": None}
+
+def expire_old_reservations(force: bool = False) -> int:
+    now = time.monotonic()
+    last_run = _last_reservation_expiry["at"]
+    if not force and last_run is not None and now - last_run < app.config['RESERVATION_EXPIRY_INTERVAL']:
+        return 0
+
+    today = date.today()
+    expired = and_(
+        Reservation.Active == True,
+        Reservation.ExpiresAt.isnot(None),
+        Reservation.ExpiresAt < today
+    )
+
+    try:
+        # items still marked reserved go back to the reshelve queue
+        back_to_cart = database.session.execute(
+            update(LibraryItem.__table__)
+            .where(
+                LibraryItem.ItemID.in_(select(Reservation.ReservedItem).where(expired)),
+                LibraryItem.Status == 'reserved'
+            )
+            .values(Status='checked in')
+            .returning(LibraryItem.ItemID)
+        ).scalars().all()
+        enqueue_reshelve(back_to_cart, queued_on=today)
+        expired_count = database.session.execute(
+            update(Reservation).where(expired).values(Active=False)
+        ).rowcount
+
+        if expired_count > 0:
+            database.session.commit()
+    except Exception:
+        # nothing was expired - let the next caller (or the retry) run it again right away
+        _last_reservation_expiry["at"] = None
+        raise
+
+    # stamped only once the holds are really closed
+    _last_reservation_expiry["at"] = now
     return expired_count
 
 
 #BERKER: this way it calculates expiration info using Return table instead of DateReserved
-def get_reservation_expiration_info(reservation: Reservation, item: LibraryItem):
-    if not reservation or not item:
-        return None
-    
-    active_checkout = (
-        Checkout.query
-        .outerjoin(Return, Return.TransactionID == Checkout.TransactionID)
-        .filter(
-            Checkout.ItemID == item.ItemID,
-            Return.TransactionID.is_(None)  # checking to see "no return = still checked out"
-        )
-        .first()
+#Status of many holds in one query: the pickup window opens at the latest return of the
+#item since it was reserved (picked per hold with row_number() over Return), unless the
+#item is out on loan again. Rows come back in ReservationID order as plain dicts.
+RESERVATION_STATUS_SQL = f"""
+    WITH holds AS (
+        SELECT r.ReservationID, r.ReservingPatron, r.ReservedItem, r.DateReserved, r.Active, r.ExpiresAt,
+               i.ItemTitle, i.Status, i.ActiveTransactionID, p.PatronFN, p.PatronLN, p.PatronID IS NOT NULL AS PatronFound
+        FROM Reservation r
+        LEFT JOIN LibraryItem i ON i.ItemID = r.ReservedItem
+        LEFT JOIN Patron p ON p.PatronID = r.ReservingPatron
+        WHERE {{filter}}
+    ),
+    pickups AS (
+        SELECT h.ReservationID, ret.DateReturned,
+               row_number() OVER (PARTITION BY h.ReservationID ORDER BY ret.DateReturned DESC) AS latest
+        FROM holds h
+        CROSS JOIN Checkout c ON c.ItemID = h.ReservedItem -- CROSS: a few holds drive ix_Checkout_item lookups
+        JOIN "Return" ret ON ret.TransactionID = c.TransactionID
+        WHERE h.ActiveTransactionID IS NULL AND ret.DateReturned >= h.DateReserved
     )
-    
-    if active_checkout:
-        return {
-            "AvailableForPickupDate": None,
-            "ExpirationDate": None,
-            "DaysRemaining": None,
-            "ReadyForPickup": False
-        }
-    
-    relevant_return = (
-        Return.query
-        .join(Checkout, Checkout.TransactionID == Return.TransactionID)
-        .filter(
-            Checkout.ItemID == item.ItemID,
-            Return.DateReturned >= reservation.DateReserved
-        )
-        .order_by(Return.DateReturned.desc())  # needed this to get the !!latest!! return
-        .first()
+    SELECT h.*,
+           pk.DateReturned AS AvailableForPickupDate,
+           date(pk.DateReturned, '+{RESERVATION_PICKUP_DAYS} days') AS ExpirationDate,
+           max(0, CAST(julianday(pk.DateReturned, '+{RESERVATION_PICKUP_DAYS} days') - julianday(:today) AS INTEGER))
+               AS DaysRemaining,
+           pk.DateReturned IS NOT NULL AS ReadyForPickup,
+           coalesce(h.Active = 1 AND h.ExpiresAt < :today, 0) AS Expired
+    FROM holds h
+    LEFT JOIN pickups pk ON pk.ReservationID = h.ReservationID AND pk.latest = 1
+    ORDER BY h.ReservationID
+"""
+
+def reservation_status_statement(patron_id: int = None, reservation_ids=None, item_ids=None,
+                                 active_only: bool = False) -> tuple:
+    '''RESERVATION_STATUS_SQL for a patron's holds or the given reservations/items, as (statement, params)'''
+    conditions, params = [], {"today": date.today().isoformat()}
+    if patron_id is not None:
+        conditions.append("r.ReservingPatron = :patron_id")
+        params["patron_id"] = patron_id
+    if reservation_ids is not None:
+        conditions.append("r.ReservationID IN :reservation_ids")
+        params["reservation_ids"] = list(reservation_ids)
+    if item_ids is not None:
+        conditions.append("r.ReservedItem IN :item_ids")
+        params["item_ids"] = list(item_ids)
+    if active_only:
+        conditions.append("r.Active = 1")
+
+    statement = text(RESERVATION_STATUS_SQL.format(filter=" AND ".join(conditions) or "1"))
+    for name in ("reservation_ids", "item_ids"):
+        if name in params:
+            statement = statement.bindparams(bindparam(name, expanding=True))
+    return statement, params
+
+def reservation_status_row(row) -> dict:
+    return dict(row, Active=bool(row["Active"]), ReadyForPickup=bool(row["ReadyForPickup"]), Expired=bool(row["Expired"]),
+                PatronFound=bool(row["PatronFound"]), DaysRemaining=row["DaysRemaining"] if row["ReadyForPickup"] else None)
+
+def reservation_statuses(patron_id: int = None, reservation_ids=None, item_ids=None, active_only: bool = False) -> list:
+    '''Pickup date, expiration date and days remaining for a patron's holds or the given reservations/items'''
+    statement, params = reservation_status_statement(patron_id, reservation_ids, item_ids, active_only)
+    return [reservation_status_row(row) for row in database.session.execute(statement, params).mappings()]
+
+def close_expired_reservation(status: dict):
+    '''Deactivates one hold whose pickup window passed - its item (if still reserved) is reshelved as in expire_old_reservations'''
+    database.session.execute(
+        update(Reservation)
+        .where(Reservation.ReservationID == status["ReservationID"], Reservation.Active == True)
+        .values(Active=False)
+        .execution_options(synchronize_session=False)
     )
-    
-    if relevant_return:
-        available_date = relevant_return.DateReturned
-        expiration_date = available_date + timedelta(days=5)
-        days_remaining = (expiration_date - date.today()).days
-        
-        return {
-            "AvailableForPickupDate": str(available_date),
-            "ExpirationDate": str(expiration_date),
-            "DaysRemaining": max(0, days_remaining),
-            "ReadyForPickup": True
+    back_to_cart = database.session.execute(
+        update(LibraryItem.__table__)
+        .where(LibraryItem.ItemID == status["ReservedItem"], LibraryItem.Status == 'reserved')
+        .values(Status='checked in')
+        .returning(LibraryItem.ItemID)
+    ).scalars().all()
+    enqueue_reshelve(back_to_cart)
+    database.session.commit()
+
+
+#### --- Pagination helpers --- ####
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(*values) -> str:
+    '''Packs the sort key of the last row on a page into an opaque url-safe token'''
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token: str, size: int):
+    '''Unpacks a token made by encode_cursor. Returns None if it is malformed.'''
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+def page_size_from(raw: str) -> int:
+    '''Clamps the ?limit= query parameter to 1..MAX_PAGE_SIZE'''
+    raw = (raw or '').strip()
+    if not raw.isdigit():
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(raw), MAX_PAGE_SIZE))
+
+def keyset_after(sort_col, id_col, last_sort, last_id):
+    '''
+    Filter for rows that come after (last_sort, last_id) in ORDER BY sort_col, id_col.
+    SQLite sorts NULLs first, so a NULL sort value is handled separately.
+    '''
+    if last_sort is None:
+        return or_(sort_col.isnot(None), and_(sort_col.is_(None), id_col > last_id))
+    return or_(sort_col > last_sort, and_(sort_col == last_sort, id_col > last_id))
+
+
+#### --- Patron search --- ####
+# Sort/search key for patrons. Must match ix_Patron_name exactly (ifnull with a literal '',
+# NOCASE) or SQLite can't use the index and falls back to scanning and sorting the table.
+def patron_name_key():
+    return (
+        func.ifnull(Patron.PatronLN, literal_column("''")).collate('NOCASE'),
+        func.ifnull(Patron.PatronFN, literal_column("''")).collate('NOCASE'),
+        Patron.PatronID
+    )
+
+def prefix_range(column, prefix: str):
+    '''column starts with prefix, written as a range so it can use the index'''
+    return and_(column >= prefix, column < prefix + '\U0010ffff')
+
+
+def like_contains(search_text: str) -> str:
+    '''%search_text% for LIKE, with the text's own \\, % and _ escaped - pair with escape='\\' '''
+    return '%' + search_text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+#### --- Catalog search --- ####
+SEARCH_FIELDS = {'any': None, 'title': 'ItemTitle', 'author': 'Author'}
+
+def catalog_match_expression(search_text: str, column: str = None):
+    '''
+    Turns free text typed at the desk into an FTS5 MATCH expression.
+    Every word is quoted so punctuation can't break the query, and words of 3+ letters
+    become prefix terms so "harr pot" finds "Harry Potter". Shorter words must match
+    whole - a 1-2 letter prefix expands to thousands of terms and is slow on a big catalog.
+    '''
+    words = re.findall(r'\w+', search_text.lower())
+    if not words:
+        return None
+    terms = ' '.join(f'"{word}"*' if len(word) >= 3 else f'"{word}"' for word in words)
+    if column:
+        return f'{{{column}}} : ({terms})'
+    return terms
+
+def catalog_search_statement(search_text: str, field: str = 'any', type_ids=None, offset: int = 0,
+                             limit: int = DEFAULT_PAGE_SIZE):
+    '''(statement, params) for one page of search_catalog plus one row, None if nothing can match'''
+    column = SEARCH_FIELDS.get(field)
+    type_filter = "AND i.ItemType IN :type_ids" if type_ids else ""
+
+    if catalog_search_enabled():
+        match = catalog_match_expression(search_text, column)
+        if match is None:
+            return None
+        stmt = text(f"""
+            SELECT i.ItemID, i.ItemTitle, i.Author, i.Status, i.ShelfCode, i.ItemType
+            FROM {CATALOG_SEARCH_TABLE} s
+            JOIN LibraryItem i ON i.ItemID = s.rowid
+            WHERE {CATALOG_SEARCH_TABLE} MATCH :match {type_filter}
+            ORDER BY bm25({CATALOG_SEARCH_TABLE}, 10.0, 4.0), i.ItemID
+            LIMIT :limit OFFSET :offset
+        """)
+        params = {"match": match}
+    else:
+        columns = [column] if column else ['ItemTitle', 'Author']
+        like = ' OR '.join(f"i.{c} LIKE :pattern ESCAPE '\\'" for c in columns)
+        stmt = text(f"""
+            SELECT i.ItemID, i.ItemTitle, i.Author, i.Status, i.ShelfCode, i.ItemType
+            FROM LibraryItem i
+            WHERE ({like}) {type_filter}
+            ORDER BY i.ItemTitle, i.ItemID
+            LIMIT :limit OFFSET :offset
+        """)
+        params = {"pattern": like_contains(search_text)}
+
+    if type_ids:
+        stmt = stmt.bindparams(bindparam('type_ids', expanding=True))
+        params["type_ids"] = list(type_ids)
+    params.update({"limit": limit + 1, "offset": offset})
+    return stmt, params
+
+def search_catalog(search_text: str, field: str = 'any', type_ids=None, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE):
+    '''
+    Ranked catalog search. Returns (rows, has_more) where rows are LibraryItem mappings
+    ordered best match first. Title matches weigh more than author matches.
+    '''
+    planned = catalog_search_statement(search_text, field, type_ids, offset, limit)
+    if planned is None:
+        return [], False
+    rows = database.session.execute(*planned).mappings().all()
+    return rows[:limit], len(rows) > limit
+
+#/api/search/items is split into its parameters, its queries and its JSON so the async
+#read server (asgi.py) answers it the same way
+def search_args(args) -> dict:
+    '''Reads /api/search/items parameters. Raises ValueError with the message for a 400.'''
+    search_text = args.get('q', '').strip()
+    field = args.get('field', 'any').strip().lower()
+    cursor = args.get('cursor', '').strip()
+
+    if field not in SEARCH_FIELDS:
+        raise ValueError(f"Invalid field '{field}'")
+    if not search_text:
+        raise ValueError("Search text is required")
+
+    offset = 0
+    if cursor:
+        last = decode_cursor(cursor, 1)
+        if last is None or not isinstance(last[0], int) or last[0] < 0:
+            raise ValueError("Invalid cursor")
+        offset = last[0]
+    return {
+        "search_text": search_text, "field": field, "offset": offset,
+        "limit": page_size_from(args.get('limit')),
+        "type_ids": [int(t) for t in args.getlist('type_id') if t.strip().isdigit()],
+    }
+
+def search_exact_id(search: dict) -> Optional[int]:
+    '''The circulation desk scans barcodes - a number in q is also looked up as an ItemID (first page only)'''
+    if search["search_text"].isdigit() and search["offset"] == 0 and search["field"] == 'any':
+        return int(search["search_text"])
+    return None
+
+def search_item_statement(item_id: int):
+    return select(
+        LibraryItem.ItemID, LibraryItem.ItemTitle, LibraryItem.Author, LibraryItem.Status,
+        LibraryItem.ShelfCode, LibraryItem.ItemType
+    ).where(LibraryItem.ItemID == item_id)
+
+def search_payload(search: dict, rows, has_more: bool, exact_item=None) -> dict:
+    results = [
+        {
+            "ItemID": row["ItemID"],
+            "ItemTitle": row["ItemTitle"],
+            "Author": row["Author"],
+            "Status": row["Status"],
+            "ShelfCode": row["ShelfCode"],
+            "ItemType": row["ItemType"]
         }
-    
+        for row in rows
+    ]
+
+    # an exact ID hit goes on top of the first page
+    item = exact_item
+    if item and (not search["type_ids"] or item.ItemType in search["type_ids"]):
+        results = [r for r in results if r["ItemID"] != item.ItemID]
+        results.insert(0, {
+            "ItemID": item.ItemID,
+            "ItemTitle": item.ItemTitle,
+            "Author": item.Author,
+            "Status": item.Status,
+            "ShelfCode": item.ShelfCode,
+            "ItemType": item.ItemType
+        })
+
     return {
-        "AvailableForPickupDate": None,
-        "ExpirationDate": None,
-        "DaysRemaining": None,
-        "ReadyForPickup": False
+        "ok": True,
+        "results": results,
+        "next_cursor": encode_cursor(search["offset"] + search["limit"]) if has_more else None,
+        "limit": search["limit"]
     }
 
 
+#### --- Conditional GET --- ####
+# Reference lists the desk pages load on every visit. Browsers (and a local reverse proxy)
+# keep the last copy and revalidate with If-None-Match / If-Modified-Since; a 304 costs
+# one primary-key read of TableVersion and never loads the table.
+PUBLIC_CACHE = 'public, max-age=60, must-revalidate'
+PRIVATE_CACHE = 'private, no-cache' # patron data: browser only, revalidate every time
+
+def conditional_get(table: str, cache_control: str = PUBLIC_CACHE):
+    '''Adds a strong ETag and Last-Modified from TableVersion, answers a matching request with 304'''
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version, modified_at = database.session.execute(
+                text("SELECT Version, ModifiedAt FROM TableVersion WHERE TableName = :table"), {"table": table}
+            ).one()
+            etag = f"{table}-{version}"
+            last_modified = datetime.fromtimestamp(modified_at, timezone.utc)
+            if table in ('ItemType', 'LibraryBranch') and reference_cache['versions'].get(table) != version:
+                invalidate_reference_cache() # changed outside this process - don't serve the old list as new
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                # second resolution: a change in the current second may not be visible in the date yet
+                not_modified = bool(request.if_modified_since) and modified_at < int(time.time()) and \
+                    request.if_modified_since >= last_modified
+            response = Response(status=304) if not_modified else app.make_response(view(*args, **kwargs))
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+                response.last_modified = last_modified
+                response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
+
+
 #### --- Routes --- ####
 MAX_ITEMS_PER_PATRON = 20
 
@@ -258,6 +1703,7 @@ def home():
 
 #### API Endpoints for Dropdown Menu's on Front-end ####
 @app.route('/patrons') #is this the api route for patrons
+@conditional_get('Patron', PRIVATE_CACHE)
 def patrons() -> jsonify:
     '''This route returns JSON data of all patrons in the database'''
     all_patrons = Patron.query.all()
@@ -274,11 +1720,63 @@ def patrons() -> jsonify:
 
     return jsonify(patrons_list)
 
+@app.route('/api/patrons')
+def api_patrons_page() -> Response:
+    '''
+    Paged patron listing ordered by last name, first name.
+    /api/patrons?q=smi&limit=50&cursor=token
+    q is a name prefix: "smi" matches last names, "smith, jo" also narrows first names,
+    and a number matches that PatronID. The page is streamed as it is read.
+    '''
+    search_text = request.args.get('q', '').strip()
+    cursor = request.args.get('cursor', '').strip()
+    limit = page_size_from(request.args.get('limit'))
+
+    last_name, first_name, patron_id = patron_name_key()
+    query = database.session.query(Patron.PatronID, Patron.PatronFN, Patron.PatronLN, Patron.FeesOwed)
+
+    if search_text.isdigit():
+        query = query.filter(Patron.PatronID == int(search_text))
+    elif search_text:
+        ln_prefix, _, fn_prefix = search_text.partition(',')
+        if ln_prefix.strip():
+            query = query.filter(prefix_range(last_name, ln_prefix.strip()))
+        if fn_prefix.strip():
+            query = query.filter(prefix_range(first_name, fn_prefix.strip()))
+
+    if cursor:
+        last = decode_cursor(cursor, 3)
+        if last is None or not isinstance(last[2], int):
+            return jsonify({"ok": False, "error": "Invalid cursor"}), 400
+        query = query.filter(tuple_(last_name, first_name, patron_id) > tuple_(*last))
+
+    query = query.order_by(last_name, first_name, patron_id).limit(limit + 1)
+
+    def generate():
+        yield '{"ok": true, "patrons": ['
+        last_row = None
+        for count, p in enumerate(query.yield_per(100)):
+            if count == limit: # the extra row only tells us there is a next page
+                yield '], "next_cursor": %s}' % json.dumps(
+                    encode_cursor(last_row.PatronLN or '', last_row.PatronFN or '', last_row.PatronID))
+                return
+            yield (',' if count else '') + json.dumps({
+                "PatronID": p.PatronID,
+                "FName": p.PatronFN,
+                "LName": p.PatronLN,
+                "Fees": float(p.FeesOwed or 0)
+            })
+            last_row = p
+        yield '], "next_cursor": null}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
 @app.route('/api/itemtypes') 
+@conditional_get('ItemType')
 def api_item_types() -> jsonify:
     '''This api returns all item types from the database in JSON format'''
     
-    all_types = ItemType.query.order_by(ItemType.TypeName).all() # Query all ItemType objects from the db
+    all_types = sorted(reference_table('item_types').values(), key=lambda t: t.TypeName or '') # from the reference cache
     types_list = [] # Init empty list to store JSON dicts
 
     # Loop through all types in db, create new dict for each TypeID & TypeName, add to JSON list of dicts
@@ -293,25 +1791,112 @@ def api_item_types() -> jsonify:
 
 @app.route('/api/items')
 def api_items_by_type() -> jsonify:
-    '''This api returns all library items[ID & Title] in JSON format'''
-    type_id_from_url = request.args.get('type_id', '').strip() # check for query parameter in url
+    '''
+    This api returns library items[ID & Title] in JSON format.
+    Legacy mode (no q/status/cursor/limit): a plain list of every item, optionally filtered by type_id.
+    Paged mode: /api/items?q=text&type_id=1&status=available&limit=50&cursor=token
+    returns {"ok", "items", "next_cursor"} ordered by (ItemTitle, ItemID).
+    '''
+    if not items_paged(request.args):
+        return jsonify(items_list_payload(database.session.execute(items_list_statement(request.args)).all()))
 
-    query = LibraryItem.query
-    if type_id_from_url.isdigit(): 
-        query = query.filter(LibraryItem.ItemType == int(type_id_from_url))
+    # --- Paged mode ---
+    try:
+        statement, limit = items_page_statement(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    return jsonify(items_page_payload(database.session.execute(statement).all(), limit))
+
+#/api/items as statements and their JSON, shared with the async read server (asgi.py)
+def items_paged(args) -> bool:
+    return any(key in args for key in ('q', 'status', 'cursor', 'limit'))
+
+def items_list_statement(args):
+    '''Legacy /api/items: every item (of ?type_id=), by title'''
+    type_id_from_url = args.get('type_id', '').strip() # check for query parameter in url
+
+    query = select(LibraryItem.ItemID, LibraryItem.ItemTitle)
+    if type_id_from_url.isdigit():
+        query = query.where(LibraryItem.ItemType == int(type_id_from_url))
     #BERKER: filtering unavailable items from dropdown, will remove after changing dropdown structure.
-    #query = query.filter(LibraryItem.Availability == True)
-    items_from_db = query.order_by(LibraryItem.ItemTitle).all()
+    #query = query.where(LibraryItem.Availability == True)
+    return query.order_by(LibraryItem.ItemTitle)
+
+def items_list_payload(rows) -> list:
+    return [{"ItemID": item.ItemID, "ItemTitle": item.ItemTitle} for item in rows]
+
+def items_page_statement(args) -> tuple:
+    '''(statement, limit) for one page of /api/items. Raises ValueError with the message for a 400.'''
+    type_id = args.get('type_id', '').strip()
+    search_text = args.get('q', '').strip()
+    status = args.get('status', '').strip()
+    cursor = args.get('cursor', '').strip()
+    limit = page_size_from(args.get('limit'))
+
+    query = select(LibraryItem.ItemID, LibraryItem.ItemTitle, LibraryItem.Status)
+    if type_id.isdigit():
+        query = query.where(LibraryItem.ItemType == int(type_id))
+
+    if status:
+        if status not in ITEM_STATUSES:
+            raise ValueError(f"Invalid status '{status}'")
+        query = query.where(LibraryItem.Status == status)
+
+    if search_text:
+        title_match = LibraryItem.ItemTitle.ilike(like_contains(search_text), escape='\\')
+        if search_text.isdigit(): # numbers can be an ItemID or part of a title
+            query = query.where(or_(LibraryItem.ItemID == int(search_text), title_match))
+        else:
+            query = query.where(title_match)
 
-    output_list = []
-    for item in items_from_db:
-        item_data = {
-            "ItemID": item.ItemID,
-            "ItemTitle": item.ItemTitle
-        }
+    if cursor:
+        last = decode_cursor(cursor, 2)
+        if last is None or not isinstance(last[1], int):
+            raise ValueError("Invalid cursor")
+        query = query.where(keyset_after(LibraryItem.ItemTitle, LibraryItem.ItemID, last[0], last[1]))
 
-        output_list.append(item_data)
-    return jsonify(output_list)
+    # fetch one extra row to know if there is another page
+    return query.order_by(LibraryItem.ItemTitle, LibraryItem.ItemID).limit(limit + 1), limit
+
+def items_page_payload(rows, limit: int) -> dict:
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1].ItemTitle, rows[-1].ItemID)
+
+    return {
+        "ok": True,
+        "items": [
+            {
+                "ItemID": item.ItemID,
+                "ItemTitle": item.ItemTitle,
+                "Status": item.Status
+            }
+            for item in rows
+        ],
+        "next_cursor": next_cursor,
+        "limit": limit
+    }
+
+@app.route('/api/search/items')
+def api_search_items() -> jsonify:
+    '''
+    Ranked full-text search over item titles and authors.
+    /api/search/items?q=text&field=any|title|author&type_id=1&type_id=2&limit=20&cursor=token
+    A number in q also matches that ItemID exactly, listed first.
+    '''
+    try:
+        search = search_args(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    rows, has_more = search_catalog(search["search_text"], search["field"], search["type_ids"],
+                                    search["offset"], search["limit"])
+    exact_id = search_exact_id(search)
+    exact_item = database.session.execute(search_item_statement(exact_id)).first() if exact_id is not None else None
+    return jsonify(search_payload(search, rows, has_more, exact_item))
 
 @app.route('/api/patrons-with-checkouts')
 def api_patrons_with_checkouts() -> jsonify:
@@ -322,13 +1907,11 @@ def api_patrons_with_checkouts() -> jsonify:
     active_checkout_patrons = (
         database.session.query(Patron) # create db query
         .join(Checkout, Patron.PatronID == Checkout.PatronID)
-        .join(LibraryItem, Checkout.ItemID == LibraryItem.ItemID)
-        .outerjoin(Return, Checkout.TransactionID == Return.TransactionID)
+        .join(LibraryItem, Checkout.TransactionID == LibraryItem.ActiveTransactionID) # item's open loan
         .filter(
 
             #DBU
             LibraryItem.Status == "checked out", # Item is not on shelf
-            Return.TransactionID.is_(None)     # and item is not yet returned
         )
         .distinct(Patron.PatronID) 
         .order_by(Patron.PatronLN, Patron.PatronFN)
@@ -352,13 +1935,11 @@ def api_checked_out_items() -> jsonify:
     """
     query = (
         LibraryItem.query
-        .join(Checkout, LibraryItem.ItemID == Checkout.ItemID)
-        .outerjoin(Return, Checkout.TransactionID == Return.TransactionID)
         .filter(
 
             #DBU
             LibraryItem.Status == "checked out", # Item is not on shelf
-            Return.TransactionID.is_(None)     # AND not yet returned - this results in checked out state
+            LibraryItem.ActiveTransactionID.isnot(None) # AND not yet returned - this results in checked out state
         )
     )
 
@@ -374,9 +1955,10 @@ def api_checked_out_items() -> jsonify:
     return jsonify(output_list)
 
 @app.route('/api/branches')
+@conditional_get('LibraryBranch')
 def api_branches():
     '''API endpoint that returns all library branches'''
-    all_branches = LibraryBranch.query.order_by(LibraryBranch.BranchName).all()
+    all_branches = sorted(reference_table('branches').values(), key=lambda b: b.BranchName or '')
     branch_list = [ # create list for json to be returned
         {"BranchID": branch.BranchID, "BranchName": branch.BranchName}
         for branch in all_branches
@@ -384,67 +1966,100 @@ def api_branches():
     return jsonify(branch_list)
 
 #BERKER: to get item details by ID (replaced dropdown approach)
-@app.route('/api/item/<int:item_id>')
-def api_get_item(item_id: int):
-    item = LibraryItem.query.get(item_id) 
-    if not item:
-        return jsonify({"ok": False, "error": "Item not found"}), 404  
-
-    # Fetch item type
-    item_type = ItemType.query.get(item.ItemType)
-
-    # --- RESERVATION LOGIC ---
-    active_res = (
-        Reservation.query.filter(
-            Reservation.ReservedItem == item_id,
-            Reservation.Active == True
-        )
-        .first()
-    )
-
+#Payloads for /api/item/<id> and /api/items/lookup, in two queries for any number of items
+#(items, active holds; the type comes from the reference cache). Reads never write: a hold
+#past its pickup deadline is shown as already expired - the item as back in the reshelve
+#queue, like expire_old_reservations() will leave it - and is closed by that batch job.
+MAX_LOOKUP_ITEMS = 200
+
+def item_lookup_statement(item_ids):
+    return select(
+        LibraryItem.ItemID, LibraryItem.ItemTitle, LibraryItem.ItemType, LibraryItem.Status, LibraryItem.ShelfCode
+    ).where(LibraryItem.ItemID.in_(list(item_ids)))
+
+def item_payloads(item_ids) -> dict:
+    '''{ItemID: payload} for the items that exist'''
+    item_ids = list(item_ids)
+    if not item_ids:
+        return {}
+    items = database.session.execute(item_lookup_statement(item_ids)).all()
+    if not items:
+        return {}
+    holds = reservation_statuses(item_ids=[item.ItemID for item in items], active_only=True)
+    item_types = {type_id: get_item_type(type_id) for type_id in {item.ItemType for item in items}}
+    return build_item_payloads(items, holds, item_types)
+
+def build_item_payloads(items, hold_statuses, item_types: dict) -> dict:
+    '''
+    The payloads from item rows (item_lookup_statement), their active holds (as from
+    reservation_statuses) and {TypeID: ItemTypeInfo} - no queries, so the async
+    read server (asgi.py) builds exactly the same JSON
+    '''
+    holds = {}
+    for res in hold_statuses:
+        holds.setdefault(res["ReservedItem"], res)
+
+    payloads = {}
+    for item in items:
+        item_type = item_types.get(item.ItemType)
+        status = item.Status
+
+        # --- RESERVATION LOGIC ---
+        active_res = holds.get(item.ItemID)
+        reservation_info = None
+        if active_res and active_res["Expired"]:
+            if status == 'reserved':
+                status = 'checked in'
+            active_res = None
+        elif active_res and active_res["PatronFound"]:
+            reservation_info = {
+                "ReservedBy": active_res["ReservingPatron"],
+                "ReservedByName": f"{active_res['PatronFN']} {active_res['PatronLN']}",
+                "DateReserved": active_res["DateReserved"],
+                "ReservationID": active_res["ReservationID"],
+                "AvailableForPickupDate": active_res["AvailableForPickupDate"],
+                "ExpirationDate": active_res["ExpirationDate"],
+                "DaysRemaining": active_res["DaysRemaining"]
+            }
 
-    reservation_info = None
-    reserved = False
+        payloads[item.ItemID] = {
+            "ok": True,
+            "ItemID": item.ItemID,
+            "ItemTitle": item.ItemTitle,
+            "ItemType": item_type.TypeName if item_type else "Unknown",
+            "Status": status,
+            "ShelfCode": item.ShelfCode,
 
-    if active_res:
-        #now checking if expired
-        if is_reservation_expired(active_res, item):
-            active_res.Active = False
-            item.Status = 'available'
-            database.session.commit()
-            active_res = None
-        else:
-            reserved = True
-            patron = Patron.query.get(active_res.ReservingPatron)
-            if patron:
-                # get xpiration info
-                exp_info = get_reservation_expiration_info(active_res, item)
-                
-                reservation_info = {
-                    "ReservedBy": patron.PatronID,
-                    "ReservedByName": f"{patron.PatronFN} {patron.PatronLN}",
-                    "DateReserved": str(active_res.DateReserved),
-                    "ReservationID": active_res.ReservationID,
-                    "AvailableForPickupDate": exp_info["AvailableForPickupDate"],
-                    "ExpirationDate": exp_info["ExpirationDate"],
-                    "DaysRemaining": exp_info["DaysRemaining"]
-                }
+            # NEW fields:
+            "Reserved": active_res is not None,
+            "ReservationInfo": reservation_info
+        }
+    return payloads
 
-    # Build response
-    item_data = {
+@app.route('/api/item/<int:item_id>')
+def api_get_item(item_id: int):
+    payload = item_payloads([item_id]).get(item_id)
+    if not payload:
+        return jsonify({"ok": False, "error": "Item not found"}), 404  
+    return jsonify(payload)
+
+#Many scans in one round trip: {"item_ids": [1, 2, 3]} -> same payload as /api/item/<id> per item
+@app.route('/api/items/lookup', methods=['POST'])
+def api_lookup_items():
+    payload = request.get_json(silent=True) or {}
+    item_ids = payload.get('item_ids')
+    if not isinstance(item_ids, list) or not all(str(x).strip().isdigit() for x in item_ids):
+        return jsonify({"ok": False, "error": "item_ids must be a list of item IDs"}), 400
+    item_ids = list(dict.fromkeys(int(x) for x in item_ids)) # same barcode scanned twice is one lookup
+    if len(item_ids) > MAX_LOOKUP_ITEMS:
+        return jsonify({"ok": False, "error": f"At most {MAX_LOOKUP_ITEMS} items per lookup"}), 400
+
+    payloads = item_payloads(item_ids)
+    return jsonify({
         "ok": True,
-        "ItemID": item.ItemID,
-        "ItemTitle": item.ItemTitle,
-        "ItemType": item_type.TypeName if item_type else "Unknown",
-        "Status": item.Status,
-        "ShelfCode": item.ShelfCode,
-
-        # NEW fields:
-        "Reserved": reserved,
-        "ReservationInfo": reservation_info
-    }
-    
-    return jsonify(item_data)
+        "items": [payloads[item_id] for item_id in item_ids if item_id in payloads],
+        "not_found": [item_id for item_id in item_ids if item_id not in payloads]
+    })
 
 
 
@@ -463,14 +2078,12 @@ def api_items_for_patron() -> jsonify:
 
     items_for_patron = ( # Find items for this patron that are 'CheckedOut'
         database.session.query(LibraryItem)
-        .join(Checkout, LibraryItem.ItemID == Checkout.ItemID)
-        .outerjoin(Return, Checkout.TransactionID == Return.TransactionID)
+        .join(Checkout, LibraryItem.ActiveTransactionID == Checkout.TransactionID) # only the open loan
         .filter(
             Checkout.PatronID == patron_id,
 
             #DBU
             LibraryItem.Status == "checked out", # Item is not on shelf
-            Return.TransactionID.is_(None)     # AND not yet returned
         )
         .order_by(LibraryItem.ItemTitle)
         .all()
@@ -516,6 +2129,7 @@ def _parse_date_any(s: str):
     return None
 
 @app.route('/api/extend_membership', methods=['POST'])
+@retry_on_busy
 def extend_membership():
     """
     Extend/set a patron's membership expiration.
@@ -582,7 +2196,14 @@ def check_fines():
     if not patron:
         return jsonify({"ok": False, "error": "Patron not found"}), 404
     fines = float(patron.FeesOwed or 0)
-    return jsonify({"ok": True, "patron_id": patron.PatronID, "fines_due": fines})
+    projected = database.session.get(ProjectedFine, patron_id) # last accrue_fines() run, if any
+    return jsonify({
+        "ok": True,
+        "patron_id": patron.PatronID,
+        "fines_due": fines,
+        "projected_fines": float(projected.AccruedFines) if projected else 0.0,
+        "projected_as_of": str(projected.ComputedOn) if projected else None
+    })
 
 
 #BERKER returns patron details by patron id
@@ -602,12 +2223,13 @@ def api_get_patron(patron_id: int) -> jsonify:
         "FullName": f"{patron.PatronFN} {patron.PatronLN}",
         "AccountExpDate": str(patron.AccountExpDate),
         "FeesOwed": float(patron.FeesOwed or 0),
-        "ItemsCheckedOut": patron.ItemsCheckedOut or 0
+        "ItemsCheckedOut": open_loans_for(patron.PatronID)
     }
     
     return jsonify(patron_data)
 
 @app.route('/api/pay_fines', methods=['POST'])
+@retry_on_busy
 def pay_fines():
     payload = request.get_json(silent=True) or request.form
     try:
@@ -637,6 +2259,7 @@ def reserve_form():
     return render_template('reserve.html')
 
 @app.route('/api/reserve', methods=['POST'])
+@retry_on_busy
 def reserve_item():
     payload = request.get_json(silent=True) or request.form
     
@@ -672,8 +2295,27 @@ def reserve_item():
         Active=True
     )
     database.session.add(new_reservation)
+    try:
+        database.session.flush() # ux_Reservation_active_item: another desk may have reserved it since the check above
+    except IntegrityError:
+        database.session.rollback()
+        return jsonify({
+            "ok": False, 
+            "error": "Item is already reserved"
+        }), 400
     
-    item.Status = 'reserved'
+    # only if nobody changed the item since we read it (e.g. checked it out)
+    claimed = database.session.execute(
+        update(LibraryItem)
+        .where(LibraryItem.ItemID == item_id, LibraryItem.Status == item.Status)
+        .values(Status='reserved')
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if claimed != 1:
+        database.session.rollback()
+        return jsonify({"ok": False, "error": "Item changed at another desk, please try again"}), 409
+    if item.Status == 'checked in':
+        dequeue_reshelve([item_id]) # off the cart, onto the holds shelf
     
     database.session.commit()
     
@@ -686,6 +2328,7 @@ def reserve_item():
     })
 
 @app.route('/api/cancel_reservation', methods=['POST'])
+@retry_on_busy
 def cancel_reservation():
     '''Cancel a reservation'''
     payload = request.get_json(silent=True) or request.form
@@ -703,13 +2346,24 @@ def cancel_reservation():
     if not reservation.Active:
         return jsonify({"ok": False, "error": "Reservation is already cancelled"}), 400
     
-    # mark active
-    reservation.Active = False
+    # mark inactive - unless it was closed meanwhile (picked up, expired, cancelled at another desk)
+    cancelled = database.session.execute(
+        update(Reservation)
+        .where(Reservation.ReservationID == reservation_id, Reservation.Active == True)
+        .values(Active=False)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if cancelled != 1:
+        database.session.rollback()
+        return jsonify({"ok": False, "error": "Reservation is already cancelled"}), 400
     
-    # updats back to avaialble
-    item = LibraryItem.query.get(reservation.ReservedItem)
-    if item and item.Status == 'reserved':
-        item.Status = 'available'
+    # updats back to avaialble - the WHERE keeps a checkout that just happened from being undone
+    database.session.execute(
+        update(LibraryItem)
+        .where(LibraryItem.ItemID == reservation.ReservedItem, LibraryItem.Status == 'reserved')
+        .values(Status='available')
+        .execution_options(synchronize_session=False)
+    )
     
     database.session.commit()
     
@@ -721,43 +2375,37 @@ def cancel_reservation():
 
 #BERKER: New endpoint to check reservation status with expiration info
 @app.route('/api/reservation/<int:reservation_id>', methods=['GET'])
+@retry_on_busy
 def get_reservation_status(reservation_id: int):
     '''Get detailed reservation status including expiration info'''
-    reservation = Reservation.query.get(reservation_id)
+    reservation = next(iter(reservation_statuses(reservation_ids=[reservation_id])), None)
     
     if not reservation:
         return jsonify({"ok": False, "error": "Reservation not found"}), 404
     
-    item = LibraryItem.query.get(reservation.ReservedItem)
-    
-    if is_reservation_expired(reservation, item):
-        reservation.Active = False
-        if item and item.Status == 'reserved':
-            item.Status = 'available'
-        database.session.commit()
-    
-    patron = Patron.query.get(reservation.ReservingPatron)
-    
-    exp_info = get_reservation_expiration_info(reservation, item)
+    if reservation["Expired"]:
+        close_expired_reservation(reservation)
+        reservation["Active"] = False
     
     return jsonify({
         "ok": True,
-        "ReservationID": reservation.ReservationID,
-        "Active": reservation.Active,
-        "PatronID": reservation.ReservingPatron,
-        "PatronName": f"{patron.PatronFN} {patron.PatronLN}" if patron else None,
-        "ItemID": reservation.ReservedItem,
-        "ItemTitle": item.ItemTitle if item else None,
-        "DateReserved": str(reservation.DateReserved),
-        "AvailableForPickupDate": exp_info["AvailableForPickupDate"],
-        "ExpirationDate": exp_info["ExpirationDate"],
-        "DaysRemaining": exp_info["DaysRemaining"],
-        "Expired": is_reservation_expired(reservation, item)
+        "ReservationID": reservation["ReservationID"],
+        "Active": reservation["Active"],
+        "PatronID": reservation["ReservingPatron"],
+        "PatronName": f"{reservation['PatronFN']} {reservation['PatronLN']}" if reservation["PatronFound"] else None,
+        "ItemID": reservation["ReservedItem"],
+        "ItemTitle": reservation["ItemTitle"],
+        "DateReserved": reservation["DateReserved"],
+        "AvailableForPickupDate": reservation["AvailableForPickupDate"],
+        "ExpirationDate": reservation["ExpirationDate"],
+        "DaysRemaining": reservation["DaysRemaining"],
+        "Expired": reservation["Expired"]
     })
 
 
 #BERKER: New endpoint to get all reservations for a patron
 @app.route('/api/patron/<int:patron_id>/reservations', methods=['GET'])
+@retry_on_busy
 def get_patron_reservations(patron_id: int):
     patron = Patron.query.get(patron_id)
     if not patron:
@@ -765,26 +2413,19 @@ def get_patron_reservations(patron_id: int):
     
     expire_old_reservations()
     
-    reservations = Reservation.query.filter_by(
-        ReservingPatron=patron_id,
-        Active=True
-    ).all()
-    
-    reservation_list = []
-    for res in reservations:
-        item = LibraryItem.query.get(res.ReservedItem)
-        exp_info = get_reservation_expiration_info(res, item)
-        
-        reservation_list.append({
-            "ReservationID": res.ReservationID,
-            "ItemID": res.ReservedItem,
-            "ItemTitle": item.ItemTitle if item else "Unknown",
-            "DateReserved": str(res.DateReserved),
-            "AvailableForPickupDate": exp_info["AvailableForPickupDate"],
-            "ExpirationDate": exp_info["ExpirationDate"],
-            "DaysRemaining": exp_info["DaysRemaining"],
-            "ReadyForPickup": exp_info["ReadyForPickup"]
-        })
+    reservation_list = [
+        {
+            "ReservationID": res["ReservationID"],
+            "ItemID": res["ReservedItem"],
+            "ItemTitle": res["ItemTitle"] or "Unknown",
+            "DateReserved": res["DateReserved"],
+            "AvailableForPickupDate": res["AvailableForPickupDate"],
+            "ExpirationDate": res["ExpirationDate"],
+            "DaysRemaining": res["DaysRemaining"],
+            "ReadyForPickup": res["ReadyForPickup"]
+        }
+        for res in reservation_statuses(patron_id=patron_id, active_only=True)
+    ]
     
     return jsonify({
         "ok": True,
@@ -795,6 +2436,55 @@ def get_patron_reservations(patron_id: int):
     })
 
 
+def loan_history_page(patron_id: Optional[int] = None, item_id: Optional[int] = None):
+    '''Shared body of the history routes: ?limit=50&cursor=token, newest loan first'''
+    limit = page_size_from(request.args.get('limit'))
+    before = None
+    cursor = request.args.get('cursor', '').strip()
+    if cursor:
+        last = decode_cursor(cursor, 1)
+        if last is None or not isinstance(last[0], int):
+            return jsonify({"ok": False, "error": "Invalid cursor"}), 400
+        before = last[0]
+
+    # fetch one extra row to know if there is another page
+    rows = loan_history(patron_id=patron_id, item_id=item_id, before=before, limit=limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify({
+        "ok": True,
+        "loans": [
+            {
+                "TransactionID": row["TransactionID"],
+                "PatronID": row["PatronID"],
+                "ItemID": row["ItemID"],
+                "ItemTitle": row["ItemTitle"],
+                "CheckoutDate": row["CheckoutDate"],
+                "DueDate": row["DueDate"],
+                "DateReturned": row["DateReturned"],
+                "BranchReturnedTo": row["BranchReturnedTo"],
+                "Archived": row["Archived"]
+            }
+            for row in rows
+        ],
+        "next_cursor": encode_cursor(rows[-1]["TransactionID"]) if has_more else None,
+        "limit": limit
+    })
+
+@app.route('/api/patron/<int:patron_id>/history', methods=['GET'])
+def get_patron_history(patron_id: int):
+    '''Every loan a patron has made, archived ones included'''
+    if database.session.get(Patron, patron_id) is None:
+        return jsonify({"ok": False, "error": "Patron not found"}), 404
+    return loan_history_page(patron_id=patron_id)
+
+@app.route('/api/item/<int:item_id>/history', methods=['GET'])
+def get_item_history(item_id: int):
+    '''Every loan of an item, archived ones included'''
+    if database.session.get(LibraryItem, item_id) is None:
+        return jsonify({"ok": False, "error": "Item not found"}), 404
+    return loan_history_page(item_id=item_id)
+
 
 # Checkin demo
 #---------------------------
@@ -803,6 +2493,7 @@ def checkin_form():
     return render_template('checkin.html')
 
 @app.route('/checkin', methods=['POST'])
+@retry_on_busy
 def checkin_item() -> jsonify:
     '''
     This function processes a check-in transaction.
@@ -819,41 +2510,47 @@ def checkin_item() -> jsonify:
     item_id = int(item_id_str) # Set item and branch id to integer for query
     branch_id = int(branch_id_str)
 
-    branch = LibraryBranch.query.get(branch_id) # query for branch object
+    branch = get_branch(branch_id) # branch from the reference cache
     if not branch: # raise error if the branch is not found
             return jsonify({"ok": False, "error": "Branch not found"}), 404
 
-    # Find Active checkout - active checkout is one with this ItemID that has no corresponding return record (based on return id)
-    active_checkout = (
-        Checkout.query # Query checkout table
-        .outerjoin(Return, Return.TransactionID == Checkout.TransactionID) 
-        .filter(
-            Checkout.ItemID == item_id,
-            Return.TransactionID.is_(None) # No return record exists
-        )
-        .first()
-    )
+    item = database.session.get(LibraryItem, item_id) # Get the item object
+
+    # Find Active checkout - the item points at its open loan (no corresponding return record)
+    active_checkout = None
+    if item and item.ActiveTransactionID:
+        active_checkout = database.session.get(Checkout, item.ActiveTransactionID)
 
     # shouldn't need this but it's a double check on the js
     if not active_checkout: # If no active checkout is found, it's either already 'Available' or 'CheckedIn'
-        item_check = LibraryItem.query.get(item_id)
 
         #DBU
-        if item_check and item_check.Status == "available":
+        if item and item.Status == "available":
                 return jsonify({"ok": False, "error": "This item is still Available."}), 400
         else:
                 return jsonify({"ok": False, "error": "This item is already 'CheckedIn' and awaiting reshelving"}), 400
 
-    item = LibraryItem.query.get(item_id) # Get the item object
-    patron = Patron.query.get(active_checkout.PatronID) # Get the patron object
+    patron = database.session.get(Patron, active_checkout.PatronID) # Get the patron object
 
     if not item or not patron: #check against database error - if this hits check the db
             return jsonify({"ok": False, "error": "Internal Error: Item or Patron record missing"}), 500 
 
     try:
             
-            #Switches status of item from checked out to checked in
-            item.Status = 'checked in'
+            #Switches status of item from checked out to checked in - only if this loan is still open,
+            #so two desks scanning the same return can't both check it in
+            closed = database.session.execute(
+                update(LibraryItem)
+                .where(
+                    LibraryItem.ItemID == item_id,
+                    LibraryItem.ActiveTransactionID == active_checkout.TransactionID
+                )
+                .values(Status='checked in', ActiveTransactionID=None)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if closed != 1:
+                database.session.rollback()
+                return jsonify({"ok": False, "error": "This item is already 'CheckedIn' and awaiting reshelving"}), 409
 
             return_date = date.today()
             
@@ -865,14 +2562,28 @@ def checkin_item() -> jsonify:
                 BranchReturnedTo=branch_id
             )
             database.session.add(new_return)
+            enqueue_reshelve([item_id], branch_id, return_date)
+
+            # a waiting hold now has its pickup window
+            database.session.execute(
+                update(Reservation)
+                .where(
+                    Reservation.ReservedItem == item_id,
+                    Reservation.Active == True,
+                    Reservation.ExpiresAt.is_(None)
+                )
+                .values(ExpiresAt=return_date + timedelta(days=RESERVATION_PICKUP_DAYS))
+            )
 
-            current_count = patron.ItemsCheckedOut or 0
-            if current_count > 0:
-                patron.ItemsCheckedOut = current_count - 1
-
+            # the fine is added in SQL so concurrent desks don't overwrite each other's totals
+            # (the loan count is PatronStanding's, the Return insert takes care of it)
             if fine_amount > 0:
-                current_fees = float(patron.FeesOwed or 0)
-                patron.FeesOwed = current_fees + fine_amount
+                database.session.execute(
+                    update(Patron)
+                    .where(Patron.PatronID == patron.PatronID)
+                    .values(FeesOwed=func.coalesce(Patron.FeesOwed, 0) + fine_amount)
+                    .execution_options(synchronize_session=False)
+                )
 
             database.session.commit()
             response_data = {
@@ -894,11 +2605,157 @@ def checkin_item() -> jsonify:
             return jsonify(response_data)
 
     except Exception as e:
+        if is_sqlite_busy(e):
+            raise # retry_on_busy runs the check-in again
         database.session.rollback()
         app.logger.error(f"Error during checkin: {e}")
         return jsonify({"ok": False, "error": f"A database error occurred: {e}"}), 500
 
 
+#Returns bin: many items, one branch, one transaction. Same rules and messages as /checkin,
+#but every step is a set-based statement over the whole batch, so the number of queries
+#and fsyncs does not grow with the number of items.
+#{"branch_id": 1, "item_ids": [1, 2, 3]} -> an outcome per item, in request order
+MAX_BULK_CHECKIN = 1000
+
+@app.route('/api/checkin/bulk', methods=['POST'])
+@retry_on_busy
+def checkin_bulk() -> jsonify:
+    payload = request.get_json(silent=True) or {}
+    item_ids = payload.get('item_ids')
+    branch_id_str = str(payload.get('branch_id', '')).strip()
+
+    if not isinstance(item_ids, list) or not item_ids or not all(str(x).strip().isdigit() for x in item_ids) \
+            or not branch_id_str.isdigit():
+        return jsonify({"ok": False, "error": "Invalid ItemIDs or BranchID"}), 400
+    item_ids = list(dict.fromkeys(int(x) for x in item_ids)) # an item scanned twice is checked in once
+    if len(item_ids) > MAX_BULK_CHECKIN:
+        return jsonify({"ok": False, "error": f"At most {MAX_BULK_CHECKIN} items per batch"}), 400
+
+    branch_id = int(branch_id_str)
+    if not get_branch(branch_id):
+        return jsonify({"ok": False, "error": "Branch not found"}), 404
+
+    return_date = date.today()
+    try:
+        # items with their open loans and borrowers, in one query
+        rows = (
+            database.session.query(LibraryItem, Checkout, Patron)
+            .outerjoin(Checkout, Checkout.TransactionID == LibraryItem.ActiveTransactionID)
+            .outerjoin(Patron, Patron.PatronID == Checkout.PatronID)
+            .filter(LibraryItem.ItemID.in_(item_ids))
+            .all()
+        )
+        loaded = {item.ItemID: (item, checkout, patron) for item, checkout, patron in rows}
+
+        outcomes = {}
+        to_close = {}
+        for item_id in item_ids:
+            item, checkout, patron = loaded.get(item_id, (None, None, None))
+            if item is None:
+                outcomes[item_id] = {"item_id": item_id, "ok": False, "error": "Item not found"}
+            elif checkout is None:
+                #DBU
+                error = "This item is still Available." if item.Status == "available" \
+                    else "This item is already 'CheckedIn' and awaiting reshelving"
+                outcomes[item_id] = {"item_id": item_id, "ok": False, "error": error}
+            elif patron is None:
+                outcomes[item_id] = {"item_id": item_id, "ok": False, "error": "Internal Error: Item or Patron record missing"}
+            else:
+                to_close[item_id] = (item, checkout, patron)
+
+        # close every loan that is still open - RETURNING tells which ones this request won
+        closed = set()
+        if to_close:
+            closed = set(database.session.execute(
+                update(LibraryItem.__table__)
+                .where(
+                    LibraryItem.ItemID.in_(list(to_close)), # lets SQLite use the primary key
+                    tuple_(LibraryItem.ItemID, LibraryItem.ActiveTransactionID).in_(
+                        [(item_id, checkout.TransactionID) for item_id, (_, checkout, _) in to_close.items()]
+                    )
+                )
+                .values(Status='checked in', ActiveTransactionID=None)
+                .returning(LibraryItem.ItemID)
+            ).scalars())
+
+        per_patron = {} # PatronID -> fines for their items in the batch
+        returns = []
+        for item_id, (item, checkout, patron) in to_close.items():
+            if item_id not in closed:
+                outcomes[item_id] = {"item_id": item_id, "ok": False,
+                                     "error": "This item is already 'CheckedIn' and awaiting reshelving"}
+                continue
+            fine_amount = calculate_fine(checkout, item, return_date)
+            returns.append({"TransactionID": checkout.TransactionID, "DateReturned": return_date,
+                            "BranchReturnedTo": branch_id})
+            per_patron[patron.PatronID] = per_patron.get(patron.PatronID, 0.0) + fine_amount
+
+            outcome = {
+                "item_id": item_id,
+                "ok": True,
+                "message": f"Item '{item.ItemTitle}' checked in successfully. Awaiting reshelving.",
+                "patron_id": patron.PatronID,
+                "patron_name": f"{patron.PatronFN} {patron.PatronLN}",
+                "return_date": str(return_date)
+            }
+            if fine_amount > 0:
+                days_overdue = (return_date - checkout.DueDate).days
+                outcome["fine_applied"] = fine_amount
+                outcome["days_overdue"] = days_overdue
+                outcome["due_date"] = str(checkout.DueDate)
+                outcome["message"] += f" Fine of ${fine_amount:.2f} applied for {days_overdue} day(s) overdue."
+            outcomes[item_id] = outcome
+
+        if returns:
+            database.session.execute(insert(Return), returns)
+            enqueue_reshelve(closed, branch_id, return_date)
+
+            # waiting holds on these items now have their pickup window
+            database.session.execute(
+                update(Reservation)
+                .where(
+                    Reservation.ReservedItem.in_(list(closed)),
+                    Reservation.Active == True,
+                    Reservation.ExpiresAt.is_(None)
+                )
+                .values(ExpiresAt=return_date + timedelta(days=RESERVATION_PICKUP_DAYS))
+                .execution_options(synchronize_session=False)
+            )
+
+            # one fine update per patron with fines, for all of their items in the batch
+            # (loan counts are PatronStanding's, the Return inserts take care of them)
+            fined = [{"patron": patron_id, "fines": round(fines, 2)}
+                     for patron_id, fines in per_patron.items() if fines > 0]
+            if fined:
+                patron_table = Patron.__table__
+                database.session.execute(
+                    update(patron_table)
+                    .where(patron_table.c.PatronID == bindparam('patron'))
+                    .values(FeesOwed=func.coalesce(patron_table.c.FeesOwed, 0) + bindparam('fines')),
+                    fined
+                )
+
+        database.session.commit()
+
+    except Exception as e:
+        if is_sqlite_busy(e):
+            raise # retry_on_busy runs the batch again
+        database.session.rollback()
+        app.logger.error(f"Error during bulk checkin: {e}")
+        return jsonify({"ok": False, "error": f"A database error occurred: {e}"}), 500
+
+    results = [outcomes[item_id] for item_id in item_ids]
+    return jsonify({
+        "ok": True,
+        "branch_id": branch_id,
+        "return_date": str(return_date),
+        "checked_in": len(returns),
+        "failed": len(results) - len(returns),
+        "fines_applied": round(sum(per_patron.values()), 2),
+        "results": results
+    })
+
 # Checkout demo
 #---------------------------
 @app.route('/checkout', methods=['GET'])
@@ -906,6 +2763,7 @@ def checkout_form():
     return render_template('checkout.html')
 
 @app.route('/checkout', methods=['POST'])
+@retry_on_busy
 def checkout_basic() -> jsonify:
     payload = request.get_json(silent=True) or request.form
     patron_id = int(payload.get('patron_id', -1))
@@ -914,32 +2772,36 @@ def checkout_basic() -> jsonify:
     # BERKER: helps convert to list if it's a string
     if isinstance(item_ids, str):
         item_ids = [int(x.strip()) for x in item_ids.split(',') if x.strip().isdigit()]
+    else:
+        item_ids = [int(x) for x in item_ids if str(x).strip().isdigit()]
+    item_ids = list(dict.fromkeys(item_ids)) # same item scanned twice is one checkout
 
-    patron = Patron.query.get(patron_id)
+    # everything the eligibility checks need, in one primary key read
+    standing = PatronStanding.query.get(patron_id)
 
-    if patron is None:
+    if standing is None:
         return jsonify({"ok": False, "error": "Patron not found"})
 
     # Membership check
-    if membership_expired(patron):
+    if membership_expired(standing):
         return jsonify({
             "ok": False,
             "error": "RENEW MEMBERSHIP NOW!!",
-            "expired_on": str(patron.AccountExpDate)
+            "expired_on": str(standing.AccountExpDate)
         })
 
 
 # BERKER: Auto expire old reservations before checking out
     expire_old_reservations()
     # BERKER: checking if patron has fines
-    if patron.FeesOwed and patron.FeesOwed > 0:
+    if standing.FeesOwed > 0:
         return jsonify({
             "ok": False,
-            "error": f"Patron has fine balance of ${float(patron.FeesOwed):.2f}. Please clear fines before checkout."
+            "error": f"Patron has fine balance of ${float(standing.FeesOwed):.2f}. Please clear fines before checkout."
         })
 
     # BERKER: checks if basket exceeds item limit (patron items + basket items)
-    current_count = patron.ItemsCheckedOut or 0
+    current_count = standing.OpenLoans
     if current_count + len(item_ids) > MAX_ITEMS_PER_PATRON:
         return jsonify({
             "ok": False,
@@ -951,41 +2813,42 @@ def checkout_basic() -> jsonify:
         })
 
     # BERKER: validate all items before checking out any
+    # The whole basket is loaded up front (items, open loans, holds, item types) so the
+    # number of queries stays the same no matter how many items are in the basket.
     errors = []
     items_to_checkout = []
 
+    items_by_id = {
+        item.ItemID: item
+        for item in LibraryItem.query.filter(LibraryItem.ItemID.in_(item_ids))
+    }
+
+    # BERKER: items in the basket that already have an active checkout (to prevent duplicates)
+    checked_out_ids = {
+        item.ItemID for item in items_by_id.values() if item.ActiveTransactionID
+    }
+
+    active_res_by_item = {}
+    for res in Reservation.query.filter(
+        Reservation.ReservedItem.in_(item_ids),
+        Reservation.Active == True
+    ).order_by(Reservation.ReservationID):
+        active_res_by_item.setdefault(res.ReservedItem, res)
+
     for item_id in item_ids:
-        item = LibraryItem.query.get(item_id)
+        item = items_by_id.get(item_id)
 
         if item is None:
             errors.append(f"Item ID {item_id} not found")
             continue
 
-        # BERKER: Checks if specific item already has active checkout (to prevent duplicates)
-        active_checkout = (
-            Checkout.query
-            .outerjoin(Return, Return.TransactionID == Checkout.TransactionID)
-            .filter(
-                Checkout.ItemID == item_id,
-                Return.TransactionID.is_(None)
-            )
-            .first()
-        )
-
         # BERKER: If an active checkout exists, item is already checked out
-        if active_checkout:
+        if item_id in checked_out_ids:
             errors.append(f"Item '{item.ItemTitle}' (ID {item_id}) is already checked out")
             continue
 
         # --- RESERVATION-AWARE AVAILABILITY CHECK ---
-        active_res = (
-            Reservation.query.filter(
-                Reservation.ReservedItem == item_id,
-                Reservation.Active == True
-            )
-            .first()
-        )
-
+        active_res = active_res_by_item.get(item_id)
 
         if active_res:
             # Item is reserved by someone
@@ -1011,32 +2874,20 @@ def checkout_basic() -> jsonify:
 
     # All items are valid, proceed with checkout
     checked_out_list = []
+    checkout_rows = []
+    checkout_date = date.today()
+    rental_days = rental_days_by_type(item.ItemType for item in items_to_checkout)
 
     for item in items_to_checkout:
-        rental_days = rental_days_for(item)
-        checkout_date = date.today()
-        due_date = checkout_date + timedelta(days=rental_days)
+        due_date = checkout_date + timedelta(days=rental_days.get(item.ItemType, 0))
 
         # BERKER: checkout record with due date
-        new_checkout = Checkout(
-            PatronID=patron_id,
-            ItemID=item.ItemID,
-            CheckoutDate=checkout_date,
-            DueDate=due_date
-        )
-        database.session.add(new_checkout)
-
-        # --- CLOSE MATCHING RESERVATION FOR THIS PATRON/ITEM ---
-        active_res = Reservation.query.filter_by(
-            ReservedItem=item.ItemID,
-            ReservingPatron=patron_id,
-            Active=True
-        ).first()
-        if active_res:
-            active_res.Active = False
-
-        # BERKER / DBU: update item status
-        item.Status = 'checked out'
+        checkout_rows.append({
+            "PatronID": patron_id,
+            "ItemID": item.ItemID,
+            "CheckoutDate": checkout_date,
+            "DueDate": due_date
+        })
 
         # BERKER: Adds to response list
         checked_out_list.append({
@@ -1046,8 +2897,76 @@ def checkout_basic() -> jsonify:
             "DueDate": str(due_date)
         })
 
-    # BERKER: Update patron's item count (outside the loop)
-    patron.ItemsCheckedOut = current_count + len(items_to_checkout)
+    checkout_ids = [item.ItemID for item in items_to_checkout]
+    seen_status = {item.ItemID: item.Status for item in items_to_checkout}
+    if checkout_rows:
+        # Everything above was read without a lock, so another desk may have changed these rows since.
+        # Each write below only applies if the row is still as we saw it; if any of them misses,
+        # the whole basket is rolled back.
+
+        # one executemany for the basket, RETURNING gives each item its new loan id
+        new_loans = database.session.execute(
+            insert(Checkout).returning(Checkout.ItemID, Checkout.TransactionID),
+            checkout_rows
+        ).all()
+
+        # BERKER: patron's item count, re-checked against the limit. The Checkout trigger has
+        # counted the basket into PatronStanding and this transaction holds the write lock now,
+        # so no other desk can have added loans in between
+        open_loans = database.session.execute(
+            select(PatronStanding.OpenLoans).where(PatronStanding.PatronID == patron_id)
+        ).scalar()
+        if open_loans > MAX_ITEMS_PER_PATRON:
+            database.session.rollback()
+            return jsonify({
+                "ok": False,
+                "error": f"Patron's checkouts changed at another desk. Limit is {MAX_ITEMS_PER_PATRON}, please try again."
+            }), 409
+
+        # BERKER / DBU: update item status and point each item at its open loan -
+        # only if it still has no open loan and the status we validated
+        item_table = LibraryItem.__table__
+        claimed = database.session.execute(
+            update(item_table)
+            .where(
+                item_table.c.ItemID == bindparam('claim_item'),
+                item_table.c.Status == bindparam('seen_status'),
+                item_table.c.ActiveTransactionID.is_(None)
+            )
+            .values(Status='checked out', ActiveTransactionID=bindparam('claim_txn')),
+            [
+                {"claim_item": loan_item_id, "seen_status": seen_status[loan_item_id], "claim_txn": transaction_id}
+                for loan_item_id, transaction_id in new_loans
+            ]
+        ).rowcount
+        if claimed != len(new_loans):
+            database.session.rollback()
+            changed = [
+                f"'{title}' (ID {item_id})"
+                for item_id, title, status, loan in database.session.query(
+                    LibraryItem.ItemID, LibraryItem.ItemTitle, LibraryItem.Status, LibraryItem.ActiveTransactionID
+                ).filter(LibraryItem.ItemID.in_(checkout_ids))
+                if loan is not None or status != seen_status[item_id]
+            ]
+            return jsonify({
+                "ok": False,
+                "error": f"Item(s) {', '.join(changed) or 'in basket'} were just checked out or reserved at another desk."
+            }), 409
+
+        # a held copy can be picked up straight off the cart
+        dequeue_reshelve([item_id for item_id in checkout_ids if seen_status[item_id] == 'checked in'])
+
+        # --- CLOSE MATCHING RESERVATIONS FOR THIS PATRON/ITEMS ---
+        database.session.execute(
+            update(Reservation)
+            .where(
+                Reservation.ReservedItem.in_(checkout_ids),
+                Reservation.ReservingPatron == patron_id,
+                Reservation.Active == True
+            )
+            .values(Active=False)
+        )
+
 
     try:
         database.session.commit()
@@ -1058,6 +2977,8 @@ def checkout_basic() -> jsonify:
             "items_checked_out": checked_out_list
         })
     except Exception as e:
+        if is_sqlite_busy(e):
+            raise # retry_on_busy runs the checkout again
         database.session.rollback()
         app.logger.error(f"Error during checkout commit: {e}")
         return jsonify({
@@ -1066,52 +2987,100 @@ def checkout_basic() -> jsonify:
         }), 500
 
 
+#Items on the reshelve cart - see ReshelveQueue
+def awaiting_reshelve():
+    return and_(
+        LibraryItem.ItemID.in_(select(ReshelveQueue.ItemID)),
+        #DBU
+        LibraryItem.Status == 'checked in'
+    )
+
+def shelf_range(payload) -> tuple:
+    '''Reads shelf_from/shelf_to (inclusive ShelfCodes, either may be left open). Returns (from, to).'''
+    shelf_from = str(payload.get('shelf_from') or '').strip() or None
+    shelf_to = str(payload.get('shelf_to') or '').strip() or None
+    return shelf_from, shelf_to
+
+def shelf_range_filter(shelf_from: Optional[str], shelf_to: Optional[str]) -> list:
+    conditions = []
+    if shelf_from is not None:
+        conditions.append(LibraryItem.ShelfCode >= shelf_from)
+    if shelf_to is not None:
+        conditions.append(LibraryItem.ShelfCode <= shelf_to)
+    return conditions
+
 @app.route('/api/items-to-reshelve', methods=['GET'])
 def get_items_to_reshelve():
     '''
     Identifies and returns a list of all items that have been returned,
     but not yet marked as available (awaiting reshelving).
+    Legacy mode (no params): a plain list ordered by title.
+    Pick list mode: /api/items-to-reshelve?order=shelf&shelf_from=A01&shelf_to=C99&limit=50&cursor=token
+    returns {"ok", "shelves": [{"ShelfCode", "items"}], "next_cursor"} - one cart-sized page in
+    (ShelfCode, ItemID) order, grouped by shelf so it reads as a walk through the stacks.
     '''
+    paged = any(key in request.args for key in ('order', 'shelf_from', 'shelf_to', 'cursor', 'limit'))
     try:
-        # 1) Latest checkout per item
-        latest_checkout_sq = (
-            database.session.query(
-                Checkout.ItemID,
-                func.max(Checkout.TransactionID).label("LatestTxn")
+        if not paged:
+            items_awaiting_reshelve = (
+                database.session.query(LibraryItem)
+                .filter(awaiting_reshelve())
+                .order_by(LibraryItem.ItemTitle)
+                .all()
             )
-            .group_by(Checkout.ItemID)
-        ).subquery()
 
-        # 2) Items whose latest checkout HAS a Return and item is still unavailable
-        items_awaiting_reshelve = (
-            database.session.query(LibraryItem)
-            .join(latest_checkout_sq, latest_checkout_sq.c.ItemID == LibraryItem.ItemID)
-            .join(Checkout, Checkout.TransactionID == latest_checkout_sq.c.LatestTxn)
-            .outerjoin(Return, Return.TransactionID == Checkout.TransactionID)
-            .filter(
-
-                #DBU
-                LibraryItem.Status == 'checked in',
-                Return.TransactionID.isnot(None)   # only if LATEST checkout was returned
-            )
-            .order_by(LibraryItem.ItemTitle)
-            .all()
+            output_list = [
+                {
+                    "ItemID": item.ItemID,
+                    "ItemTitle": item.ItemTitle,
+                    "ShelfCode": item.ShelfCode
+                }
+                for item in items_awaiting_reshelve
+            ]
+            return jsonify(output_list)
+
+        # --- Pick list mode ---
+        order = request.args.get('order', 'shelf').strip()
+        if order != 'shelf':
+            return jsonify({"ok": False, "error": f"Invalid order '{order}'"}), 400
+        limit = page_size_from(request.args.get('limit'))
+        shelf_from, shelf_to = shelf_range(request.args)
+
+        query = (
+            database.session.query(LibraryItem.ItemID, LibraryItem.ItemTitle, LibraryItem.ShelfCode)
+            .filter(awaiting_reshelve(), *shelf_range_filter(shelf_from, shelf_to))
         )
+        cursor = request.args.get('cursor', '').strip()
+        if cursor:
+            last = decode_cursor(cursor, 2)
+            if last is None or not isinstance(last[1], int):
+                return jsonify({"ok": False, "error": "Invalid cursor"}), 400
+            query = query.filter(keyset_after(LibraryItem.ShelfCode, LibraryItem.ItemID, last[0], last[1]))
+
+        # fetch one extra row to know if there is another page
+        rows = query.order_by(LibraryItem.ShelfCode, LibraryItem.ItemID).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        shelves = []
+        for row in rows:
+            if not shelves or shelves[-1]["ShelfCode"] != row.ShelfCode:
+                shelves.append({"ShelfCode": row.ShelfCode, "items": []})
+            shelves[-1]["items"].append({"ItemID": row.ItemID, "ItemTitle": row.ItemTitle, "ShelfCode": row.ShelfCode})
 
-        output_list = [
-            {
-                "ItemID": item.ItemID,
-                "ItemTitle": item.ItemTitle,
-                "ShelfCode": item.ShelfCode
-            }
-            for item in items_awaiting_reshelve
-        ]
-        return jsonify(output_list)
+        return jsonify({
+            "ok": True,
+            "shelves": shelves,
+            "count": len(rows),
+            "next_cursor": encode_cursor(rows[-1].ShelfCode, rows[-1].ItemID) if has_more else None,
+            "limit": limit
+        })
 
     except Exception as e:
         return jsonify({"ok": False, "error": f"Database error: {str(e)}"}), 500
     
 @app.route('/api/reshelve', methods=['POST'])
+@retry_on_busy
 def reshelve_items():
     '''
     Handles the reshelveing of a single item, making 
@@ -1140,6 +3109,7 @@ def reshelve_items():
         #DBU
         item.Status = "available"
         item.DateReshelved = date.today()
+        dequeue_reshelve([item.ItemID])
         database.session.commit()
 
         return jsonify({
@@ -1148,9 +3118,83 @@ def reshelve_items():
         })
     
     except Exception as e:
+        if is_sqlite_busy(e):
+            raise # retry_on_busy runs the reshelve again
         database.session.rollback()
         return jsonify({"ok": False, "error": f"Database error: {str(e)}"}), 500
 
+MAX_BULK_RESHELVE = 1000
+
+@app.route('/api/reshelve/bulk', methods=['POST'])
+@retry_on_busy
+def reshelve_bulk():
+    '''
+    Reshelves a whole cart in one UPDATE, either by ItemID or by shelf range:
+        {"item_ids": [1, 2, 3]}
+        {"shelf_from": "A01", "shelf_to": "C99"}    # inclusive, either end may be left open
+    Only items awaiting reshelving are touched - anything else in the list is reported back
+    with the reason, in request order.
+    '''
+    payload = request.get_json(silent=True) or {}
+    item_ids = payload.get('item_ids')
+    shelf_from, shelf_to = shelf_range(payload)
+
+    if item_ids is not None:
+        if not isinstance(item_ids, list) or not item_ids or not all(str(x).strip().isdigit() for x in item_ids):
+            return jsonify({"ok": False, "error": "Invalid ItemIDs"}), 400
+        item_ids = list(dict.fromkeys(int(x) for x in item_ids))
+        if len(item_ids) > MAX_BULK_RESHELVE:
+            return jsonify({"ok": False, "error": f"At most {MAX_BULK_RESHELVE} items per batch"}), 400
+        target = [LibraryItem.ItemID.in_(item_ids)]
+    elif shelf_from is not None or shelf_to is not None:
+        target = shelf_range_filter(shelf_from, shelf_to)
+    else:
+        return jsonify({"ok": False, "error": "item_ids or shelf_from/shelf_to is required"}), 400
+
+    try:
+        # the Status check in the WHERE makes a second desk reshelving the same cart a no-op
+        reshelved = database.session.execute(
+            update(LibraryItem.__table__)
+            .where(awaiting_reshelve(), *target)
+            .values(Status='available')
+            .returning(LibraryItem.ItemID)
+        ).scalars().all()
+        dequeue_reshelve(reshelved)
+        database.session.commit()
+    except Exception as e:
+        if is_sqlite_busy(e):
+            raise # retry_on_busy runs the batch again
+        database.session.rollback()
+        return jsonify({"ok": False, "error": f"Database error: {str(e)}"}), 500
+
+    response = {"ok": True, "reshelved": len(reshelved)}
+    if item_ids is None:
+        response["item_ids"] = sorted(reshelved)
+        return jsonify(response)
+
+    # say why the rest were skipped - one lookup for just those items
+    done = set(reshelved)
+    skipped = [item_id for item_id in item_ids if item_id not in done]
+    status_of = dict(
+        database.session.query(LibraryItem.ItemID, LibraryItem.Status)
+        .filter(LibraryItem.ItemID.in_(skipped))
+        .all()
+    ) if skipped else {}
+    results = []
+    for item_id in item_ids:
+        if item_id in done:
+            results.append({"item_id": item_id, "ok": True})
+        elif item_id not in status_of:
+            results.append({"item_id": item_id, "ok": False, "error": f"Item with ID {item_id} not found"})
+        elif status_of[item_id] == 'available':
+            results.append({"item_id": item_id, "ok": False, "error": "Item already reshelved"})
+        else:
+            results.append({"item_id": item_id, "ok": False,
+                            "error": f"Item is '{status_of[item_id]}', not awaiting reshelving"})
+    response["failed"] = len(skipped)
+    response["results"] = results
+    return jsonify(response)
+
 @app.route('/reshelve', methods=['GET'])
 def reshelve_form():
     '''Serves the HTML page for reshelving items.'''
@@ -1159,6 +3203,34 @@ def reshelve_form():
 
 # Utility
 # ----------------------------
+@app.route('/api/export/<table>', methods=['GET'])
+def export_table(table: str):
+    '''
+    Streams a whole table as a download: /api/export/loans?format=csv|ndjson&gzip=1
+    Tables: patrons, items, loans (Checkout + Return, archived loans included).
+    '''
+    fmt = request.args.get('format', 'csv').strip().lower()
+    if table not in EXPORT_QUERIES:
+        return jsonify({"ok": False, "error": f"Unknown export '{table}'"}), 404
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"ok": False, "error": f"Invalid format '{fmt}'"}), 400
+    compress = request.args.get('gzip', '').strip().lower() in ('1', 'true', 'yes')
+
+    body = export_chunks(read_engine(), table, fmt)
+    filename = f"{table}-{date.today()}.{fmt}"
+    if compress:
+        body = gzip_chunks(body)
+        filename += '.gz'
+    response = Response(stream_with_context(body), mimetype='application/gzip' if compress else EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    '''Prometheus scrape endpoint - see Request Metrics'''
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/dbinfo', methods=['GET'])
 def dbinfo():
     return jsonify({"db_uri":app.config['SQLALCHEMY_DATABASE_URI']})
@@ -1176,11 +3248,9 @@ def View_patron_account(patron_id: int) -> jsonify:
         Checkout.ItemID, 
         LibraryItem.ItemTitle, 
         Checkout.DueDate #using duedate intead of calculating now
-    ).join(LibraryItem, Checkout.ItemID == LibraryItem.ItemID
+    ).join(LibraryItem, Checkout.TransactionID == LibraryItem.ActiveTransactionID  # Only active checkouts
     ).join(ItemType, LibraryItem.ItemType == ItemType.TypeID  # ✅ FIXED
     ).filter(Checkout.PatronID == patron_id
-    ).outerjoin(Return, Return.TransactionID == Checkout.TransactionID
-    ).filter(Return.TransactionID.is_(None)  # Only active checkouts
     ).all()
 
     patron_checkouts_list = [
@@ -1188,7 +3258,7 @@ def View_patron_account(patron_id: int) -> jsonify:
             "TransactionID": checkout.TransactionID,
             "ItemID": checkout.ItemID,
             "ItemTitle" : checkout.ItemTitle,
-            "Due Date" : calc_return_date(Checkout.CheckoutDate, ItemType.RentalLength)
+            "Due Date" : str(checkout.DueDate)
         }
         for checkout in patron_checkouts
     ]
@@ -1203,7 +3273,7 @@ def View_patron_account(patron_id: int) -> jsonify:
         "LastName": patron.PatronLN,
         "AccountExpDate": str(patron.AccountExpDate),
         "FeesOwed": float(patron.FeesOwed or 0),
-        "NumItemsCheckedOut": patron.ItemsCheckedOut or 0,
+        "NumItemsCheckedOut": open_loans_for(patron.PatronID),
         "ItemsCheckedOut": patron_checkouts_list
     }
     
@@ -1219,10 +3289,135 @@ def view_items_page():
     '''Serves the HTML page to view all available items.'''
     return render_template('view_items.html')
 
+@app.route('/search')
+def search_page():
+    '''Serves the HTML page to search the catalog.'''
+    return render_template('search_items.html')
+
+# Database setup
+# ----------------------------
+def init_db():
+    '''Creates missing tables and applies schema upgrades'''
+    database.create_all()
+    upgrade_schema()
+
+@app.cli.command('init-db')
+def init_db_command():
+    '''Creates missing tables and applies schema upgrades (run after deploying a new version).'''
+    started = time.perf_counter()
+    init_db()
+    click.echo(f"Database {db_path} is up to date ({time.perf_counter() - started:.2f}s)")
+
+@app.cli.command('rebuild-active-loans')
+def rebuild_active_loans_command():
+    '''Repairs LibraryItem.ActiveTransactionID from Checkout/Return history.'''
+    rebuild_active_loans()
+    database.session.commit()
+    click.echo("Active loan pointers rebuilt")
+
+@app.cli.command('rebuild-reshelve-queue')
+def rebuild_reshelve_queue_command():
+    '''Repairs ReshelveQueue from LibraryItem.Status and Return history.'''
+    rebuild_reshelve_queue()
+    database.session.commit()
+    count = database.session.execute(text("SELECT count(*) FROM ReshelveQueue")).scalar()
+    click.echo(f"Reshelve queue rebuilt: {count} item(s) awaiting reshelving")
+
+@app.cli.command('reconcile-patron-standing')
+def reconcile_patron_standing_command():
+    '''Rebuilds PatronStanding for every patron from loans, holds and fees.'''
+    started = time.perf_counter()
+    drifted = rebuild_patron_standing()
+    database.session.commit()
+    count = database.session.execute(text("SELECT count(*) FROM PatronStanding")).scalar()
+    click.echo(f"Patron standing rebuilt for {count} patron(s), {drifted} had drifted "
+               f"({time.perf_counter() - started:.2f}s)")
+
+@app.cli.command('accrue-fines')
+@click.option('--as-of', type=click.DateTime(formats=['%Y-%m-%d']), help='Day to accrue to (default today).')
+def accrue_fines_command(as_of):
+    '''Recomputes ProjectedFine for every patron with overdue loans.'''
+    started = time.perf_counter()
+    summary = accrue_fines(as_of.date() if as_of else None)
+    click.echo(f"{summary['overdue_loans']} overdue loans, {summary['patrons']} patrons, "
+               f"${summary['accrued_fines']:.2f} accrued as of {summary['as_of']} "
+               f"({time.perf_counter() - started:.2f}s)")
+
+@app.cli.command('archive-loans')
+@click.option('--older-than-days', type=int, default=None,
+              help='Archive loans returned more than this many days ago (default ARCHIVE_RETENTION_DAYS).')
+@click.option('--batch-size', type=int, default=2000, show_default=True, help='Loans moved per transaction.')
+@click.option('--pause', type=float, default=0.05, show_default=True, help='Seconds to sleep between batches.')
+def archive_loans_command(older_than_days, batch_size, pause):
+    '''Moves old closed loans from Checkout/Return into the archive tables.'''
+    days = older_than_days if older_than_days is not None else app.config['ARCHIVE_RETENTION_DAYS']
+    started = time.perf_counter()
+    summary = archive_loans(date.today() - timedelta(days=days), batch_size, pause)
+    click.echo(f"{summary['archived']} loans returned before {summary['older_than']} archived to "
+               f"{app.config['ARCHIVE_DB_PATH'] or 'the main database'} in {summary['batches']} batch(es) "
+               f"({time.perf_counter() - started:.2f}s)")
+
+@app.cli.command('export')
+@click.argument('table', type=click.Choice(sorted(EXPORT_QUERIES)))
+@click.option('--format', 'fmt', type=click.Choice(sorted(EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--output', '-o', default='-', help='File to write (default stdout).')
+@click.option('--gzip', 'compress', is_flag=True, help='gzip the output.')
+def export_command(table, fmt, output, compress):
+    '''Streams a table (patrons, items or loans) as CSV or NDJSON.'''
+    started = time.perf_counter()
+    chunks = export_chunks(read_engine(), table, fmt)
+    written = 0
+    with click.open_file(output, 'wb') as out:
+        for chunk in (gzip_chunks(chunks) if compress else (chunk.encode() for chunk in chunks)):
+            out.write(chunk)
+            written += len(chunk)
+    click.echo(f"{table}: {written} bytes written to {'stdout' if output == '-' else output} "
+               f"({time.perf_counter() - started:.2f}s)", err=True)
+
+@app.cli.command('import-csv')
+@click.argument('table', type=click.Choice(sorted(IMPORT_TABLES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', type=int, default=IMPORT_CHUNK_ROWS, show_default=True, help='Rows per transaction.')
+@click.option('--rejects', type=click.Path(dir_okay=False, writable=True),
+              help='Write rejected rows with the reason to this CSV file.')
+@click.option('--dry-run', is_flag=True, help='Validate only, insert nothing.')
+@click.option('--defer-indexes', is_flag=True,
+              help='Drop secondary indexes during the load and rebuild them after (for onboarding windows).')
+def import_csv_command(table, path, chunk_size, rejects, dry_run, defer_indexes):
+    '''Bulk loads items or patrons from a CSV file (columns as in flask export).'''
+    with open(path, newline='', encoding='utf-8-sig') as lines:
+        rejects_file = open(rejects, 'w', newline='', encoding='utf-8') if rejects else None
+        try:
+            summary = import_csv(table, lines, chunk_size, csv.writer(rejects_file) if rejects_file else None,
+                                 dry_run, defer_indexes)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        finally:
+            if rejects_file:
+                rejects_file.close()
+    rate = summary['read'] / summary['seconds'] if summary['seconds'] else summary['read']
+    click.echo(f"{table}: {summary['read']} rows read, {summary['imported']} "
+               f"{'valid (dry run)' if dry_run else 'imported'}, {summary['rejected']} rejected "
+               f"in {summary['seconds']:.2f}s ({rate:,.0f} rows/s)")
+    if summary['rejected'] and rejects:
+        click.echo(f"rejected rows written to {rejects}")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    '''Re-indexes every LibraryItem into the catalog search index.'''
+    if not catalog_search_enabled():
+        click.echo("FTS5 is not available in this SQLite build")
+        return
+    rebuild_catalog_search_index()
+    database.session.commit()
+    click.echo("Catalog search index rebuilt")
+
 # --- Main execution block ---
+# Importing app never touches the database - under flask run, a WSGI server or asgi.py,
+# run `flask init-db` once per deploy instead.
 if __name__ == '__main__':
 
     with app.app_context():
-        database.create_all()
+        init_db()
 
     app.run(debug=True, host='0.0.0.0', port=5001)
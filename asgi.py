@@ -0,0 +1,135 @@
+'''
+Async read server for kiosk and catalog traffic.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5002
+
+Answers the read-only endpoints self-service kiosks poll - GET /api/item/<id>,
+/api/search/items and /api/items - from an aiosqlite engine, so a client waiting on the
+network or the database costs a coroutine instead of a worker thread. The statements,
+parameter checks and JSON all come from app.py (item_lookup_statement,
+build_item_payloads, search_args, items_page_statement, ...) and responses are built by
+the Flask app's JSON provider, so both servers answer byte for byte the same.
+
+Everything else - writes included - stays on the Flask app, and so does the schema: run
+`flask init-db` before starting either server. Run both and send these
+paths to this server at the reverse proxy. Connections open the database read-only
+(mode=ro and PRAGMA query_only), so nothing here can write. Needs aiosqlite and an ASGI server (uvicorn).
+Compare the two with Testing/benchmark_async.py.
+'''
+import re
+from urllib.parse import parse_qsl
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.datastructures import MultiDict
+
+import app as bookmarked
+
+# opened like the app's read pool: mode=ro, the profile's PRAGMAs and query_only
+engine = create_async_engine(
+    bookmarked.READ_ONLY_URI.replace('sqlite://', 'sqlite+aiosqlite://', 1),
+    **bookmarked.app.config['SQLALCHEMY_ENGINE_OPTIONS'],
+)
+event.listen(engine.sync_engine, 'connect', bookmarked.apply_read_only_pragmas)
+
+
+async def item_types_for(conn, type_ids) -> dict:
+    '''{TypeID: ItemTypeInfo} from the app's reference cache, reloaded over conn when stale'''
+    if any(bookmarked.reference_cache_stale('item_types', type_id) for type_id in type_ids):
+        bookmarked.store_reference_data(*[(await conn.execute(query)).all() for query in bookmarked.REFERENCE_QUERIES])
+    item_types = bookmarked.reference_cache['item_types']
+    return {type_id: item_types.get(type_id) for type_id in type_ids}
+
+
+#### --- Routes --- ####
+# Each takes the connection, the query string and the path parameters and returns
+# (status, payload). A ValueError from the shared argument checks is a 400.
+
+async def get_item(conn, args, item_id: str) -> tuple:
+    item_id = int(item_id)
+    items = (await conn.execute(bookmarked.item_lookup_statement([item_id]))).all()
+    holds = []
+    if items:
+        statement, params = bookmarked.reservation_status_statement(item_ids=[item_id], active_only=True)
+        holds = [bookmarked.reservation_status_row(row) for row in (await conn.execute(statement, params)).mappings()]
+    item_types = await item_types_for(conn, {item.ItemType for item in items})
+    payload = bookmarked.build_item_payloads(items, holds, item_types).get(item_id)
+    if not payload:
+        return 404, {"ok": False, "error": "Item not found"}
+    return 200, payload
+
+async def search_items(conn, args) -> tuple:
+    search = bookmarked.search_args(args)
+    if 'CATALOG_FTS' not in bookmarked.app.config: # catalog_search_enabled() needs an app context
+        found = await conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                                   {"name": bookmarked.CATALOG_SEARCH_TABLE})
+        bookmarked.app.config['CATALOG_FTS'] = found.first() is not None
+    rows, has_more = [], False
+    planned = bookmarked.catalog_search_statement(search["search_text"], search["field"], search["type_ids"],
+                                                  search["offset"], search["limit"])
+    if planned is not None:
+        rows = (await conn.execute(*planned)).mappings().all()
+        rows, has_more = rows[:search["limit"]], len(rows) > search["limit"]
+    exact_id = bookmarked.search_exact_id(search)
+    exact_item = None
+    if exact_id is not None:
+        exact_item = (await conn.execute(bookmarked.search_item_statement(exact_id))).first()
+    return 200, bookmarked.search_payload(search, rows, has_more, exact_item)
+
+async def list_items(conn, args) -> tuple:
+    if not bookmarked.items_paged(args):
+        return 200, bookmarked.items_list_payload((await conn.execute(bookmarked.items_list_statement(args))).all())
+    statement, limit = bookmarked.items_page_statement(args)
+    return 200, bookmarked.items_page_payload((await conn.execute(statement)).all(), limit)
+
+ROUTES = [
+    (re.compile(r'/api/item/(\d+)'), get_item),
+    (re.compile(r'/api/search/items'), search_items),
+    (re.compile(r'/api/items'), list_items),
+]
+
+
+#### --- ASGI --- ####
+async def dispatch(scope) -> tuple:
+    for pattern, handler in ROUTES:
+        match = pattern.fullmatch(scope['path'])
+        if match:
+            break
+    else:
+        return 404, {"ok": False, "error": "Not found"}
+    if scope['method'] not in ('GET', 'HEAD'):
+        return 405, {"ok": False, "error": "Method not allowed"}
+
+    args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+    try:
+        async with engine.connect() as conn:
+            return await handler(conn, args, *match.groups())
+    except ValueError as e:
+        return 400, {"ok": False, "error": str(e)}
+    except Exception:
+        bookmarked.app.logger.exception(f"Error on {scope['method']} {scope['path']}")
+        return 500, {"ok": False, "error": "Internal server error"}
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    status, payload = await dispatch(scope)
+    response = bookmarked.app.json.response(payload) # same bytes and headers as jsonify
+    body = response.get_data()
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.items()]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})